@@ -21,14 +21,21 @@ import argparse
 from argparse import RawTextHelpFormatter
 from datetime import datetime
 from distutils.version import LooseVersion
+import collections
+import copy
 import importlib
 import inspect
+import multiprocessing
 import os
+import re
+import shutil
 import signal
 import sys
+import tempfile
 import time
 import json
 import pkg_resources
+from six.moves import queue
 
 import carla
 
@@ -113,6 +120,16 @@ class ScenarioRunner(object):
 
         self._start_wall_time = datetime.now()
 
+        # Statistics of the world reuse (--reuseWorld)
+        self._initial_weather = None
+        self._world_load_times = []
+        self._world_reuses = 0
+        self._world_reset_time = 0.0
+
+        # Execution order and status of the scenarios (see _schedule_by_town)
+        self._projected_map_loads = None
+        self._last_scenario_status = None
+
     def destroy(self):
         """
         Cleanup and delete actors, ScenarioManager and CARLA world
@@ -215,12 +232,11 @@ class ScenarioRunner(object):
                 ego_vehicle_missing = False
                 for ego_vehicle in ego_vehicles:
                     ego_vehicle_found = False
-                    carla_vehicles = CarlaDataProvider.get_world().get_actors().filter('vehicle.*')
-                    for carla_vehicle in carla_vehicles:
-                        if carla_vehicle.attributes['role_name'] == ego_vehicle.rolename:
-                            ego_vehicle_found = True
-                            self.ego_vehicles.append(carla_vehicle)
-                            break
+                    for carla_vehicle in CarlaDataProvider.get_world_actors_by_role_name(ego_vehicle.rolename,
+                                                                                         'vehicle.*'):
+                        ego_vehicle_found = True
+                        self.ego_vehicles.append(carla_vehicle)
+                        break
                     if not ego_vehicle_found:
                         ego_vehicle_missing = True
                         break
@@ -258,10 +274,12 @@ class ScenarioRunner(object):
 
         if not self.manager.analyze_scenario(self._args.output, filename, junit_filename, json_filename):
             print("All scenario tests were passed successfully!")
-        else:
-            print("Not all scenario tests were successful")
-            if not (self._args.output or filename or junit_filename):
-                print("Please run with --output for further information")
+            return True
+
+        print("Not all scenario tests were successful")
+        if not (self._args.output or filename or junit_filename):
+            print("Please run with --output for further information")
+        return False
 
     def _record_criteria(self, criteria, name):
         """
@@ -295,13 +313,75 @@ class ScenarioRunner(object):
         with open(file_name, 'w') as fp:
             json.dump(criteria_dict, fp, sort_keys=False, indent=4)
 
+    def _can_reuse_world(self, town):
+        """
+        Check if the world of the CARLA server can be reused for the given town,
+        instead of reloading it
+        """
+        if not self._args.reuseWorld or self._args.waitForEgo:
+            return False
+
+        map_name = os.path.basename(self.client.get_world().get_map().name)
+        return map_name == town
+
+    def _soft_reset_world(self):
+        """
+        Bring the current world back to a clean state, as an alternative to reloading it:
+        All vehicles, walkers, controllers and sensors are destroyed, and the traffic lights
+        and weather are reset. CarlaDataProvider is re-seeded as part of its cleanup.
+        """
+        start_time = time.time()
+
+        self.world = self.client.get_world()
+        actors = self.world.get_actors()
+        remaining_actors = [actor for type_filter in ('controller.*', 'sensor.*', 'vehicle.*', 'walker.*')
+                            for actor in actors.filter(type_filter)]
+        self.client.apply_batch_sync([carla.command.DestroyActor(actor) for actor in remaining_actors])
+
+        self.world.reset_all_traffic_lights()
+        self.world.freeze_all_traffic_lights(False)
+        if self._initial_weather is None:
+            self._initial_weather = self.world.get_weather()
+        self.world.set_weather(self._initial_weather)
+
+        if self.world.get_settings().synchronous_mode:
+            self.world.tick()
+        else:
+            self.world.wait_for_tick()
+
+        reset_time = time.time() - start_time
+        self._world_reuses += 1
+        self._world_reset_time += reset_time
+        print("Reusing the loaded world, soft reset done in {:.2f} s ({} actors destroyed)".format(
+            reset_time, len(remaining_actors)))
+
+    def _report_world_reuse(self):
+        """
+        Print the time saved by reusing the world instead of reloading it
+        """
+        if not self._world_reuses:
+            return
+
+        if self._world_load_times:
+            average_load_time = sum(self._world_load_times) / len(self._world_load_times)
+            saved_time = self._world_reuses * average_load_time - self._world_reset_time
+            print("World reused {} times instead of reloading it, saving about {:.1f} s "
+                  "(average load time: {:.1f} s)".format(self._world_reuses, saved_time, average_load_time))
+        else:
+            print("World reused {} times instead of reloading it".format(self._world_reuses))
+
     def _load_and_wait_for_world(self, town, ego_vehicles=None):
         """
         Load a new CARLA world and provide data to CarlaDataProvider
         """
 
-        if self._args.reloadWorld:
+        if self._args.reloadWorld and self._can_reuse_world(town):
+            self._soft_reset_world()
+        elif self._args.reloadWorld:
+            start_time = time.time()
             self.world = self.client.load_world(town)
+            self._world_load_times.append(time.time() - start_time)
+            self._initial_weather = self.world.get_weather()
         else:
             # if the world should not be reloaded, wait at least until all ego vehicles are ready
             ego_vehicle_found = False
@@ -351,6 +431,7 @@ class ScenarioRunner(object):
         Load and run the scenario given by config
         """
         result = False
+        self._last_scenario_status = "NOT RUN"
         if not self._load_and_wait_for_world(config.town, config.ego_vehicles):
             self._cleanup()
             return False
@@ -379,7 +460,8 @@ class ScenarioRunner(object):
             elif self._args.route:
                 scenario = RouteScenario(world=self.world,
                                          config=config,
-                                         debug_mode=self._args.debug)
+                                         debug_mode=self._args.debug,
+                                         lazy_distance=self._args.lazyScenarioDistance)
             else:
                 scenario_class = self._get_scenario_class_or_fail(config.type)
                 scenario = scenario_class(self.world,
@@ -405,7 +487,7 @@ class ScenarioRunner(object):
             self.manager.run_scenario()
 
             # Provide outputs if required
-            self._analyze_scenario(config)
+            self._last_scenario_status = "SUCCESS" if self._analyze_scenario(config) else "FAILURE"
 
             # Remove all actors, stop the recorder and save all criterias (if needed)
             scenario.remove_all_actors()
@@ -423,6 +505,58 @@ class ScenarioRunner(object):
         self._cleanup()
         return result
 
+    def _count_map_loads(self, towns, current_town):
+        """
+        Count the map loads needed to run scenarios in the given towns, in that order
+        """
+        if not self._args.reloadWorld:
+            return 0
+        if not self._args.reuseWorld:
+            return len(towns)
+
+        map_loads = 0
+        for town in towns:
+            if town != current_town:
+                map_loads += 1
+            current_town = town
+        return map_loads
+
+    def _schedule_by_town(self, configurations):
+        """
+        Get the execution order of the configurations, grouped by town to minimize the map loads.
+        The town currently loaded at the server goes first, followed by the others in order of
+        appearance. The order of the configurations of each town is kept.
+        """
+        try:
+            current_town = os.path.basename(self.client.get_world().get_map().name)
+        except RuntimeError:
+            current_town = None
+
+        town_order = [current_town]
+        for config in configurations:
+            if config.town not in town_order:
+                town_order.append(config.town)
+        execution_order = sorted(range(len(configurations)),
+                                 key=lambda index: town_order.index(configurations[index].town))
+
+        repetitions = self._args.repetitions
+        file_order_towns = [config.town for config in configurations for _ in range(repetitions)]
+        scheduled_towns = [configurations[index].town for index in execution_order for _ in range(repetitions)]
+        self._projected_map_loads = self._count_map_loads(scheduled_towns, current_town)
+        print("Projected map loads: {} (in file order: {})".format(
+            self._projected_map_loads, self._count_map_loads(file_order_towns, current_town)))
+
+        return execution_order
+
+    def _print_execution_report(self, report):
+        """
+        Print the status of all executed scenarios, in the original order of the configurations
+        """
+        print("Execution report:")
+        for _, repetition, name, status in sorted(report):
+            print("  {} (repetition {}): {}".format(name, repetition, status))
+        print("Map loads: {} (projected: {})".format(len(self._world_load_times), self._projected_map_loads))
+
     def _run_scenarios(self):
         """
         Run conventional scenarios (e.g. implemented using the Python API of ScenarioRunner)
@@ -437,12 +571,17 @@ class ScenarioRunner(object):
             print("Configuration for scenario {} cannot be found!".format(self._args.scenario))
             return result
 
-        # Execute each configuration
-        for config in scenario_configurations:
-            for _ in range(self._args.repetitions):
+        # Execute each configuration, grouped by town
+        report = []
+        for index in self._schedule_by_town(scenario_configurations):
+            config = scenario_configurations[index]
+            for repetition in range(self._args.repetitions):
                 result = self._load_and_run_scenario(config)
+                report.append((index, repetition, config.name, self._last_scenario_status))
 
             self._cleanup()
+
+        self._print_execution_report(report)
         return result
 
     def _run_route(self):
@@ -461,11 +600,16 @@ class ScenarioRunner(object):
         # retrieve routes
         route_configurations = RouteParser.parse_routes_file(routes, scenario_file, single_route)
 
-        for config in route_configurations:
-            for _ in range(self._args.repetitions):
+        report = []
+        for index in self._schedule_by_town(route_configurations):
+            config = route_configurations[index]
+            for repetition in range(self._args.repetitions):
                 result = self._load_and_run_scenario(config)
+                report.append((index, repetition, config.name, self._last_scenario_status))
 
                 self._cleanup()
+
+        self._print_execution_report(report)
         return result
 
     def _run_openscenario(self):
@@ -502,10 +646,300 @@ class ScenarioRunner(object):
         else:
             result = self._run_scenarios()
 
+        self._report_world_reuse()
         print("No more scenarios .... Exiting")
         return result
 
 
+def get_configurations(args):
+    """
+    Parse the route or scenario configurations given by the command line arguments
+    """
+    if args.route:
+        single_route = args.route[2] if len(args.route) > 2 else None
+        return RouteParser.parse_routes_file(args.route[0], args.route[1], single_route)
+
+    return ScenarioConfigurationParser.parse_scenario_configuration(args.scenario, args.configFile)
+
+
+def _farm_worker(args, endpoint, task_queue, result_queue):
+    """
+    Farm worker process. Runs the work items of its task queue against one CARLA server
+    until a None item is received. Every work item writes its results to its own directory
+    """
+    host, port, tm_port = endpoint
+    worker_args = copy.copy(args)
+    worker_args.host = host
+    worker_args.port = str(port)
+    worker_args.trafficManagerPort = str(tm_port)
+
+    configurations = get_configurations(args)
+    scenario_runner = None
+
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        index, config_index, output_dir = item
+
+        worker_args.outputDir = output_dir
+        result = False
+        try:
+            if scenario_runner is None:
+                scenario_runner = ScenarioRunner(worker_args)
+            # pylint: disable=protected-access
+            result = scenario_runner._load_and_run_scenario(configurations[config_index])
+            scenario_runner._cleanup()
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            # The connection might be broken, use a new ScenarioRunner for the next item
+            if scenario_runner is not None:
+                try:
+                    scenario_runner.destroy()
+                except Exception:  # pylint: disable=broad-except
+                    pass
+                scenario_runner = None
+
+        result_queue.put((endpoint, index, result))
+
+    if scenario_runner is not None:
+        scenario_runner._report_world_reuse()  # pylint: disable=protected-access
+        scenario_runner.destroy()
+
+
+class ScenarioFarm(object):
+
+    """
+    Runs the route or scenario configurations (and their repetitions) in parallel,
+    with one worker process per CARLA server. Work items are dispatched as workers
+    become free. Items that fail or whose worker crashes are retried, and the JSON
+    and JUnit results of all items are merged at the end.
+
+    Usage:
+    farm = ScenarioFarm(args)
+    farm.run()
+    """
+
+    poll_period = 1.0  # in seconds
+
+    def __init__(self, args):
+        """
+        Parse the endpoints and create the list of work items
+        """
+        self._args = args
+        self._endpoints = self.parse_endpoints(args.farm, int(args.trafficManagerPort))
+
+        self._configurations = get_configurations(args)
+        self._items = []
+        for config_index, config in enumerate(self._configurations):
+            for repetition in range(args.repetitions):
+                self._items.append({'config': config_index,
+                                    'name': config.name,
+                                    'repetition': repetition,
+                                    'attempts': 0,
+                                    'result': None,
+                                    'output_dir': None})
+
+    @staticmethod
+    def parse_endpoints(endpoint_list, traffic_manager_port):
+        """
+        Parse endpoints given as host:port or host:port/tm_port. Endpoints without
+        TrafficManager port get consecutive ports starting at traffic_manager_port
+        """
+        endpoints = []
+        for i, entry in enumerate(endpoint_list):
+            match = re.match(r'^(.+):(\d+)(?:/(\d+))?$', entry)
+            if not match:
+                raise ValueError("Invalid farm endpoint '{}', expected host:port[/tm_port]".format(entry))
+            tm_port = int(match.group(3)) if match.group(3) else traffic_manager_port + i
+            endpoints.append((match.group(1), int(match.group(2)), tm_port))
+        return endpoints
+
+    def _start_worker(self, endpoint, result_queue):
+        """
+        Start the worker process of an endpoint. Each worker has its own task queue,
+        so that the item it is running is known if it crashes
+        """
+        task_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_farm_worker,
+                                          args=(self._args, endpoint, task_queue, result_queue))
+        process.daemon = True
+        process.start()
+        return {'process': process, 'tasks': task_queue, 'item': None}
+
+    def _prepare_item(self, index, temp_dir):
+        """
+        Prepare a new attempt of a work item, with a clean output directory
+        """
+        item = self._items[index]
+        item['attempts'] += 1
+        item['output_dir'] = os.path.join(temp_dir, "{}_{}".format(index, item['attempts']))
+        os.makedirs(item['output_dir'])
+
+    def _handle_failure(self, index, pending):
+        """
+        Retry a failed work item, or mark it as failed once all retries are used.
+        Returns the amount of items finished by this call
+        """
+        item = self._items[index]
+        if item['attempts'] <= self._args.farmRetries:
+            print("Retrying {} (repetition {}), attempt {}".format(
+                item['name'], item['repetition'], item['attempts'] + 1))
+            pending.append(index)
+            return 0
+        item['result'] = False
+        return 1
+
+    def run(self):
+        """
+        Run all work items and merge their results
+        """
+        if not self._items:
+            print("No configurations found to be run")
+            return False
+
+        print("Running {} work items on {} CARLA servers".format(len(self._items), len(self._endpoints)))
+        start_time = time.time()
+
+        temp_dir = tempfile.mkdtemp(prefix='scenario_farm_')
+        pending = collections.deque(range(len(self._items)))
+        result_queue = multiprocessing.Queue()
+        workers = {}
+        for endpoint in self._endpoints:
+            workers[endpoint] = self._start_worker(endpoint, result_queue)
+        crashes = {endpoint: 0 for endpoint in self._endpoints}
+        remaining = len(self._items)
+
+        try:
+            while remaining > 0:
+                # Dispatch the pending items to the idle workers
+                for endpoint, worker in workers.items():
+                    if worker is not None and worker['item'] is None and pending:
+                        worker['item'] = pending.popleft()
+                        self._prepare_item(worker['item'], temp_dir)
+                        item = self._items[worker['item']]
+                        worker['tasks'].put((worker['item'], item['config'], item['output_dir']))
+
+                try:
+                    endpoint, index, result = result_queue.get(timeout=self.poll_period)
+                except queue.Empty:
+                    endpoint, index = None, None
+
+                # Results of workers already considered as crashed are ignored
+                if endpoint is not None and workers[endpoint] is not None and workers[endpoint]['item'] == index:
+                    workers[endpoint]['item'] = None
+                    crashes[endpoint] = 0
+                    if result:
+                        self._items[index]['result'] = True
+                        remaining -= 1
+                    else:
+                        remaining -= self._handle_failure(index, pending)
+
+                # Restart crashed workers, retrying the item they were running
+                for endpoint, worker in workers.items():
+                    if worker is None or worker['process'].is_alive():
+                        continue
+                    print("The worker of {}:{} crashed (exit code {})".format(
+                        endpoint[0], endpoint[1], worker['process'].exitcode))
+                    if worker['item'] is not None:
+                        remaining -= self._handle_failure(worker['item'], pending)
+                    crashes[endpoint] += 1
+                    if crashes[endpoint] > self._args.farmRetries:
+                        print("Giving up on {}:{}".format(endpoint[0], endpoint[1]))
+                        workers[endpoint] = None
+                    else:
+                        workers[endpoint] = self._start_worker(endpoint, result_queue)
+
+                if all(worker is None for worker in workers.values()):
+                    print("No CARLA servers left, {} work items could not be run".format(remaining))
+                    break
+
+            for worker in workers.values():
+                if worker is not None:
+                    worker['tasks'].put(None)
+                    worker['process'].join()
+        finally:
+            for worker in workers.values():
+                if worker is not None and worker['process'].is_alive():
+                    worker['process'].terminate()
+
+        self._merge_results(datetime.now().strftime('%Y-%m-%d-%H-%M-%S'))
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+        succeeded = sum(1 for item in self._items if item['result'])
+        print("Farm finished: {}/{} work items run in {:.1f} s".format(
+            succeeded, len(self._items), time.time() - start_time))
+
+        return succeeded == len(self._items)
+
+    def _get_result_files(self, item, extension):
+        """
+        Get the result files with the given extension written by the last attempt of a work item
+        """
+        if item['output_dir'] is None or not os.path.isdir(item['output_dir']):
+            return []
+        return sorted(glob.glob(os.path.join(item['output_dir'], "*" + extension)))
+
+    def _merge_results(self, current_time):
+        """
+        Merge the JSON and JUnit results of all work items, in the order of the configurations,
+        and move the text results to the output directory
+        """
+        output_dir = self._args.outputDir
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        if self._args.json:
+            scenarios = []
+            for item in self._items:
+                for json_file in self._get_result_files(item, ".json"):
+                    with open(json_file) as fp:
+                        scenario_result = json.load(fp)
+                    scenario_result['repetition'] = item['repetition']
+                    scenarios.append(scenario_result)
+            merged = {
+                "success": all(item['result'] for item in self._items) and all(
+                    scenario_result['success'] for scenario_result in scenarios),
+                "scenarios": scenarios
+            }
+            with open(os.path.join(output_dir, "ScenarioFarm" + current_time + ".json"), "w") as fp:
+                json.dump(merged, fp, indent=4)
+
+        if self._args.junit:
+            # The suites are merged textually, as the failure messages are not escaped XML
+            test_count = 0
+            failure_count = 0
+            system_time = 0.0
+            test_suites = []
+            for item in self._items:
+                for junit_file in self._get_result_files(item, ".xml"):
+                    with open(junit_file) as fp:
+                        content = fp.read()
+                    header = re.search(r'<testsuites tests="(\d+)" failures="(\d+)".*time="\s*([\d.]+)"', content)
+                    if header:
+                        test_count += int(header.group(1))
+                        failure_count += int(header.group(2))
+                        system_time += float(header.group(3))
+                    start = content.find("  <testsuite ")
+                    end = content.rfind("</testsuites>")
+                    if start >= 0 and end >= 0:
+                        test_suites.append(content[start:end])
+            with open(os.path.join(output_dir, "ScenarioFarm" + current_time + ".xml"), "w") as junit_file:
+                junit_file.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+                junit_file.write("<testsuites tests=\"%d\" failures=\"%d\" disabled=\"0\" "
+                                 "errors=\"0\" timestamp=\"%s\" time=\"%5.2f\" "
+                                 "name=\"Simulation\" package=\"Scenarios\">\n" %
+                                 (test_count, failure_count, current_time, system_time))
+                for test_suite in test_suites:
+                    junit_file.write(test_suite)
+                junit_file.write("</testsuites>\n")
+
+        if self._args.file:
+            for item in self._items:
+                for text_file in self._get_result_files(item, ".txt"):
+                    shutil.move(text_file, os.path.join(output_dir, os.path.basename(text_file)))
+
+
 def main():
     """
     main function
@@ -541,6 +975,8 @@ def main():
     parser.add_argument(
         '--agent', help="Agent used to execute the scenario. Currently only compatible with route-based scenarios.")
     parser.add_argument('--agentConfig', type=str, help="Path to Agent's configuration file", default="")
+    parser.add_argument('--lazyScenarioDistance', type=float, default=None, metavar='METERS',
+                        help='Build the scenarios of a route only once the ego vehicle is within this distance along the route of their trigger point, removing them once they end (default: build all of them at start)')
 
     parser.add_argument('--output', action="store_true", help='Provide results on stdout')
     parser.add_argument('--file', action="store_true", help='Write results into a txt file')
@@ -554,11 +990,17 @@ def main():
     parser.add_argument('--debug', action="store_true", help='Run with debug output')
     parser.add_argument('--reloadWorld', action="store_true",
                         help='Reload the CARLA world before starting a scenario (default=True)')
+    parser.add_argument('--reuseWorld', action="store_true",
+                        help='Instead of reloading the CARLA world, soft reset it if it already uses the required map')
     parser.add_argument('--record', type=str, default='',
                         help='Path were the files will be saved, relative to SCENARIO_RUNNER_ROOT.\nActivates the CARLA recording feature and saves to file all the criteria information.')
     parser.add_argument('--randomize', action="store_true", help='Scenario parameters are randomized')
     parser.add_argument('--repetitions', default=1, type=int, help='Number of scenario executions')
     parser.add_argument('--waitForEgo', action="store_true", help='Connect the scenario to an existing ego vehicle')
+    parser.add_argument('--farm', nargs='+', metavar='HOST:PORT[/TM_PORT]',
+                        help='Run the routes or scenarios in parallel, one worker per CARLA server.\nServers without TrafficManager port use consecutive ports from --trafficManagerPort')
+    parser.add_argument('--farmRetries', default=2, type=int,
+                        help='Number of retries of work items that failed or crashed in farm mode (default: 2)')
 
     arguments = parser.parse_args()
     # pylint: enable=line-too-long
@@ -586,12 +1028,20 @@ def main():
     if arguments.openscenarioparams and not arguments.openscenario:
         print("WARN: Ignoring --openscenarioparams when --openscenario is not specified")
 
+    if arguments.farm and (arguments.openscenario or arguments.waitForEgo):
+        print("The farm mode can only be used with routes and scenarios\n\n")
+        parser.print_help(sys.stdout)
+        return 1
+
     if arguments.route:
         arguments.reloadWorld = True
 
     if arguments.agent:
         arguments.sync = True
 
+    if arguments.farm:
+        return not ScenarioFarm(arguments).run()
+
     scenario_runner = None
     result = True
     try:
@@ -70,13 +70,9 @@ class NpcAgent(AutonomousAgent):
         control.hand_brake = False
 
         if not self._agent:
-            hero_actor = None
-            for actor in CarlaDataProvider.get_world().get_actors():
-                if 'role_name' in actor.attributes and actor.attributes['role_name'] == 'hero':
-                    hero_actor = actor
-                    break
-            if hero_actor:
-                self._agent = BasicAgent(hero_actor)
+            hero_actors = CarlaDataProvider.get_world_actors_by_role_name('hero')
+            if hero_actors:
+                self._agent = BasicAgent(hero_actors[0])
 
             return control
 
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a fixed-size history of the states of an actor, from which
+derived kinematics (acceleration, jerk, yaw rate, travelled distance) are computed.
+It is filled by the CarlaDataProvider once per tick
+"""
+
+import numpy as np
+
+
+class ActorHistory(object):
+
+    """
+    Preallocated NumPy ring buffer with the last states of an actor.
+    All accessors are O(1), independent of the size of the history.
+
+    Args:
+        size (int): Amount of states kept (K)
+
+    Attributes:
+        size (int): Amount of states kept
+        _times (np.ndarray): Game time of each state [s], shape (K,)
+        _positions (np.ndarray): Locations [m], shape (K, 3)
+        _velocities (np.ndarray): Velocity vectors [m/s], shape (K, 3)
+        _yaws (np.ndarray): Yaw angles [deg], shape (K,)
+        _distances (np.ndarray): Distance travelled since the first state [m], shape (K,)
+        _count (int): Amount of states pushed since the creation
+    """
+
+    def __init__(self, size=64):
+        """
+        Create an empty history
+        """
+        if size < 3:
+            raise ValueError("The history needs to keep at least three states")
+        self.size = size
+        self._times = np.zeros(size)
+        self._positions = np.zeros((size, 3))
+        self._velocities = np.zeros((size, 3))
+        self._yaws = np.zeros(size)
+        self._distances = np.zeros(size)
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.size)
+
+    def _index(self, age):
+        """
+        returns the index of the state pushed age ticks ago (0 being the latest one)
+        """
+        return (self._count - 1 - age) % self.size
+
+    def push(self, time, position, velocity, yaw):
+        """
+        Add a new state, replacing the oldest one if the history is full
+        """
+        index = self._count % self.size
+        self._times[index] = time
+        self._positions[index] = position
+        self._velocities[index] = velocity
+        self._yaws[index] = yaw
+        if self._count > 0:
+            previous = self._index(0)
+            step = np.sqrt(np.sum((self._positions[index] - self._positions[previous]) ** 2))
+            self._distances[index] = self._distances[previous] + step
+        else:
+            self._distances[index] = 0.0
+        self._count += 1
+
+    def get_time(self, age=0):
+        """
+        returns the game time of the state pushed age ticks ago, None if there is none
+        """
+        if age >= len(self):
+            return None
+        return self._times[self._index(age)]
+
+    def get_position(self, age=0):
+        """
+        returns the location (x, y, z) of the state pushed age ticks ago, None if there is none
+        """
+        if age >= len(self):
+            return None
+        return self._positions[self._index(age)].copy()
+
+    def _get_acceleration(self, age):
+        """
+        returns the acceleration between the states pushed age and age + 1 ticks ago
+        """
+        newer = self._index(age)
+        older = self._index(age + 1)
+        delta_time = self._times[newer] - self._times[older]
+        if delta_time <= 0.0:
+            return np.zeros(3)
+        return (self._velocities[newer] - self._velocities[older]) / delta_time
+
+    def get_acceleration(self):
+        """
+        returns the acceleration vector [m/s^2] between the last two states,
+        None if there are less than two
+        """
+        if len(self) < 2:
+            return None
+        return self._get_acceleration(0)
+
+    def get_jerk(self):
+        """
+        returns the jerk vector [m/s^3] over the last three states, None if there are less than three
+        """
+        if len(self) < 3:
+            return None
+        delta_time = self._times[self._index(0)] - self._times[self._index(1)]
+        if delta_time <= 0.0:
+            return np.zeros(3)
+        return (self._get_acceleration(0) - self._get_acceleration(1)) / delta_time
+
+    def get_yaw_rate(self):
+        """
+        returns the yaw rate [deg/s] between the last two states, None if there are less than two
+        """
+        if len(self) < 2:
+            return None
+        newer = self._index(0)
+        older = self._index(1)
+        delta_time = self._times[newer] - self._times[older]
+        if delta_time <= 0.0:
+            return 0.0
+        delta_yaw = (self._yaws[newer] - self._yaws[older] + 180.0) % 360.0 - 180.0
+        return delta_yaw / delta_time
+
+    def get_distance(self, ticks=None):
+        """
+        returns the distance [m] travelled during the last ticks (limited by the size of the history),
+        or since the first state if ticks is None
+        """
+        if not len(self):
+            return 0.0
+        latest = self._distances[self._index(0)]
+        if ticks is None:
+            return latest
+        ticks = min(ticks, len(self) - 1)
+        return latest - self._distances[self._index(ticks)]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a structure-of-arrays buffer holding the state of all
+actors of the simulation, on top of which vectorized spatial queries are done.
+It is filled by the CarlaDataProvider once per tick
+"""
+
+import numpy as np
+
+
+class ActorStateBuffer(object):
+
+    """
+    Contiguous NumPy arrays with the state of all tracked actors.
+    Row i of every array belongs to the actor with id ids[i].
+
+    Attributes:
+        frame (int): Frame of the data (-1 if never filled)
+        ids (np.ndarray): Actor ids, shape (N,)
+        type_ids (np.ndarray): Actor type ids (e.g. 'vehicle.tesla.model3'), shape (N,)
+        positions (np.ndarray): Locations [m], shape (N, 3)
+        yaws (np.ndarray): Yaw angles [deg], shape (N,)
+        velocities (np.ndarray): Velocity vectors [m/s], shape (N, 3)
+        extents (np.ndarray): Bounding box extents [m], shape (N, 3). Zero for actors without bounding box
+    """
+
+    def __init__(self):
+        """
+        Create an empty buffer
+        """
+        self.frame = -1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.type_ids = np.zeros(0, dtype=object)
+        self.positions = np.zeros((0, 3))
+        self.yaws = np.zeros(0)
+        self.velocities = np.zeros((0, 3))
+        self.extents = np.zeros((0, 3))
+        self._rows = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def clear(self):
+        """
+        Remove all actors from the buffer
+        """
+        self.__init__()
+
+    def update(self, frame, ids, type_ids, positions, yaws, velocities, extents):
+        """
+        Replace the content of the buffer with the given per-actor sequences
+        """
+        self.frame = frame
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.type_ids = np.asarray(type_ids, dtype=object)
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.yaws = np.asarray(yaws, dtype=np.float64)
+        self.velocities = np.asarray(velocities, dtype=np.float64).reshape(-1, 3)
+        self.extents = np.asarray(extents, dtype=np.float64).reshape(-1, 3)
+        self._rows = dict(zip(ids, range(len(ids))))
+
+    def get_row(self, actor_id):
+        """
+        returns the row of the given actor id, None if the actor is not part of the buffer
+        """
+        return self._rows.get(actor_id)
+
+    def get_positions(self, actor_ids):
+        """
+        returns the positions of the given actor ids, shape (len(actor_ids), 3).
+        Actors that are not part of the buffer get NaN coordinates
+        """
+        positions = np.full((len(actor_ids), 3), np.nan)
+        for i, actor_id in enumerate(actor_ids):
+            row = self._rows.get(actor_id)
+            if row is not None:
+                positions[i] = self.positions[row]
+        return positions
+
+    def pairwise_distances(self, actor_ids_a, actor_ids_b):
+        """
+        returns the matrix of distances between the actors of both sets, shape (len(a), len(b)).
+        Distances to actors that are not part of the buffer are NaN
+        """
+        positions_a = self.get_positions(actor_ids_a)
+        positions_b = self.get_positions(actor_ids_b)
+        diff = positions_a[:, np.newaxis, :] - positions_b[np.newaxis, :, :]
+        return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
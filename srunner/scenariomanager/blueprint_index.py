@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides an index over the CARLA blueprint library, built once per world,
+so that resolving the blueprints of the actors to be spawned needs no repeated filtering
+"""
+
+import fnmatch
+
+# Default blueprint of each actor category, used when the requested model is not available.
+# An empty blueprint means any vehicle
+ACTOR_BLUEPRINT_CATEGORIES = {
+    'car': 'vehicle.tesla.model3',
+    'van': 'vehicle.volkswagen.t2',
+    'truck': 'vehicle.carlamotors.carlacola',
+    'trailer': '',
+    'semitrailer': '',
+    'bus': 'vehicle.volkswagen.t2',
+    'motorbike': 'vehicle.kawasaki.ninja',
+    'bicycle': 'vehicle.diamondback.century',
+    'train': '',
+    'tram': '',
+    'pedestrian': 'walker.pedestrian.0001',
+}
+
+
+class BlueprintIndex(object):
+
+    """
+    Index over a carla.BlueprintLibrary, with the ids, tags, attribute defaults and recommended colors
+    of all blueprints. The results of the wildcard filters are memoized.
+
+    Args:
+        blueprint_library (carla.BlueprintLibrary): The blueprint library of the world
+
+    Attributes:
+        ids (tuple): Ids of all blueprints, in the order of the library
+        tags (dict): Tags of each blueprint id
+        attributes (dict): Default value of each attribute of each blueprint id, as strings
+        colors (dict): Recommended colors of each blueprint id, empty if it has no color attribute
+        categories (dict): Blueprint filter to be used for each actor category
+    """
+
+    def __init__(self, blueprint_library):
+        """
+        Index the blueprint library
+        """
+        self._library = blueprint_library
+        self._filters = dict()
+
+        ids = []
+        self.tags = dict()
+        self.attributes = dict()
+        self.colors = dict()
+        for blueprint in blueprint_library:
+            ids.append(blueprint.id)
+            self.tags[blueprint.id] = tuple(blueprint.tags)
+            self.attributes[blueprint.id] = dict((attribute.id, attribute.as_str()) for attribute in blueprint)
+            colors = ()
+            if blueprint.has_attribute('color'):
+                colors = tuple(blueprint.get_attribute('color').recommended_values)
+            self.colors[blueprint.id] = colors
+        self.ids = tuple(ids)
+
+        self.categories = dict()
+        for category, model in ACTOR_BLUEPRINT_CATEGORIES.items():
+            self.categories[category] = model if model in self.tags else 'vehicle.*'
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filter(self, pattern):
+        """
+        returns the ids of the blueprints whose id or one of its tags match the wildcard pattern,
+        as carla.BlueprintLibrary.filter does
+        """
+        if pattern not in self._filters:
+            self._filters[pattern] = tuple(
+                blueprint_id for blueprint_id in self.ids
+                if fnmatch.fnmatchcase(blueprint_id, pattern) or
+                any(fnmatch.fnmatchcase(tag, pattern) for tag in self.tags[blueprint_id]))
+        return self._filters[pattern]
+
+    def matches(self, blueprint_id, pattern):
+        """
+        Check if the blueprint (or actor type) id is part of the given wildcard filter
+        """
+        return blueprint_id in self._get_filter_set(pattern)
+
+    def _get_filter_set(self, pattern):
+        """
+        returns the memoized filter results as a set
+        """
+        key = ('set', pattern)
+        if key not in self._filters:
+            self._filters[key] = frozenset(self.filter(pattern))
+        return self._filters[key]
+
+    def has_attribute(self, blueprint_id, attribute):
+        """
+        Check if the blueprint has the given attribute
+        """
+        return attribute in self.attributes[blueprint_id]
+
+    def get_blueprint(self, blueprint_id):
+        """
+        returns a new copy of the blueprint, which can be modified without affecting the library
+        """
+        return self._library.find(blueprint_id)
@@ -12,13 +12,27 @@ local buffers to avoid blocking calls to CARLA
 
 from __future__ import print_function
 
+from collections import OrderedDict
+from contextlib import contextmanager
+import fnmatch
 import math
 import re
+import numpy as np
 import numpy.random as random
 from six import iteritems
 
 import carla
 
+from srunner.scenariomanager.actor_history import ActorHistory
+from srunner.scenariomanager.actor_state_buffer import ActorStateBuffer
+from srunner.scenariomanager.blueprint_index import ACTOR_BLUEPRINT_CATEGORIES, BlueprintIndex
+from srunner.scenariomanager.compiled_route import RouteProgressTracker, clear_compiled_routes, compile_route
+from srunner.scenariomanager.map_cache import get_map_cache_path, load_cached_array, save_cached_array
+from srunner.scenariomanager.spatial_index import GridIndex
+from srunner.scenariomanager.spawn_allocator import SpawnPointAllocator
+from srunner.scenariomanager.timer import GameTime
+from srunner.scenariomanager.traffic_sign_geometry import build_stop_sign_index, build_traffic_light_index
+
 
 def calculate_velocity(actor):
     """
@@ -29,6 +43,42 @@ def calculate_velocity(actor):
     return math.sqrt(velocity_squared)
 
 
+class ActorState(object):
+
+    """
+    Buffered state of a single registered actor, as stored by the CarlaDataProvider
+
+    Attributes:
+        actor (carla.Actor): The registered actor
+        velocity (float): Absolute velocity [m/s]
+        velocity_vector (carla.Vector3D): Velocity of the actor [m/s]
+        location (carla.Location): Location of the actor
+        transform (carla.Transform): Transform of the actor
+        acceleration (carla.Vector3D): Acceleration of the actor [m/s^2]
+        angular_velocity (carla.Vector3D): Angular velocity of the actor [deg/s]
+        control (carla.VehicleControl or carla.WalkerControl): Last control applied to the actor
+        bounding_box (carla.BoundingBox): Bounding box of the actor
+        history (ActorHistory): Last states of the actor, if subscribed to 'history'
+        updated (dict): Tick of the CarlaDataProvider at which each attribute was last updated
+    """
+
+    __slots__ = ('actor', 'velocity', 'velocity_vector', 'location', 'transform', 'acceleration', 'angular_velocity',
+                 'control', 'bounding_box', 'history', 'updated')
+
+    def __init__(self, actor):
+        self.actor = actor
+        self.velocity = 0.0
+        self.velocity_vector = None
+        self.location = None
+        self.transform = None
+        self.acceleration = None
+        self.angular_velocity = None
+        self.control = None
+        self.bounding_box = None
+        self.history = None
+        self.updated = dict()
+
+
 class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
 
     """
@@ -39,53 +89,118 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
     - Absolute velocity
     - Location
     - Transform
-
-    Potential additions:
     - Acceleration
+    - Angular velocity
+    - Control
+    - Bounding box
+
+    The data is stored in a single table indexed by the actor id, so that all
+    lookups are O(1) independent of the amount of registered actors.
 
-    In addition it provides access to the map and the transform of all traffic lights
+    Atomics and criteria subscribe to the attributes they need of each actor (subscribe),
+    which are updated on every tick. All other data is only fetched once it is requested,
+    at most once per tick.
+
+    Actors subscribed to 'history' additionally keep their last HISTORY_SIZE states
+    in an ActorHistory, from which acceleration, jerk, yaw rate and travelled distance
+    are derived without further calls to the simulator.
+
+    Additionally, the state of all actors of the world is kept in an ActorStateBuffer,
+    used for vectorized spatial queries. A grid spatial index over it answers
+    neighbour queries (query_radius, nearest) without checking every actor.
+
+    In addition it provides access to the map and the transform of all traffic lights.
+    The traffic light in front of each lane is precomputed once per town (and cached on disk),
+    so that get_next_traffic_light is a table lookup. Map projections (get_waypoint) are cached
+    per quantized location, so that all criteria of an actor share them
+
+    Between begin_deferred_spawn and end_deferred_spawn (or inside deferred_spawn), spawning
+    actors does not tick the world. The world is ticked once at the end of the outermost deferral,
+    unless it is ended without tick (e.g. while the scenario tree is being ticked)
     """
 
-    _actor_velocity_map = dict()
-    _actor_location_map = dict()
-    _actor_transform_map = dict()
+    # is_alive, get_velocity (twice), get_location and get_transform
+    RPCS_PER_ACTOR_UPDATE = 5
+
+    # Attributes that can be subscribed to, and those of them that are part of the world snapshot
+    SUBSCRIBABLE_ATTRIBUTES = ('transform', 'velocity', 'acceleration', 'angular_velocity', 'control', 'bounding_box',
+                               'history')
+    SNAPSHOT_ATTRIBUTES = ('transform', 'velocity', 'acceleration', 'angular_velocity')
+
+    # Amount of states kept for the actors subscribed to 'history'
+    HISTORY_SIZE = 64
+
+    # Lane (road id, section id, lane id) -> distance offset and location of the stop line in front of it
+    LANE_STOP_LINE_DTYPE = np.dtype([('lane', np.int32, 3), ('offset', np.float64), ('stop', np.float64, 3)])
+    # Step [m] and maximum amount of steps when following a lane until the next intersection
+    LANE_STEP = 2.0
+    LANE_MAX_STEPS = 5000
+
+    # Resolution [m] of the locations of the cached map projections, and amount of them kept across ticks
+    PROJECTION_RESOLUTION = 0.05
+    PROJECTION_CACHE_SIZE = 4096
+
+    _actor_state_map = dict()
+    _subscriptions = dict()
+    _tick = 0
+    _rpcs_saved = 0
+    _rpcs_saved_total = 0
+    _actor_state_buffer = ActorStateBuffer()
+    _world_actor_map = dict()
+    _actor_static_map = dict()
+    _spatial_index = GridIndex()
+    _registry_frame = None
+    _registry_actors = []
+    _registry_id_map = dict()
+    _registry_type_map = dict()
+    _registry_role_name_map = dict()
+    _last_snapshot = None
     _traffic_light_map = dict()
+    _lane_traffic_light_map = dict()
+    _traffic_light_index = None
+    _stop_sign_index = None
+    _tick_projections = dict()
+    _projections = OrderedDict()
+    _projection_stats = {'tick_hits': 0, 'hits': 0, 'misses': 0}
+    _deferred_spawn_depth = 0
+    _deferred_tick = False
+    _spawn_transform_ids = set()
     _carla_actor_pool = dict()
     _client = None
     _world = None
     _map = None
     _sync_flag = False
     _spawn_points = None
-    _spawn_index = 0
+    _spawn_allocator = None
     _blueprint_library = None
+    _blueprint_index = None
     _ego_vehicle_route = None
+    _route_progress_trackers = dict()
     _traffic_manager_port = 8000
     _random_seed = 2000
     _rng = random.RandomState(_random_seed)
 
     @staticmethod
-    def register_actor(actor):
+    def register_actor(actor, transform=None):
         """
         Add new actor to dictionaries
         If actor already exists, throw an exception
-        """
-        if actor in CarlaDataProvider._actor_velocity_map:
-            raise KeyError(
-                "Vehicle '{}' already registered. Cannot register twice!".format(actor.id))
-        else:
-            CarlaDataProvider._actor_velocity_map[actor] = 0.0
 
-        if actor in CarlaDataProvider._actor_location_map:
+        The transform an actor was just spawned at can be given. CARLA only knows the transform of
+        new actors after the next world tick, so until then it is used as their location and transform
+        """
+        if actor.id in CarlaDataProvider._actor_state_map:
             raise KeyError(
                 "Vehicle '{}' already registered. Cannot register twice!".format(actor.id))
-        else:
-            CarlaDataProvider._actor_location_map[actor] = None
 
-        if actor in CarlaDataProvider._actor_transform_map:
-            raise KeyError(
-                "Vehicle '{}' already registered. Cannot register twice!".format(actor.id))
-        else:
-            CarlaDataProvider._actor_transform_map[actor] = None
+        state = ActorState(actor)
+        if transform is not None:
+            state.location = carla.Location(transform.location)
+            state.transform = carla.Transform(state.location, transform.rotation)
+            state.updated['transform'] = CarlaDataProvider._tick
+            CarlaDataProvider._spawn_transform_ids.add(actor.id)
+        CarlaDataProvider._actor_state_map[actor.id] = state
+        CarlaDataProvider._registry_frame = None
 
     @staticmethod
     def register_actors(actors):
@@ -96,34 +211,436 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
             CarlaDataProvider.register_actor(actor)
 
     @staticmethod
-    def on_carla_tick():
+    def unregister_actor(actor_id):
         """
-        Callback from CARLA
+        Remove the state, subscriptions and route progress of a destroyed actor.
+        Unknown actor ids are ignored
         """
-        for actor in CarlaDataProvider._actor_velocity_map:
-            if actor is not None and actor.is_alive:
-                CarlaDataProvider._actor_velocity_map[actor] = calculate_velocity(actor)
+        CarlaDataProvider._actor_state_map.pop(actor_id, None)
+        CarlaDataProvider._subscriptions.pop(actor_id, None)
+        for key in [key for key in CarlaDataProvider._route_progress_trackers if key[0] == actor_id]:
+            CarlaDataProvider._route_progress_trackers.pop(key)
 
-        for actor in CarlaDataProvider._actor_location_map:
-            if actor is not None and actor.is_alive:
-                CarlaDataProvider._actor_location_map[actor] = actor.get_location()
+    @staticmethod
+    def subscribe(actor, attributes):
+        """
+        Declare that the given attributes (see SUBSCRIBABLE_ATTRIBUTES) of the actor are needed
+        on every tick. Subscriptions are kept until the next cleanup.
+        Attributes without subscription are fetched on demand, once per tick.
+        """
+        invalid_attributes = set(attributes) - set(CarlaDataProvider.SUBSCRIBABLE_ATTRIBUTES)
+        if invalid_attributes:
+            raise ValueError("Unknown actor attributes: {}".format(", ".join(sorted(invalid_attributes))))
+        if actor is None:
+            return
 
-        for actor in CarlaDataProvider._actor_transform_map:
-            if actor is not None and actor.is_alive:
-                CarlaDataProvider._actor_transform_map[actor] = actor.get_transform()
+        attributes = set(attributes)
+        if 'history' in attributes:
+            # The history is filled with the transform and the velocity of the actor
+            attributes.update(('transform', 'velocity'))
+        CarlaDataProvider._subscriptions.setdefault(actor.id, set()).update(attributes)
+
+    @staticmethod
+    def get_subscriptions(actor):
+        """
+        returns the set of attributes subscribed for the given actor
+        """
+        return set(CarlaDataProvider._subscriptions.get(actor.id, ()))
+
+    @staticmethod
+    def on_carla_tick(snapshot=None):
+        """
+        Callback from CARLA
+
+        Updates the subscribed attributes of the registered actors. If the carla.WorldSnapshot of the
+        current frame is given, transform, velocity, acceleration and angular velocity are taken from it,
+        which requires no further calls to the simulator. Otherwise (or for actors missing
+        in the snapshot) each attribute is queried individually.
+        """
+        CarlaDataProvider._tick += 1
+        CarlaDataProvider._last_snapshot = snapshot
+        CarlaDataProvider._tick_projections.clear()
+        CarlaDataProvider._spawn_transform_ids.clear()
+
+        rpcs = 0
+        for actor_id, attributes in list(CarlaDataProvider._subscriptions.items()):
+            state = CarlaDataProvider._actor_state_map.get(actor_id)
+            if state is not None:
+                rpcs += CarlaDataProvider._update_state(state, attributes)
+                if 'history' in attributes:
+                    CarlaDataProvider._update_history(state, snapshot)
+
+        # Compared to querying all registered actors on every tick
+        rpcs_saved = CarlaDataProvider.RPCS_PER_ACTOR_UPDATE * len(CarlaDataProvider._actor_state_map) - rpcs
+        CarlaDataProvider._rpcs_saved = rpcs_saved
+        CarlaDataProvider._rpcs_saved_total += rpcs_saved
 
         world = CarlaDataProvider._world
         if world is None:
             print("WARNING: CarlaDataProvider couldn't find the world")
 
+    @staticmethod
+    def _update_state(state, attributes):
+        """
+        Update the attributes of the ActorState that were not updated during the current tick.
+        Returns the amount of calls to the simulator done
+        """
+        tick = CarlaDataProvider._tick
+        if state.bounding_box is not None:
+            # The bounding box does not change, so it is only taken once
+            state.updated['bounding_box'] = tick
+        attributes = [attribute for attribute in attributes
+                      if attribute != 'history' and state.updated.get(attribute) != tick]
+        if not attributes:
+            return 0
+
+        snapshot = CarlaDataProvider._last_snapshot
+        if snapshot is not None and any(attribute in CarlaDataProvider.SNAPSHOT_ATTRIBUTES for attribute in attributes):
+            actor_snapshot = snapshot.find(state.actor.id)
+            if actor_snapshot is not None:
+                CarlaDataProvider._update_state_from_snapshot(state, actor_snapshot)
+                attributes = [attribute for attribute in attributes if state.updated.get(attribute) != tick]
+                if not attributes:
+                    return 0
+
+        actor = state.actor
+        if actor is None:
+            return 0
+        if not actor.is_alive:
+            # Destroyed actors keep their last state, but are no longer updated
+            CarlaDataProvider._subscriptions.pop(actor.id, None)
+            return 1
+
+        rpcs = 1
+        for attribute in attributes:
+            if attribute == 'transform':
+                state.location = actor.get_location()
+                state.transform = actor.get_transform()
+                rpcs += 2
+            elif attribute == 'velocity':
+                velocity = actor.get_velocity()
+                state.velocity_vector = velocity
+                state.velocity = math.sqrt(velocity.x**2 + velocity.y**2)
+                rpcs += 1
+            elif attribute == 'bounding_box':
+                state.bounding_box = actor.bounding_box
+            else:
+                setattr(state, attribute, getattr(actor, 'get_' + attribute)())
+                rpcs += 1
+            state.updated[attribute] = tick
+        return rpcs
+
+    @staticmethod
+    def _update_state_from_snapshot(state, actor_snapshot):
+        """
+        Fill the given ActorState with the data of a carla.ActorSnapshot
+        """
+        transform = actor_snapshot.get_transform()
+        velocity = actor_snapshot.get_velocity()
+        state.velocity_vector = velocity
+        state.velocity = math.sqrt(velocity.x**2 + velocity.y**2)
+        state.location = carla.Location(transform.location)
+        state.transform = transform
+        state.acceleration = actor_snapshot.get_acceleration()
+        state.angular_velocity = actor_snapshot.get_angular_velocity()
+
+        tick = CarlaDataProvider._tick
+        for attribute in ('transform', 'velocity', 'acceleration', 'angular_velocity'):
+            state.updated[attribute] = tick
+
+    @staticmethod
+    def _update_history(state, snapshot):
+        """
+        Push the current transform and velocity of the ActorState to its ActorHistory
+        """
+        if state.transform is None or state.velocity_vector is None:
+            return
+        if state.history is None:
+            state.history = ActorHistory(CarlaDataProvider.HISTORY_SIZE)
+
+        if snapshot is not None:
+            time = snapshot.timestamp.elapsed_seconds
+        else:
+            time = GameTime.get_time()
+        location = state.transform.location
+        velocity = state.velocity_vector
+        state.history.push(time, (location.x, location.y, location.z),
+                           (velocity.x, velocity.y, velocity.z), state.transform.rotation.yaw)
+
+    @staticmethod
+    def _get_state_attribute(actor, attribute):
+        """
+        returns the ActorState of the registered actor, with the given attribute updated
+        for the current tick. None if the actor is not registered
+        """
+        state = CarlaDataProvider._actor_state_map.get(actor.id)
+        if state is not None:
+            CarlaDataProvider._update_state(state, (attribute,))
+        return state
+
+    @staticmethod
+    def get_state_buffer():
+        """
+        returns the ActorStateBuffer with the state of all actors of the world.
+
+        The buffer is filled from the world snapshot given at the last tick, and refreshed at most
+        once per frame. If no snapshot is available, a new one is requested from CARLA.
+        """
+        snapshot = CarlaDataProvider._last_snapshot
+        if snapshot is None:
+            if CarlaDataProvider._world is None:
+                return CarlaDataProvider._actor_state_buffer
+            snapshot = CarlaDataProvider._world.get_snapshot()
+
+        if snapshot.frame != CarlaDataProvider._actor_state_buffer.frame:
+            CarlaDataProvider._refresh_state_buffer(snapshot)
+
+        return CarlaDataProvider._actor_state_buffer
+
+    @staticmethod
+    def _refresh_state_buffer(snapshot):
+        """
+        Fill the ActorStateBuffer with the data of all actors of the given world snapshot
+        """
+        actor_snapshots = list(snapshot)
+
+        # Get the actors not seen before, all of them with a single call
+        unknown_ids = [actor_snapshot.id for actor_snapshot in actor_snapshots
+                       if actor_snapshot.id not in CarlaDataProvider._actor_state_map and
+                       actor_snapshot.id not in CarlaDataProvider._world_actor_map]
+        if unknown_ids and CarlaDataProvider._world is not None:
+            for actor in CarlaDataProvider._world.get_actors(unknown_ids):
+                CarlaDataProvider._world_actor_map[actor.id] = actor
+
+        ids = []
+        type_ids = []
+        positions = []
+        yaws = []
+        velocities = []
+        extents = []
+        for actor_snapshot in actor_snapshots:
+            transform = actor_snapshot.get_transform()
+            velocity = actor_snapshot.get_velocity()
+            type_id, extent, _ = CarlaDataProvider._get_actor_static_data(actor_snapshot.id)
+            ids.append(actor_snapshot.id)
+            type_ids.append(type_id)
+            positions.append((transform.location.x, transform.location.y, transform.location.z))
+            yaws.append(transform.rotation.yaw)
+            velocities.append((velocity.x, velocity.y, velocity.z))
+            extents.append(extent)
+
+        CarlaDataProvider._actor_state_buffer.update(
+            snapshot.frame, ids, type_ids, positions, yaws, velocities, extents)
+
+        # Forget the actors that are no longer part of the world
+        if len(CarlaDataProvider._world_actor_map) + len(CarlaDataProvider._actor_state_map) > len(ids):
+            alive_ids = set(ids)
+            for actor_id in list(CarlaDataProvider._world_actor_map):
+                if actor_id not in alive_ids:
+                    CarlaDataProvider._world_actor_map.pop(actor_id)
+                    CarlaDataProvider._actor_static_map.pop(actor_id, None)
+
+    @staticmethod
+    def _get_tracked_actor(actor_id):
+        """
+        returns the carla.Actor of a registered or world actor with the given id, None if unknown
+        """
+        state = CarlaDataProvider._actor_state_map.get(actor_id)
+        if state is not None:
+            return state.actor
+        return CarlaDataProvider._world_actor_map.get(actor_id)
+
+    @staticmethod
+    def _get_actor_static_data(actor_id):
+        """
+        returns the (cached) type id, bounding box extent and role name of the given actor id.
+        The extent is zero for actors without bounding box, the role name None for actors without one
+        """
+        static_data = CarlaDataProvider._actor_static_map.get(actor_id)
+        if static_data is None:
+            actor = CarlaDataProvider._get_tracked_actor(actor_id)
+            type_id = getattr(actor, 'type_id', '')
+            extent = (0.0, 0.0, 0.0)
+            bounding_box = getattr(actor, 'bounding_box', None)
+            if bounding_box is not None:
+                extent = (bounding_box.extent.x, bounding_box.extent.y, bounding_box.extent.z)
+            role_name = getattr(actor, 'attributes', {}).get('role_name')
+            static_data = (type_id, extent, role_name)
+            CarlaDataProvider._actor_static_map[actor_id] = static_data
+        return static_data
+
+    @staticmethod
+    def _refresh_registry():
+        """
+        Rebuild the world actor registry, at most once per frame (or after new actors are registered).
+        It contains all actors of the last world snapshot, plus the registered actors not yet part of it.
+        Actors are indexed by id, by every prefix of their type id (e.g. 'vehicle', 'vehicle.tesla'
+        and 'vehicle.tesla.model3') and by role name
+        """
+        buffer = CarlaDataProvider.get_state_buffer()
+        if CarlaDataProvider._registry_frame == buffer.frame:
+            return
+
+        actor_ids = buffer.ids.tolist()
+        snapshot_ids = set(actor_ids)
+        actor_ids.extend(actor_id for actor_id in CarlaDataProvider._actor_state_map if actor_id not in snapshot_ids)
+
+        CarlaDataProvider._registry_actors = []
+        CarlaDataProvider._registry_id_map = dict()
+        CarlaDataProvider._registry_type_map = dict()
+        CarlaDataProvider._registry_role_name_map = dict()
+        for actor_id in actor_ids:
+            actor = CarlaDataProvider._get_tracked_actor(actor_id)
+            if actor is None:
+                continue
+            type_id, _, role_name = CarlaDataProvider._get_actor_static_data(actor_id)
+
+            CarlaDataProvider._registry_actors.append(actor)
+            CarlaDataProvider._registry_id_map[actor_id] = actor
+            type_parts = type_id.split('.')
+            for i in range(1, len(type_parts) + 1):
+                CarlaDataProvider._registry_type_map.setdefault('.'.join(type_parts[:i]), []).append(actor)
+            if role_name is not None:
+                CarlaDataProvider._registry_role_name_map.setdefault(role_name, []).append(actor)
+
+        CarlaDataProvider._registry_frame = buffer.frame
+
+    @staticmethod
+    def get_world_actors(type_filter=None):
+        """
+        returns the actors of the world, as world.get_actors().filter(type_filter) would do,
+        without calling CARLA more than once per frame.
+        Filters such as 'vehicle.*' or 'traffic.traffic_light' are answered by the type index,
+        other wildcard patterns are matched against all actors
+        """
+        CarlaDataProvider._refresh_registry()
+        if type_filter is None or type_filter == '*':
+            return list(CarlaDataProvider._registry_actors)
+
+        prefix = type_filter[:-2] if type_filter.endswith('.*') else type_filter
+        if not any(char in prefix for char in '*?['):
+            return list(CarlaDataProvider._registry_type_map.get(prefix, []))
+
+        return [actor for actor in CarlaDataProvider._registry_actors
+                if fnmatch.fnmatch(CarlaDataProvider._get_actor_static_data(actor.id)[0], type_filter)]
+
+    @staticmethod
+    def get_world_actor_by_id(actor_id):
+        """
+        returns the actor of the world with the given id, None if there is none
+        """
+        CarlaDataProvider._refresh_registry()
+        return CarlaDataProvider._registry_id_map.get(actor_id)
+
+    @staticmethod
+    def get_world_actors_by_role_name(role_name, type_filter=None):
+        """
+        returns the actors of the world with the given role name, optionally filtered by type
+        """
+        CarlaDataProvider._refresh_registry()
+        actors = CarlaDataProvider._registry_role_name_map.get(role_name, [])
+        if type_filter is not None:
+            actors = [actor for actor in actors
+                      if fnmatch.fnmatch(CarlaDataProvider._get_actor_static_data(actor.id)[0], type_filter)]
+        return list(actors)
+
+    @staticmethod
+    def _get_spatial_index():
+        """
+        returns the spatial index over the ActorStateBuffer, rebuilt at most once per frame
+        """
+        buffer = CarlaDataProvider.get_state_buffer()
+        if CarlaDataProvider._spatial_index.frame != buffer.frame:
+            CarlaDataProvider._spatial_index.build(buffer.frame, buffer.positions)
+        return CarlaDataProvider._spatial_index
+
+    @staticmethod
+    def _rows_to_actors(buffer, rows, type_filter=None):
+        """
+        Convert rows of the ActorStateBuffer to carla.Actors, keeping those matching the type filter
+        """
+        actors = []
+        for row in rows:
+            if type_filter is not None and not fnmatch.fnmatch(buffer.type_ids[row], type_filter):
+                continue
+            actor = CarlaDataProvider._get_tracked_actor(int(buffer.ids[row]))
+            if actor is not None:
+                actors.append(actor)
+        return actors
+
+    @staticmethod
+    def query_radius(location, radius, type_filter=None):
+        """
+        returns all actors of the world closer than radius to the given location.
+        type_filter is an optional wildcard pattern for the type id (e.g. 'vehicle.*')
+        """
+        index = CarlaDataProvider._get_spatial_index()
+        rows = index.query_radius((location.x, location.y, location.z), radius)
+        return CarlaDataProvider._rows_to_actors(CarlaDataProvider._actor_state_buffer, rows, type_filter)
+
+    @staticmethod
+    def query_radius_rows(location, radius, type_filter=None):
+        """
+        returns the rows of the ActorStateBuffer (see get_state_buffer) of all actors closer than radius
+        to the given location, for vectorized processing of their state.
+        type_filter is an optional wildcard pattern for the type id (e.g. 'vehicle.*')
+        """
+        index = CarlaDataProvider._get_spatial_index()
+        rows = index.query_radius((location.x, location.y, location.z), radius)
+        if type_filter is not None:
+            type_ids = CarlaDataProvider._actor_state_buffer.type_ids
+            rows = np.array([row for row in rows if fnmatch.fnmatch(type_ids[row], type_filter)], dtype=np.int64)
+        return rows
+
+    @staticmethod
+    def nearest(location, k=1, type_filter=None):
+        """
+        returns the k actors of the world closest to the given location, sorted by distance.
+        type_filter is an optional wildcard pattern for the type id (e.g. 'vehicle.*')
+        """
+        index = CarlaDataProvider._get_spatial_index()
+        buffer = CarlaDataProvider._actor_state_buffer
+        mask = None
+        if type_filter is not None:
+            mask = np.array([fnmatch.fnmatch(type_id, type_filter) for type_id in buffer.type_ids], dtype=bool)
+        rows = index.nearest((location.x, location.y, location.z), k, mask)
+        return CarlaDataProvider._rows_to_actors(buffer, rows)
+
+    @staticmethod
+    def get_pairwise_distances(actors_a, actors_b):
+        """
+        returns a NumPy matrix with the distances between each actor of actors_a (rows)
+        and each actor of actors_b (columns). Actors missing in the last snapshot result in NaN distances
+        """
+        buffer = CarlaDataProvider.get_state_buffer()
+        return buffer.pairwise_distances([actor.id for actor in actors_a], [actor.id for actor in actors_b])
+
+    @staticmethod
+    def get_rpcs_saved(total=False):
+        """
+        returns the amount of calls to the simulator saved by the snapshot-based update
+        at the last tick, or since the last cleanup if total is True
+        """
+        if total:
+            return CarlaDataProvider._rpcs_saved_total
+        return CarlaDataProvider._rpcs_saved
+
+    @staticmethod
+    def get_actor_state(actor):
+        """
+        returns the buffered ActorState of the given actor, None if it is not registered.
+        Only its subscribed attributes are guaranteed to be up to date
+        """
+        return CarlaDataProvider._actor_state_map.get(actor.id)
+
     @staticmethod
     def get_velocity(actor):
         """
         returns the absolute velocity for the given actor
         """
-        for key in CarlaDataProvider._actor_velocity_map:
-            if key.id == actor.id:
-                return CarlaDataProvider._actor_velocity_map[key]
+        state = CarlaDataProvider._get_state_attribute(actor, 'velocity')
+        if state is not None:
+            return state.velocity
 
         # We are intentionally not throwing here
         # This may cause exception loops in py_trees
@@ -135,9 +652,9 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         """
         returns the location for the given actor
         """
-        for key in CarlaDataProvider._actor_location_map:
-            if key.id == actor.id:
-                return CarlaDataProvider._actor_location_map[key]
+        state = CarlaDataProvider._get_state_attribute(actor, 'transform')
+        if state is not None:
+            return state.location
 
         # We are intentionally not throwing here
         # This may cause exception loops in py_trees
@@ -149,15 +666,80 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         """
         returns the transform for the given actor
         """
-        for key in CarlaDataProvider._actor_transform_map:
-            if key.id == actor.id:
-                return CarlaDataProvider._actor_transform_map[key]
+        state = CarlaDataProvider._get_state_attribute(actor, 'transform')
+        if state is not None:
+            return state.transform
 
         # We are intentionally not throwing here
         # This may cause exception loops in py_trees
         print('{}.get_transform: {} not found!' .format(__name__, actor))
         return None
 
+    @staticmethod
+    def get_acceleration(actor):
+        """
+        returns the acceleration (carla.Vector3D) for the given actor.
+        Actors that are not registered are queried directly
+        """
+        state = CarlaDataProvider._get_state_attribute(actor, 'acceleration')
+        if state is not None:
+            return state.acceleration
+        return actor.get_acceleration()
+
+    @staticmethod
+    def get_angular_velocity(actor):
+        """
+        returns the angular velocity (carla.Vector3D) for the given actor.
+        Actors that are not registered are queried directly
+        """
+        state = CarlaDataProvider._get_state_attribute(actor, 'angular_velocity')
+        if state is not None:
+            return state.angular_velocity
+        return actor.get_angular_velocity()
+
+    @staticmethod
+    def get_history(actor):
+        """
+        returns the ActorHistory of the given actor, None if the actor is not registered,
+        not subscribed to 'history' or no tick happened since the subscription
+        """
+        state = CarlaDataProvider._actor_state_map.get(actor.id)
+        if state is None:
+            return None
+        return state.history
+
+    @staticmethod
+    def get_travelled_distance(actor, ticks=None):
+        """
+        returns the distance [m] travelled by the given actor during the last ticks,
+        or since its subscription to 'history' if ticks is None
+        """
+        history = CarlaDataProvider.get_history(actor)
+        if history is None:
+            return 0.0
+        return history.get_distance(ticks)
+
+    @staticmethod
+    def get_control(actor):
+        """
+        returns the last control applied to the given actor. The returned object is shared,
+        copy it before modifying it. Actors that are not registered are queried directly
+        """
+        state = CarlaDataProvider._get_state_attribute(actor, 'control')
+        if state is not None:
+            return state.control
+        return actor.get_control()
+
+    @staticmethod
+    def get_bounding_box(actor):
+        """
+        returns the bounding box for the given actor
+        """
+        state = CarlaDataProvider._get_state_attribute(actor, 'bounding_box')
+        if state is not None:
+            return state.bounding_box
+        return actor.bounding_box
+
     @staticmethod
     def set_client(client):
         """
@@ -181,6 +763,7 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         CarlaDataProvider._sync_flag = world.get_settings().synchronous_mode
         CarlaDataProvider._map = world.get_map()
         CarlaDataProvider._blueprint_library = world.get_blueprint_library()
+        CarlaDataProvider._blueprint_index = BlueprintIndex(CarlaDataProvider._blueprint_library)
         CarlaDataProvider.generate_spawn_points()
         CarlaDataProvider.prepare_map()
 
@@ -207,6 +790,57 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
 
         return CarlaDataProvider._map
 
+    @staticmethod
+    def get_waypoint(location, project_to_road=True, lane_type=carla.LaneType.Driving):
+        """
+        Cached version of carla.Map.get_waypoint. Locations are quantized to PROJECTION_RESOLUTION,
+        and the projections are kept for the current tick and, for the last PROJECTION_CACHE_SIZE
+        of them, across ticks. Note: Can be None if project_to_road is False
+        """
+        resolution = CarlaDataProvider.PROJECTION_RESOLUTION
+        key = (int(round(location.x / resolution)), int(round(location.y / resolution)),
+               int(round(location.z / resolution)), lane_type, project_to_road)
+
+        stats = CarlaDataProvider._projection_stats
+        if key in CarlaDataProvider._tick_projections:
+            stats['tick_hits'] += 1
+            return CarlaDataProvider._tick_projections[key]
+
+        if key in CarlaDataProvider._projections:
+            stats['hits'] += 1
+            waypoint = CarlaDataProvider._projections.pop(key)
+        else:
+            stats['misses'] += 1
+            waypoint = CarlaDataProvider.get_map().get_waypoint(
+                location, project_to_road=project_to_road, lane_type=lane_type)
+            while len(CarlaDataProvider._projections) >= CarlaDataProvider.PROJECTION_CACHE_SIZE:
+                CarlaDataProvider._projections.popitem(last=False)
+
+        CarlaDataProvider._projections[key] = waypoint
+        CarlaDataProvider._tick_projections[key] = waypoint
+        return waypoint
+
+    @staticmethod
+    def get_projection_stats():
+        """
+        returns the amount of map projections answered from the current tick, from previous ticks
+        and by the map since the last cleanup, together with the hit rate
+        """
+        stats = dict(CarlaDataProvider._projection_stats)
+        total = stats['tick_hits'] + stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['tick_hits'] + stats['hits']) / float(total) if total else 0.0
+        return stats
+
+    @staticmethod
+    def _clear_projections():
+        """
+        Remove all cached map projections and their statistics
+        """
+        CarlaDataProvider._tick_projections.clear()
+        CarlaDataProvider._projections.clear()
+        for name in CarlaDataProvider._projection_stats:
+            CarlaDataProvider._projection_stats[name] = 0
+
     @staticmethod
     def is_sync_mode():
         """
@@ -235,13 +869,125 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
 
         # Parse all traffic lights
         CarlaDataProvider._traffic_light_map.clear()
-        for traffic_light in CarlaDataProvider._world.get_actors().filter('*traffic_light*'):
+        CarlaDataProvider._traffic_light_index = None
+        CarlaDataProvider._stop_sign_index = None
+        CarlaDataProvider._clear_projections()
+        for traffic_light in CarlaDataProvider.get_world_actors('*traffic_light*'):
             if traffic_light not in CarlaDataProvider._traffic_light_map.keys():
                 CarlaDataProvider._traffic_light_map[traffic_light] = traffic_light.get_transform()
             else:
                 raise KeyError(
                     "Traffic light '{}' already registered. Cannot register twice!".format(traffic_light.id))
 
+        CarlaDataProvider._prepare_lane_traffic_light_map()
+
+    @staticmethod
+    def _prepare_lane_traffic_light_map():
+        """
+        Fill _lane_traffic_light_map, linking each lane to the traffic light closest to the stop line
+        in front of it, together with the distance offset of the stop line along the lane
+        """
+        CarlaDataProvider._lane_traffic_light_map.clear()
+
+        traffic_lights = [traffic_light for traffic_light in CarlaDataProvider._traffic_light_map
+                          if hasattr(traffic_light, 'trigger_volume')]
+        if not traffic_lights:
+            return
+
+        cache_path = get_map_cache_path(CarlaDataProvider._map, 'lane_stop_lines')
+        stop_lines = load_cached_array(cache_path, CarlaDataProvider.LANE_STOP_LINE_DTYPE)
+        if stop_lines is None:
+            stop_lines = CarlaDataProvider._compute_lane_stop_lines(CarlaDataProvider._map)
+            save_cached_array(cache_path, stop_lines)
+        if not len(stop_lines):
+            return
+
+        trigger_locations = []
+        for traffic_light in traffic_lights:
+            tl_t = CarlaDataProvider._traffic_light_map[traffic_light]
+            location = tl_t.transform(traffic_light.trigger_volume.location)
+            trigger_locations.append((location.x, location.y, location.z))
+        trigger_locations = np.array(trigger_locations)
+
+        # Closest trigger volume to each stop line
+        stops = np.asarray(stop_lines['stop'])
+        distances = np.sum((stops[:, np.newaxis, :] - trigger_locations[np.newaxis, :, :]) ** 2, axis=2)
+        closest = np.argmin(distances, axis=1)
+
+        for lane, offset, index in zip(stop_lines['lane'].tolist(), stop_lines['offset'].tolist(), closest.tolist()):
+            CarlaDataProvider._lane_traffic_light_map[tuple(lane)] = (traffic_lights[index], offset)
+
+    @staticmethod
+    def _compute_lane_stop_lines(carla_map):
+        """
+        Follow every lane of the map until the next intersection, and store the location of
+        the last waypoint before it (the stop line) together with a distance offset, so that
+        the distance from a waypoint of the lane to the stop line is offset - s (or offset + s
+        for lanes with positive id, which are driven against the road direction)
+        """
+        step = CarlaDataProvider.LANE_STEP
+        lanes = dict()
+        for start in carla_map.generate_waypoints(step):
+            key = (start.road_id, start.section_id, start.lane_id)
+            if key in lanes:
+                continue
+            if start.is_junction:
+                lanes[key] = None
+                continue
+
+            waypoints = []
+            waypoint = start
+            while waypoint and not waypoint.is_junction and len(waypoints) < CarlaDataProvider.LANE_MAX_STEPS:
+                waypoints.append(waypoint)
+                next_waypoints = waypoint.next(step)
+                waypoint = next_waypoints[0] if next_waypoints else None
+
+            if waypoint is None or not waypoint.is_junction:
+                # Dead end or loop without intersections
+                lanes[key] = None
+                continue
+
+            stop = waypoints[-1].transform.location
+            stop_distance = step * (len(waypoints) - 1)
+            for i, lane_waypoint in enumerate(waypoints):
+                lane_key = (lane_waypoint.road_id, lane_waypoint.section_id, lane_waypoint.lane_id)
+                if lane_key in lanes:
+                    continue
+                remaining = stop_distance - step * i
+                if lane_waypoint.lane_id > 0:
+                    offset = remaining - lane_waypoint.s
+                else:
+                    offset = remaining + lane_waypoint.s
+                lanes[lane_key] = (offset, (stop.x, stop.y, stop.z))
+
+        entries = [(key, value) for key, value in iteritems(lanes) if value is not None]
+        stop_lines = np.zeros(len(entries), dtype=CarlaDataProvider.LANE_STOP_LINE_DTYPE)
+        for i, (key, (offset, stop)) in enumerate(entries):
+            stop_lines[i] = (key, offset, stop)
+        return stop_lines
+
+    @staticmethod
+    def get_traffic_light_index():
+        """
+        returns the TrafficSignIndex over the traffic lights of the world, with the center of their
+        trigger volume and their stop line waypoints. It is built once per world
+        """
+        if CarlaDataProvider._traffic_light_index is None:
+            CarlaDataProvider._traffic_light_index = build_traffic_light_index(
+                CarlaDataProvider._traffic_light_map, CarlaDataProvider.get_map())
+        return CarlaDataProvider._traffic_light_index
+
+    @staticmethod
+    def get_stop_sign_index():
+        """
+        returns the TrafficSignIndex over the stop signs of the world, with their transform
+        and the center of their trigger volume. It is built once per world
+        """
+        if CarlaDataProvider._stop_sign_index is None:
+            CarlaDataProvider._stop_sign_index = build_stop_sign_index(
+                CarlaDataProvider.get_world_actors('*traffic.stop*'))
+        return CarlaDataProvider._stop_sign_index
+
     @staticmethod
     def annotate_trafficlight_in_group(traffic_light):
         """
@@ -356,31 +1102,42 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         else:
             location = CarlaDataProvider.get_location(actor)
 
-        waypoint = CarlaDataProvider.get_map().get_waypoint(location)
-        # Create list of all waypoints until next intersection
-        list_of_waypoints = []
-        while waypoint and not waypoint.is_intersection:
-            list_of_waypoints.append(waypoint)
-            waypoint = waypoint.next(2.0)[0]
+        traffic_light, _ = CarlaDataProvider._get_lane_traffic_light(location)
+        return traffic_light
 
-        # If the list is empty, the actor is in an intersection
-        if not list_of_waypoints:
-            return None
+    @staticmethod
+    def get_next_traffic_light_distance(actor, use_cached_location=True):
+        """
+        returns the next relevant traffic light for the provided actor and the distance
+        along the lane to its stop line. (None, None) if there is none
+        """
+        if not use_cached_location:
+            location = actor.get_transform().location
+        else:
+            location = CarlaDataProvider.get_location(actor)
 
-        relevant_traffic_light = None
-        distance_to_relevant_traffic_light = float("inf")
+        return CarlaDataProvider._get_lane_traffic_light(location)
 
-        for traffic_light in CarlaDataProvider._traffic_light_map:
-            if hasattr(traffic_light, 'trigger_volume'):
-                tl_t = CarlaDataProvider._traffic_light_map[traffic_light]
-                transformed_tv = tl_t.transform(traffic_light.trigger_volume.location)
-                distance = carla.Location(transformed_tv).distance(list_of_waypoints[-1].transform.location)
+    @staticmethod
+    def _get_lane_traffic_light(location):
+        """
+        returns the traffic light in front of the lane at the given location and the distance to its stop line.
+        The location is projected through the projection cache, so the distance is accurate to PROJECTION_RESOLUTION
+        """
+        waypoint = CarlaDataProvider.get_waypoint(location)
+        if waypoint is None or waypoint.is_junction:
+            # The actor is in an intersection
+            return None, None
 
-                if distance < distance_to_relevant_traffic_light:
-                    relevant_traffic_light = traffic_light
-                    distance_to_relevant_traffic_light = distance
+        entry = CarlaDataProvider._lane_traffic_light_map.get((waypoint.road_id, waypoint.section_id,
+                                                               waypoint.lane_id))
+        if entry is None:
+            return None, None
 
-        return relevant_traffic_light
+        traffic_light, offset = entry
+        if waypoint.lane_id > 0:
+            return traffic_light, offset + waypoint.s
+        return traffic_light, offset - waypoint.s
 
     @staticmethod
     def set_ego_vehicle_route(route):
@@ -399,6 +1156,18 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         """
         return CarlaDataProvider._ego_vehicle_route
 
+    @staticmethod
+    def get_route_progress(actor, route):
+        """
+        returns the RouteProgressTracker of the actor along the route (a list of route points
+        or a CompiledRoute). All callers watching the same actor and route share the same tracker
+        """
+        compiled = compile_route(route, CarlaDataProvider.get_map())
+        key = (actor.id, id(compiled))
+        if key not in CarlaDataProvider._route_progress_trackers:
+            CarlaDataProvider._route_progress_trackers[key] = RouteProgressTracker(compiled)
+        return CarlaDataProvider._route_progress_trackers[key]
+
     @staticmethod
     def generate_spawn_points():
         """
@@ -407,43 +1176,65 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         spawn_points = list(CarlaDataProvider.get_map(CarlaDataProvider._world).get_spawn_points())
         CarlaDataProvider._rng.shuffle(spawn_points)
         CarlaDataProvider._spawn_points = spawn_points
-        CarlaDataProvider._spawn_index = 0
+        CarlaDataProvider._spawn_allocator = SpawnPointAllocator(spawn_points)
 
     @staticmethod
-    def create_blueprint(model, rolename='scenario', color=None, actor_category="car"):
+    def allocate_spawn_points(amount):
+        """
+        returns up to amount random spawn points which are free, i.e. not occupied by any vehicle or walker
+        (according to their buffered positions and bounding boxes) nor handed out or used by another spawn
+        since the last tick. They are reserved until the next tick, once the spawned actors are part of the world
+        """
+        if amount <= 0:
+            return []
+        if CarlaDataProvider._spawn_allocator is None:
+            CarlaDataProvider.generate_spawn_points()
+
+        buffer = CarlaDataProvider.get_state_buffer()
+        mask = np.array([type_id.startswith(('vehicle.', 'walker.')) for type_id in buffer.type_ids], dtype=bool)
+        return CarlaDataProvider._spawn_allocator.allocate(amount, buffer.positions[mask], buffer.extents[mask],
+                                                           buffer.frame, CarlaDataProvider._rng)
+
+    @staticmethod
+    def _reserve_spawn_location(location):
         """
-        Function to setup the blueprint of an actor given its model and other relevant parameters
+        Keep random spawns away from an actor spawned at the given location until the next tick
         """
+        if CarlaDataProvider._spawn_allocator is not None:
+            CarlaDataProvider._spawn_allocator.reserve(location, CarlaDataProvider.get_state_buffer().frame)
 
-        _actor_blueprint_categories = {
-            'car': 'vehicle.tesla.model3',
-            'van': 'vehicle.volkswagen.t2',
-            'truck': 'vehicle.carlamotors.carlacola',
-            'trailer': '',
-            'semitrailer': '',
-            'bus': 'vehicle.volkswagen.t2',
-            'motorbike': 'vehicle.kawasaki.ninja',
-            'bicycle': 'vehicle.diamondback.century',
-            'train': '',
-            'tram': '',
-            'pedestrian': 'walker.pedestrian.0001',
-        }
+    @staticmethod
+    def get_blueprint_index():
+        """
+        returns the BlueprintIndex of the blueprint library of the world, building it if needed
+        """
+        if CarlaDataProvider._blueprint_index is None:
+            if CarlaDataProvider._blueprint_library is None:
+                CarlaDataProvider._blueprint_library = CarlaDataProvider._world.get_blueprint_library()
+            CarlaDataProvider._blueprint_index = BlueprintIndex(CarlaDataProvider._blueprint_library)
+        return CarlaDataProvider._blueprint_index
+
+    @staticmethod
+    def create_blueprint(model, rolename='scenario', color=None, actor_category="car"):
+        """
+        Function to setup the blueprint of an actor given its model and other relevant parameters.
+        The blueprint is resolved with the blueprint index, which memoizes the wildcard filters
+        """
+        index = CarlaDataProvider.get_blueprint_index()
 
         # Set the model
         try:
-            blueprint = CarlaDataProvider._rng.choice(CarlaDataProvider._blueprint_library.filter(model))
+            blueprint_id = str(CarlaDataProvider._rng.choice(index.filter(model)))
         except ValueError:
             # The model is not part of the blueprint library. Let's take a default one for the given category
-            bp_filter = "vehicle.*"
-            new_model = _actor_blueprint_categories[actor_category]
-            if new_model != '':
-                bp_filter = new_model
+            new_model = ACTOR_BLUEPRINT_CATEGORIES[actor_category]
             print("WARNING: Actor model {} not available. Using instead {}".format(model, new_model))
-            blueprint = CarlaDataProvider._rng.choice(CarlaDataProvider._blueprint_library.filter(bp_filter))
+            blueprint_id = str(CarlaDataProvider._rng.choice(index.filter(index.categories[actor_category])))
+        blueprint = index.get_blueprint(blueprint_id)
 
         # Set the color
         if color:
-            if not blueprint.has_attribute('color'):
+            if not index.has_attribute(blueprint_id, 'color'):
                 print(
                     "WARNING: Cannot set Color ({}) for actor {} due to missing blueprint attribute".format(
                         color, blueprint.id))
@@ -458,16 +1249,16 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
                         color, blueprint.id, default_color))
                     blueprint.set_attribute('color', default_color)
         else:
-            if blueprint.has_attribute('color') and rolename != 'hero':
-                color = CarlaDataProvider._rng.choice(blueprint.get_attribute('color').recommended_values)
+            if index.colors[blueprint_id] and rolename != 'hero':
+                color = str(CarlaDataProvider._rng.choice(index.colors[blueprint_id]))
                 blueprint.set_attribute('color', color)
 
         # Make pedestrians mortal
-        if blueprint.has_attribute('is_invincible'):
+        if index.has_attribute(blueprint_id, 'is_invincible'):
             blueprint.set_attribute('is_invincible', 'false')
 
         # Set the rolename
-        if blueprint.has_attribute('role_name'):
+        if index.has_attribute(blueprint_id, 'role_name'):
             blueprint.set_attribute('role_name', rolename)
 
         return blueprint
@@ -478,33 +1269,90 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         Forward a CARLA command batch to spawn actors to CARLA, and gather the responses.
         Returns list of actors on success, none otherwise
         """
+        spawned = CarlaDataProvider._spawn_actor_batch(batch)
+        if spawned is None:
+            return None
 
-        actors = []
+        # wait for the actors to be spawned properly before we do anything
+        CarlaDataProvider.tick_after_spawn()
+        return [actor for actor, _ in spawned]
 
+    @staticmethod
+    def _spawn_actor_batch(batch):
+        """
+        Forward a CARLA command batch to spawn actors to CARLA, and gather the responses, without ticking the world.
+        Returns the list of (actor, spawn transform) of the spawned actors, None if the batch could not be sent
+        """
         sync_mode = CarlaDataProvider.is_sync_mode()
 
         if CarlaDataProvider._client and batch is not None:
-            responses = CarlaDataProvider._client.apply_batch_sync(batch, sync_mode)
+            deferred = CarlaDataProvider._deferred_spawn_depth > 0
+            responses = CarlaDataProvider._client.apply_batch_sync(batch, sync_mode and not deferred)
         else:
             return None
 
-        # wait for the actors to be spawned properly before we do anything
-        if sync_mode:
+        spawn_transforms = {}
+        if responses:
+            for command, response in zip(batch, responses):
+                if not response.error:
+                    spawn_transforms[response.actor_id] = getattr(command, 'transform', None)
+
+        carla_actors = CarlaDataProvider._world.get_actors(list(spawn_transforms))
+        return [(actor, spawn_transforms[actor.id]) for actor in carla_actors]
+
+    @staticmethod
+    def tick_after_spawn():
+        """
+        Tick the world after spawning actors, or only remember to do so if the spawns are deferred
+        """
+        if CarlaDataProvider._deferred_spawn_depth > 0:
+            CarlaDataProvider._deferred_tick = True
+            return
+
+        if CarlaDataProvider.is_sync_mode():
             CarlaDataProvider._world.tick()
         else:
             CarlaDataProvider._world.wait_for_tick()
 
-        actor_ids = []
-        if responses:
-            for response in responses:
-                if not response.error:
-                    actor_ids.append(response.actor_id)
+        # The spawned actors now have valid transforms, so they are queried again
+        for actor_id in CarlaDataProvider._spawn_transform_ids:
+            state = CarlaDataProvider._actor_state_map.get(actor_id)
+            if state is not None:
+                state.updated.pop('transform', None)
+        CarlaDataProvider._spawn_transform_ids.clear()
 
-        carla_actors = CarlaDataProvider._world.get_actors(actor_ids)
-        for actor in carla_actors:
-            actors.append(actor)
+    @staticmethod
+    def begin_deferred_spawn():
+        """
+        Start deferring the ticks after spawning actors. Calls can be nested, the world being ticked
+        by the outermost end_deferred_spawn
+        """
+        CarlaDataProvider._deferred_spawn_depth += 1
 
-        return actors
+    @staticmethod
+    def end_deferred_spawn(tick=True):
+        """
+        Stop deferring the ticks. If this ends the outermost deferral and actors were spawned since it started,
+        the world is ticked once, unless tick is False. Until the world is ticked, the spawned actors
+        have the transforms they were spawned at (see register_actor)
+        """
+        CarlaDataProvider._deferred_spawn_depth = max(CarlaDataProvider._deferred_spawn_depth - 1, 0)
+        if CarlaDataProvider._deferred_spawn_depth == 0 and CarlaDataProvider._deferred_tick:
+            CarlaDataProvider._deferred_tick = False
+            if tick:
+                CarlaDataProvider.tick_after_spawn()
+
+    @staticmethod
+    @contextmanager
+    def deferred_spawn(tick=True):
+        """
+        Context manager deferring the ticks after the spawns done inside it (see end_deferred_spawn)
+        """
+        CarlaDataProvider.begin_deferred_spawn()
+        try:
+            yield
+        finally:
+            CarlaDataProvider.end_deferred_spawn(tick)
 
     @staticmethod
     def request_new_actor(model, spawn_point, rolename='scenario', autopilot=False,
@@ -515,9 +1363,13 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         blueprint = CarlaDataProvider.create_blueprint(model, rolename, color, actor_category)
 
         if random_location:
+            # Failed spawn points stay reserved, so every free spawn point is tried at most once
             actor = None
             while not actor:
-                spawn_point = CarlaDataProvider._rng.choice(CarlaDataProvider._spawn_points)
+                spawn_points = CarlaDataProvider.allocate_spawn_points(1)
+                if not spawn_points:
+                    break
+                spawn_point = spawn_points[0]
                 actor = CarlaDataProvider._world.try_spawn_actor(blueprint, spawn_point)
 
         else:
@@ -528,28 +1380,22 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
             _spawn_point.location.y = spawn_point.location.y
             _spawn_point.location.z = spawn_point.location.z + 0.2
             actor = CarlaDataProvider._world.try_spawn_actor(blueprint, _spawn_point)
+            if actor is not None:
+                CarlaDataProvider._reserve_spawn_location(_spawn_point.location)
 
         if actor is None:
             raise RuntimeError(
                 "Error: Unable to spawn vehicle {} at {}".format(blueprint.id, spawn_point))
         else:
             # Let's deactivate the autopilot of the actor if it belongs to vehicle
-            if actor in CarlaDataProvider._blueprint_library.filter('vehicle.*'):
-                actor.set_autopilot(autopilot)
-            else:
-                pass
-
-        # wait for the actor to be spawned properly before we do anything
-        if CarlaDataProvider.is_sync_mode():
-            CarlaDataProvider._world.tick()
-        else:
-            CarlaDataProvider._world.wait_for_tick()
-
-        if actor is None:
-            return None
+            if CarlaDataProvider.get_blueprint_index().matches(actor.type_id, 'vehicle.*'):
+                actor.set_autopilot(autopilot, CarlaDataProvider._traffic_manager_port)
 
         CarlaDataProvider._carla_actor_pool[actor.id] = actor
-        CarlaDataProvider.register_actor(actor)
+        CarlaDataProvider.register_actor(actor, spawn_point if random_location else _spawn_point)
+
+        # wait for the actor to be spawned properly before we do anything
+        CarlaDataProvider.tick_after_spawn()
         return actor
 
     @staticmethod
@@ -571,7 +1417,8 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         batch = []
         actors = []
 
-        CarlaDataProvider.generate_spawn_points()
+        random_spawn_points = CarlaDataProvider.allocate_spawn_points(
+            sum(1 for actor in actor_list if actor.random_location))
 
         for actor in actor_list:
 
@@ -581,12 +1428,11 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
             # Get the spawn point
             transform = actor.transform
             if actor.random_location:
-                if CarlaDataProvider._spawn_index >= len(CarlaDataProvider._spawn_points):
+                if not random_spawn_points:
                     print("No more spawn points to use")
                     break
                 else:
-                    _spawn_point = CarlaDataProvider._spawn_points[CarlaDataProvider._spawn_index]
-                    CarlaDataProvider._spawn_index += 1
+                    _spawn_point = random_spawn_points.pop(0)
 
             else:
                 _spawn_point = carla.Transform()
@@ -602,6 +1448,7 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
                         _spawn_point.location.z = transform.location.z + 0.8
                 else:
                     _spawn_point.location.z = transform.location.z + 0.2
+                CarlaDataProvider._reserve_spawn_location(_spawn_point.location)
 
             # Get the command
             command = SpawnActor(blueprint, _spawn_point)
@@ -615,16 +1462,22 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
 
             batch.append(command)
 
-        actors = CarlaDataProvider.handle_actor_batch(batch)
+        spawned = CarlaDataProvider._spawn_actor_batch(batch)
 
-        if not actors:
+        if spawned is None:
             return None
 
-        for actor in actors:
-            if actor is None:
-                continue
+        actors = []
+        for actor, transform in spawned:
             CarlaDataProvider._carla_actor_pool[actor.id] = actor
-            CarlaDataProvider.register_actor(actor)
+            CarlaDataProvider.register_actor(actor, transform)
+            actors.append(actor)
+
+        # wait for the actors to be spawned properly before we do anything
+        CarlaDataProvider.tick_after_spawn()
+
+        if not actors:
+            return None
         return actors
 
     @staticmethod
@@ -644,21 +1497,21 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
         SetAutopilot = carla.command.SetAutopilot  # pylint: disable=invalid-name
         FutureActor = carla.command.FutureActor    # pylint: disable=invalid-name
 
-        CarlaDataProvider.generate_spawn_points()
-
         batch = []
 
+        if random_location:
+            spawn_points = CarlaDataProvider.allocate_spawn_points(amount)
+
         for i in range(amount):
             # Get vehicle by model
             blueprint = CarlaDataProvider.create_blueprint(model, rolename)
 
             if random_location:
-                if CarlaDataProvider._spawn_index >= len(CarlaDataProvider._spawn_points):
-                    print("No more spawn points to use. Spawned {} actors out of {}".format(i + 1, amount))
+                if i >= len(spawn_points):
+                    print("No more free spawn points to use. Spawned {} actors out of {}".format(i, amount))
                     break
                 else:
-                    spawn_point = CarlaDataProvider._spawn_points[CarlaDataProvider._spawn_index]
-                    CarlaDataProvider._spawn_index += 1
+                    spawn_point = spawn_points[i]
             else:
                 try:
                     spawn_point = spawn_points[i]
@@ -671,16 +1524,19 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
                     SetAutopilot(FutureActor, autopilot,
                                  CarlaDataProvider._traffic_manager_port)))
 
-        actors = CarlaDataProvider.handle_actor_batch(batch)
+        spawned = CarlaDataProvider._spawn_actor_batch(batch)
 
-        if actors is None:
+        if spawned is None:
             return None
 
-        for actor in actors:
-            if actor is None:
-                continue
+        actors = []
+        for actor, transform in spawned:
             CarlaDataProvider._carla_actor_pool[actor.id] = actor
-            CarlaDataProvider.register_actor(actor)
+            CarlaDataProvider.register_actor(actor, transform)
+            actors.append(actor)
+
+        # wait for the actors to be spawned properly before we do anything
+        CarlaDataProvider.tick_after_spawn()
         return actors
 
     @staticmethod
@@ -733,6 +1589,7 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
             CarlaDataProvider._carla_actor_pool[actor_id].destroy()
             CarlaDataProvider._carla_actor_pool[actor_id] = None
             CarlaDataProvider._carla_actor_pool.pop(actor_id)
+            CarlaDataProvider.unregister_actor(actor_id)
         else:
             print("Trying to remove a non-existing actor id {}".format(actor_id))
 
@@ -740,12 +1597,19 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
     def remove_actors_in_surrounding(location, distance):
         """
         Remove all actors from the pool that are closer than distance to the
-        provided location
+        provided location. Pool actors spawned since the last snapshot are checked with their live location
         """
-        for actor_id in CarlaDataProvider._carla_actor_pool.copy():
-            if CarlaDataProvider._carla_actor_pool[actor_id].get_location().distance(location) < distance:
+        actor_ids = [actor.id for actor in CarlaDataProvider.query_radius(location, distance)]
+        buffer = CarlaDataProvider.get_state_buffer()
+        for actor_id, actor in CarlaDataProvider._carla_actor_pool.items():
+            if actor and buffer.get_row(actor_id) is None and actor.get_location().distance(location) < distance:
+                actor_ids.append(actor_id)
+
+        for actor_id in actor_ids:
+            if actor_id in CarlaDataProvider._carla_actor_pool:
                 CarlaDataProvider._carla_actor_pool[actor_id].destroy()
                 CarlaDataProvider._carla_actor_pool.pop(actor_id)
+                CarlaDataProvider.unregister_actor(actor_id)
 
         # Remove all keys with None values
         CarlaDataProvider._carla_actor_pool = dict({k: v for k, v in CarlaDataProvider._carla_actor_pool.items() if v})
@@ -786,16 +1650,36 @@ class CarlaDataProvider(object):  # pylint: disable=too-many-public-methods
                 else:
                     raise e
 
-        CarlaDataProvider._actor_velocity_map.clear()
-        CarlaDataProvider._actor_location_map.clear()
-        CarlaDataProvider._actor_transform_map.clear()
+        CarlaDataProvider._actor_state_map.clear()
+        CarlaDataProvider._subscriptions.clear()
+        CarlaDataProvider._rpcs_saved = 0
+        CarlaDataProvider._rpcs_saved_total = 0
+        CarlaDataProvider._actor_state_buffer.clear()
+        CarlaDataProvider._world_actor_map.clear()
+        CarlaDataProvider._actor_static_map.clear()
+        CarlaDataProvider._spatial_index = GridIndex()
+        CarlaDataProvider._registry_frame = None
+        CarlaDataProvider._registry_actors = []
+        CarlaDataProvider._registry_id_map.clear()
+        CarlaDataProvider._registry_type_map.clear()
+        CarlaDataProvider._registry_role_name_map.clear()
+        CarlaDataProvider._last_snapshot = None
         CarlaDataProvider._traffic_light_map.clear()
+        CarlaDataProvider._lane_traffic_light_map.clear()
+        CarlaDataProvider._traffic_light_index = None
+        CarlaDataProvider._stop_sign_index = None
+        CarlaDataProvider._clear_projections()
         CarlaDataProvider._map = None
         CarlaDataProvider._world = None
         CarlaDataProvider._sync_flag = False
         CarlaDataProvider._ego_vehicle_route = None
+        CarlaDataProvider._route_progress_trackers.clear()
+        clear_compiled_routes()
+        CarlaDataProvider._deferred_spawn_depth = 0
+        CarlaDataProvider._deferred_tick = False
+        CarlaDataProvider._spawn_transform_ids.clear()
         CarlaDataProvider._carla_actor_pool = dict()
         CarlaDataProvider._client = None
         CarlaDataProvider._spawn_points = None
-        CarlaDataProvider._spawn_index = 0
+        CarlaDataProvider._spawn_allocator = None
         CarlaDataProvider._rng = random.RandomState(CarlaDataProvider._random_seed)
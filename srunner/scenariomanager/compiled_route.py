@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides an array-backed representation of a route, shared by all
+route criteria and behaviors, so that their per-tick work needs no map queries
+"""
+
+import math
+
+import numpy as np
+
+from srunner.scenariomanager.timer import GameTime
+
+# Last route lists compiled by compile_route, as (route, CompiledRoute)
+COMPILED_ROUTE_CACHE_SIZE = 4
+_compiled_routes = []
+
+
+class CompiledRoute(object):
+
+    """
+    Route compiled into NumPy arrays. Row i of every array belongs to the i-th route point.
+    Compiling needs no map queries: the lanes of the route points (and the forward vectors
+    of routes only made of locations) are queried on first use.
+
+    Args:
+        route (list): Route as a list of (carla.Transform or carla.Location, RoadOption)
+        carla_map (carla.Map): Map of the route, used to get the lanes of the route points
+
+    Attributes:
+        route (list): The original route
+        locations (list): carla.Location of each route point
+        positions (np.ndarray): Locations [m], shape (N, 3)
+        forward_vectors (np.ndarray): Unit forward vectors of the lane at each point, shape (N, 3)
+        options (np.ndarray): RoadOption value of each point, shape (N,)
+        accumulated_distances (np.ndarray): Distance from the first point [m], shape (N,)
+        planar_accumulated_distances (np.ndarray): Distance from the first point, only using x and y [m], shape (N,)
+        length (float): Length of the route [m]
+    """
+
+    def __init__(self, route, carla_map):
+        """
+        Compile the route
+        """
+        self.route = route
+        self._map = carla_map
+        self._waypoints = dict()
+        self._forward_vectors = None
+        self.locations = [getattr(point, 'location', point) for point, _ in route]
+        self.options = np.array([getattr(option, 'value', -1) for _, option in route], dtype=np.int8)
+
+        self.positions = np.array([(location.x, location.y, location.z) for location in self.locations],
+                                  dtype=np.float64).reshape(-1, 3)
+
+        steps = np.diff(self.positions, axis=0)
+        self.accumulated_distances = np.concatenate(([0.0], np.cumsum(np.sqrt(np.sum(steps ** 2, axis=1)))))
+        self.planar_accumulated_distances = np.concatenate(
+            ([0.0], np.cumsum(np.sqrt(np.sum(steps[:, :2] ** 2, axis=1)))))
+        self.length = float(self.accumulated_distances[-1]) if len(self.locations) else 0.0
+
+    @property
+    def forward_vectors(self):
+        """
+        Unit forward vectors of the lane at each point, shape (N, 3). Computed on first use,
+        which queries the map once per point if the route only contains locations
+        """
+        if self._forward_vectors is None:
+            forward_vectors = []
+            for i, (point, _) in enumerate(self.route):
+                if hasattr(point, 'rotation'):
+                    rotation = point.rotation
+                else:
+                    rotation = self.get_waypoint(i).transform.rotation
+                yaw = math.radians(rotation.yaw)
+                pitch = math.radians(rotation.pitch)
+                forward_vectors.append((math.cos(pitch) * math.cos(yaw),
+                                        math.cos(pitch) * math.sin(yaw),
+                                        math.sin(pitch)))
+            self._forward_vectors = np.array(forward_vectors, dtype=np.float64).reshape(-1, 3)
+        return self._forward_vectors
+
+    def get_waypoint(self, index):
+        """
+        returns the carla.Waypoint of the route point with the given index, queried on first use
+        """
+        if index not in self._waypoints:
+            self._waypoints[index] = self._map.get_waypoint(self.locations[index])
+        return self._waypoints[index]
+
+    def __len__(self):
+        return len(self.locations)
+
+    def get_closest_index(self, location, start, window, planar=False):
+        """
+        returns the index of the route point closest to the location among the points
+        [start, start + window] and its distance (the last one is taken on ties)
+        """
+        end = min(start + window + 1, len(self))
+        if start >= end:
+            return -1, float('inf')
+
+        dimensions = 2 if planar else 3
+        point = np.array((location.x, location.y, location.z))[:dimensions]
+        distances = np.sqrt(np.sum((self.positions[start:end, :dimensions] - point) ** 2, axis=1))
+        offset = len(distances) - 1 - int(np.argmin(distances[::-1]))
+        return start + offset, float(distances[offset])
+
+    def get_passed_indices(self, location, start, end):
+        """
+        returns the indices of the route points of [start, end) the location has already passed,
+        i.e. those for which the location is in front of the point along the lane
+        """
+        end = min(end, len(self))
+        if start >= end:
+            return np.zeros(0, dtype=np.int64)
+
+        point = np.array((location.x, location.y, location.z))
+        offsets = point - self.positions[start:end]
+        dots = np.einsum('ij,ij->i', offsets, self.forward_vectors[start:end])
+        return start + np.flatnonzero(dots > 0)
+
+    def get_distance(self, start, end):
+        """
+        returns the distance along the route between the points start and end [m]
+        """
+        return float(self.accumulated_distances[end] - self.accumulated_distances[start])
+
+
+class RouteCursor(object):
+
+    """
+    Monotonic progress cursor over a CompiledRoute. At each update, it moves to the route point
+    closest to the given location among the next window points, never going backwards.
+
+    Args:
+        route (CompiledRoute): The route
+        window (int): Amount of points after the current one that are checked
+        planar (bool): If True, distances only use x and y
+
+    Attributes:
+        index (int): Index of the current route point
+    """
+
+    def __init__(self, route, window, planar=False):
+        self.route = route
+        self.index = 0
+        self._window = window
+        self._planar = planar
+
+    def update(self, location):
+        """
+        Move the cursor to the closest route point to the location within the window.
+        returns the new index and the distance to it (-1 and inf if the route is empty)
+        """
+        index, distance = self.route.get_closest_index(location, self.index, self._window, self._planar)
+        if index != -1:
+            self.index = index
+        return index, distance
+
+
+class RouteProgressTracker(object):
+
+    """
+    Tracks the progress of an actor along a CompiledRoute with a monotonic cursor, answering
+    along-route distance queries in amortized O(1). It is shared by all the conditions watching
+    the same actor and route (see CarlaDataProvider.get_route_progress), and updated once per frame.
+
+    Distances only use x and y, as get_distance_along_route does.
+
+    Args:
+        route (CompiledRoute): The route
+        window (int): Amount of points after the current one checked per step
+        max_deviation (float): Distance to the route above which the actor is considered outside of it [m]
+
+    Attributes:
+        index (int): Index of the route point closest to the actor, -1 until the first update
+    """
+
+    def __init__(self, route, window=10, max_deviation=10.0):
+        self.route = route
+        self.index = -1
+        self._window = window
+        self._max_deviation = max_deviation
+        self._frame = None
+        self._result = (route.planar_accumulated_distances[-1] if len(route) else 0.0, False)
+
+    def _advance(self, location):
+        """
+        Move the cursor forward to the route point closest to the location. The first time,
+        the whole route is checked. Afterwards, the window slides forward while the closest
+        point is at its end, so that each point is only visited a bounded amount of times
+        """
+        if self.index == -1:
+            return self.route.get_closest_index(location, 0, len(self.route), planar=True)
+
+        index, distance = self.route.get_closest_index(location, self.index, self._window, planar=True)
+        while index == self.index + self._window and index < len(self.route) - 1:
+            self.index = index
+            index, distance = self.route.get_closest_index(location, index, self._window, planar=True)
+        return index, distance
+
+    def update(self, location):
+        """
+        Update the cursor with the location of the actor. Further calls at the same frame are ignored.
+        returns the distance of the location along the route and whether it is close enough
+        to the route, the route length being returned otherwise (as get_distance_along_route)
+        """
+        frame = GameTime.get_frame()
+        if frame == self._frame and self.index != -1:
+            return self._result
+        self._frame = frame
+
+        index, deviation = self._advance(location)
+        if index == -1:
+            return self._result
+        self.index = index
+
+        distances = self.route.planar_accumulated_distances
+        if deviation > self._max_deviation:
+            self._result = (float(distances[-1]), False)
+            return self._result
+
+        # Project the location on the route segment it is at, around the closest point
+        positions = self.route.positions[:, :2]
+        offset = np.array((location.x, location.y)) - positions[index]
+        lower = max(index - 1, 0)
+        upper = min(index + 1, len(self.route) - 1)
+        segment = positions[upper] - positions[index]
+        if upper == index or np.dot(offset, segment) < 0:
+            segment = positions[index] - positions[lower]
+        length = np.linalg.norm(segment)
+        projection = np.dot(offset, segment) / length if length > 0 else 0.0
+
+        distance = min(max(distances[index] + projection, distances[lower]), distances[upper])
+        self._result = (float(distance), True)
+        return self._result
+
+
+def compile_route(route, carla_map):
+    """
+    Get the CompiledRoute of a route. Already compiled routes are returned as they are,
+    and the last COMPILED_ROUTE_CACHE_SIZE route lists compiled are reused
+    :param route: list of (carla.Transform or carla.Location, RoadOption), or a CompiledRoute
+    :param carla_map: the CARLA map
+    """
+    if isinstance(route, CompiledRoute):
+        return route
+
+    for i, (source, compiled) in enumerate(_compiled_routes):
+        if source is route:
+            _compiled_routes.append(_compiled_routes.pop(i))
+            return compiled
+
+    compiled = CompiledRoute(route, carla_map)
+    register_compiled_route(route, compiled)
+    return compiled
+
+
+def register_compiled_route(route, compiled):
+    """
+    Make compile_route return an already compiled route for the given route list,
+    e.g. for a list of locations derived from the compiled one
+    """
+    _compiled_routes.append((route, compiled))
+    while len(_compiled_routes) > COMPILED_ROUTE_CACHE_SIZE:
+        _compiled_routes.pop(0)
+
+
+def clear_compiled_routes():
+    """
+    Forget all compiled route lists
+    """
+    del _compiled_routes[:]
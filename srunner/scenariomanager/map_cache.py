@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides an on-disk cache for data derived from a CARLA map,
+stored as NumPy files and identified by town and OpenDRIVE hash
+"""
+
+from __future__ import print_function
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# Directory of the on-disk cache of map data. An empty value disables the cache
+MAP_CACHE_DIR = os.getenv('SCENARIO_RUNNER_MAP_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'scenario_runner', 'maps'))
+
+_last_map_hash = (None, None)
+
+
+def get_map_hash(carla_map):
+    """
+    Get the hash of the OpenDRIVE content of a map. The hash of the last given map is memoized
+    :param carla_map: the CARLA map
+    :return: hexadecimal MD5 digest of the OpenDRIVE file
+    """
+    global _last_map_hash  # pylint: disable=global-statement
+
+    if _last_map_hash[0] is not carla_map:
+        xodr = carla_map.to_opendrive()
+        if not isinstance(xodr, bytes):
+            xodr = xodr.encode('utf-8')
+        _last_map_hash = (carla_map, hashlib.md5(xodr).hexdigest())
+    return _last_map_hash[1]
+
+
+def clear_map_hash():
+    """
+    Forget the memoized hash of the last map
+    """
+    global _last_map_hash  # pylint: disable=global-statement
+
+    _last_map_hash = (None, None)
+
+
+def get_map_cache_path(carla_map, name):
+    """
+    Get the cache file of the given data of a map
+    :param carla_map: the CARLA map
+    :param name: name of the cached data
+    :return: path of the file, None if the cache is disabled
+    """
+    if not MAP_CACHE_DIR:
+        return None
+
+    town = os.path.basename(carla_map.name)
+    return os.path.join(MAP_CACHE_DIR, "{}_{}_{}.npy".format(town, get_map_hash(carla_map), name))
+
+
+def load_cached_array(path, dtype):
+    """
+    Load a NumPy array from the cache, using memory mapping
+    :param path: path of the file
+    :param dtype: expected dtype of the array
+    :return: the array, None if it is not cached or has a different dtype
+    """
+    if path is None or not os.path.isfile(path):
+        return None
+
+    try:
+        data = np.load(path, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        return None
+    if data.dtype != dtype:
+        return None
+
+    return data
+
+
+def save_cached_array(path, data):
+    """
+    Store a NumPy array in the cache. The file is written to a temporary location and then renamed,
+    so that parallel runs never read a partially written file
+    :param path: path of the file, nothing is stored if it is None
+    :param data: the array
+    """
+    if path is None:
+        return
+
+    directory = os.path.dirname(path)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        file_descriptor, temp_path = tempfile.mkstemp(suffix='.npy', dir=directory)
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            np.save(temp_file, data)
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # The data was already stored by another run (renaming onto it fails on Windows)
+            os.remove(temp_path)
+    except (IOError, OSError) as e:
+        print("Could not store {} at the cache: {}".format(os.path.basename(path), e))
@@ -19,6 +19,7 @@ import py_trees
 from srunner.autoagents.agent_wrapper import AgentWrapper
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
 from srunner.scenariomanager.result_writer import ResultOutputProvider
+from srunner.scenariomanager.scheduler import DormantNodeScheduler
 from srunner.scenariomanager.timer import GameTime
 from srunner.scenariomanager.watchdog import Watchdog
 
@@ -76,6 +77,7 @@ class ScenarioManager(object):
         self.start_system_time = None
         self.end_system_time = None
         GameTime.restart()
+        DormantNodeScheduler.reset()
 
     def cleanup(self):
         """
@@ -124,13 +126,14 @@ class ScenarioManager(object):
 
         while self._running:
             timestamp = None
+            snapshot = None
             world = CarlaDataProvider.get_world()
             if world:
                 snapshot = world.get_snapshot()
                 if snapshot:
                     timestamp = snapshot.timestamp
             if timestamp:
-                self._tick_scenario(timestamp)
+                self._tick_scenario(timestamp, snapshot)
 
         self._watchdog.stop()
 
@@ -146,10 +149,17 @@ class ScenarioManager(object):
         if self.scenario_tree.status == py_trees.common.Status.FAILURE:
             print("ScenarioManager: Terminated due to failure")
 
-    def _tick_scenario(self, timestamp):
+        if self._debug_mode:
+            print("ScenarioManager: Longest tick took {:.3f} s (watchdog budget: {:.1f} s)".format(
+                self._watchdog.get_max_tick_time(), self._watchdog.get_budget()))
+            print("ScenarioManager: {} evaluations of dormant nodes skipped".format(
+                DormantNodeScheduler.get_skipped_nodes(total=True)))
+
+    def _tick_scenario(self, timestamp, snapshot=None):
         """
         Run next tick of scenario and the agent.
         If running synchornously, it also handles the ticking of the world.
+        If given, the world snapshot is used to update the actor information without further calls to CARLA.
         """
 
         if self._timestamp_last_run < timestamp.elapsed_seconds and self._running:
@@ -159,10 +169,16 @@ class ScenarioManager(object):
 
             if self._debug_mode:
                 print("\n--------- Tick ---------\n")
+                print("Watchdog: {:.3f} s since the last tick (budget: {:.1f} s)".format(
+                    self._watchdog.get_tick_time(), self._watchdog.get_budget()))
 
             # Update game time and actor information
             GameTime.on_carla_tick(timestamp)
-            CarlaDataProvider.on_carla_tick()
+            CarlaDataProvider.on_carla_tick(snapshot)
+
+            if self._debug_mode:
+                print("CarlaDataProvider: {} calls to CARLA saved using the world snapshot".format(
+                    CarlaDataProvider.get_rpcs_saved()))
 
             if self._agent is not None:
                 ego_action = self._agent()
@@ -171,9 +187,12 @@ class ScenarioManager(object):
                 self.ego_vehicles[0].apply_control(ego_action)
 
             # Tick scenario
+            DormantNodeScheduler.start_tick()
             self.scenario_tree.tick_once()
 
             if self._debug_mode:
+                print("DormantNodeScheduler: {} dormant nodes skipped".format(
+                    DormantNodeScheduler.get_skipped_nodes()))
                 print("\n")
                 py_trees.display.print_ascii_tree(self.scenario_tree, show_status=True)
                 sys.stdout.flush()
@@ -31,14 +31,15 @@ import networkx
 import carla
 from agents.navigation.basic_agent import BasicAgent, LocalPlanner
 from agents.navigation.local_planner import RoadOption
-from agents.navigation.global_route_planner import GlobalRoutePlanner
-from agents.navigation.global_route_planner_dao import GlobalRoutePlannerDAO
 
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.compiled_route import RouteCursor, compile_route
 from srunner.scenariomanager.actorcontrols.actor_control import ActorControl
+from srunner.scenariomanager.scheduler import DormancyGate
 from srunner.scenariomanager.timer import GameTime
 from srunner.tools.scenario_helper import detect_lane_obstacle
 from srunner.tools.scenario_helper import generate_target_waypoint_list_multilane
+from srunner.tools.route_manipulation import get_global_route_planner
 
 
 import srunner.tools
@@ -254,7 +255,7 @@ class ChangeRoadFriction(AtomicBehavior):
             py_trees.common.Status.SUCCESS
         """
 
-        for actor in CarlaDataProvider.get_world().get_actors().filter('static.trigger.friction'):
+        for actor in CarlaDataProvider.get_world_actors('static.trigger.friction'):
             actor.destroy()
 
         friction_bp = CarlaDataProvider.get_world().get_blueprint_library().find('static.trigger.friction')
@@ -757,9 +758,7 @@ class ChangeActorWaypoints(AtomicBehavior):
 
         # Obtain final route, considering the routing option
         # At the moment everything besides "shortest" will use the CARLA GlobalPlanner
-        dao = GlobalRoutePlannerDAO(CarlaDataProvider.get_world().get_map(), 2.0)
-        grp = GlobalRoutePlanner(dao)
-        grp.setup()
+        grp = get_global_route_planner(CarlaDataProvider.get_world().get_map(), 2.0)
         route = []
         for i, _ in enumerate(carla_route_elements):
             if carla_route_elements[i][1] == "shortest":
@@ -2325,29 +2324,17 @@ class ActorSource(AtomicBehavior):
         Setup class members
         """
         super(ActorSource, self).__init__(name)
-        self._world = CarlaDataProvider.get_world()
         self._actor_types = actor_type_list
         self._spawn_point = transform
         self._threshold = threshold
         self._queue = Blackboard().get(blackboard_queue_name)
         self._actor_limit = actor_limit
-        self._last_blocking_actor = None
 
     def update(self):
         new_status = py_trees.common.Status.RUNNING
         if self._actor_limit > 0:
-            world_actors = self._world.get_actors()
-            spawn_point_blocked = False
-            if (self._last_blocking_actor and
-                    self._spawn_point.location.distance(self._last_blocking_actor.get_location()) < self._threshold):
-                spawn_point_blocked = True
-
-            if not spawn_point_blocked:
-                for actor in world_actors:
-                    if self._spawn_point.location.distance(actor.get_location()) < self._threshold:
-                        spawn_point_blocked = True
-                        self._last_blocking_actor = actor
-                        break
+            spawn_point_blocked = bool(
+                CarlaDataProvider.query_radius(self._spawn_point.location, self._threshold))
 
             if not spawn_point_blocked:
                 try:
@@ -2752,9 +2739,8 @@ class ScenarioTriggerer(AtomicBehavior):
         self._blackboard_list = blackboard_list
         self._triggered_scenarios = []  # List of already done scenarios
 
-        self._current_index = 0
-        self._route_length = len(self._route)
-        self._waypoints, _ = zip(*self._route)
+        self._compiled_route = compile_route(self._route, self._map)
+        self._cursor = RouteCursor(self._compiled_route, self.WINDOWS_SIZE)
 
     def update(self):
         new_status = py_trees.common.Status.RUNNING
@@ -2763,28 +2749,13 @@ class ScenarioTriggerer(AtomicBehavior):
         if location is None:
             return new_status
 
-        lower_bound = self._current_index
-        upper_bound = min(self._current_index + self.WINDOWS_SIZE + 1, self._route_length)
-
-        shortest_distance = float('inf')
-        closest_index = -1
-
-        for index in range(lower_bound, upper_bound):
-            ref_waypoint = self._waypoints[index]
-            ref_location = ref_waypoint.location
-
-            dist_to_route = ref_location.distance(location)
-            if dist_to_route <= shortest_distance:
-                closest_index = index
-                shortest_distance = dist_to_route
+        # Update the ego position at the route
+        closest_index, shortest_distance = self._cursor.update(location)
 
         if closest_index == -1 or shortest_distance == float('inf'):
             return new_status
 
-        # Update the ego position at the route
-        self._current_index = closest_index
-
-        route_location = self._waypoints[closest_index].location
+        route_location = self._compiled_route.locations[closest_index]
 
         # Check which scenarios can be triggered
         blackboard = py_trees.blackboard.Blackboard()
@@ -2821,3 +2792,103 @@ class ScenarioTriggerer(AtomicBehavior):
                     )
 
         return new_status
+
+
+class LazyScenario(AtomicBehavior):
+
+    """
+    Builds a scenario of a route only once the ego vehicle is close to its trigger point,
+    runs its behavior and removes the scenario (and its actors) once the behavior ends.
+
+    Important parameters:
+    - actor: The ego vehicle
+    - route: Route of the ego vehicle (list of route points or CompiledRoute)
+    - trigger_location: Trigger point of the scenario
+    - distance: The scenario is built when the ego vehicle is closer than this distance
+      along the route to the trigger point [m]
+    - scenario_factory: Function building and returning the scenario (a BasicScenario), None if it fails
+
+    The behavior keeps running until the behavior of the scenario ends, with its status. The behavior
+    of the scenario is gated on its own (see DormancyGate). If the scenario cannot be built, or the ego vehicle leaves its trigger point behind by more than
+    the distance before it is built, the behavior ends with SUCCESS. Once ended, it keeps its status
+    """
+
+    def __init__(self, actor, route, trigger_location, distance, scenario_factory, name="LazyScenario"):
+        """
+        Setup class members
+        """
+        super(LazyScenario, self).__init__(name)
+        self._ego_vehicle = actor
+        self._distance = distance
+        self._scenario_factory = scenario_factory
+        self._scenario = None
+        self._gate = None
+        self._final_status = None
+
+        compiled_route = compile_route(route, CarlaDataProvider.get_map())
+        index, _ = compiled_route.get_closest_index(trigger_location, 0, len(compiled_route), planar=True)
+        self._trigger_distance = compiled_route.planar_accumulated_distances[index] if index != -1 else 0.0
+        self._progress = CarlaDataProvider.get_route_progress(actor, compiled_route)
+
+    def update(self):
+        """
+        Build the scenario if the ego vehicle is close enough and tick its behavior
+        """
+        if self._final_status is not None:
+            return self._final_status
+
+        if self._scenario is None:
+            location = CarlaDataProvider.get_location(self._ego_vehicle)
+            if location is None:
+                return py_trees.common.Status.RUNNING
+
+            ego_distance, found = self._progress.update(location)
+            if not found or self._trigger_distance - ego_distance > self._distance:
+                return py_trees.common.Status.RUNNING
+
+            scenario = None
+            if self._trigger_distance - ego_distance >= -self._distance:
+                # The world must not be ticked in the middle of a tick of the ScenarioManager. Until its next
+                # tick, the CarlaDataProvider gives the new actors their spawn transforms. The behavior starts then
+                with CarlaDataProvider.deferred_spawn(tick=False):
+                    scenario = self._scenario_factory()
+            if scenario is None or scenario.scenario.behavior is None:
+                self._final_status = py_trees.common.Status.SUCCESS
+                return self._final_status
+            self._scenario = scenario
+            self._gate = DormancyGate(scenario.scenario.behavior)
+            return py_trees.common.Status.RUNNING
+
+        self._gate.tick_once()
+        if self._gate.status == py_trees.common.Status.RUNNING:
+            return py_trees.common.Status.RUNNING
+
+        self._final_status = self._gate.status
+        self.remove_scenario()
+        return self._final_status
+
+    def remove_scenario(self):
+        """
+        Stop the behavior of the scenario, if it is running, and remove its actors
+        """
+        if self._scenario is None:
+            return
+
+        if self._gate.status == py_trees.common.Status.RUNNING:
+            self._gate.stop(py_trees.common.Status.INVALID)
+
+        # Actors already destroyed by the scenario itself are no longer part of the actor pool
+        actor_ids = [actor.id for actor in self._scenario.other_actors if actor is not None]
+        self._scenario.remove_all_actors()
+        for actor_id in actor_ids:
+            CarlaDataProvider.unregister_actor(actor_id)
+        self._scenario = None
+        self._gate = None
+
+    def terminate(self, new_status):
+        """
+        Remove the scenario if the behavior is interrupted
+        """
+        if new_status == py_trees.common.Status.INVALID:
+            self.remove_scenario()
+        super(LazyScenario, self).terminate(new_status)
@@ -19,13 +19,15 @@ import weakref
 import math
 import numpy as np
 import py_trees
-import shapely
 
 import carla
 
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.compiled_route import RouteCursor, compile_route
 from srunner.scenariomanager.timer import GameTime
 from srunner.scenariomanager.traffic_events import TrafficEvent, TrafficEventType
+from srunner.scenariomanager.traffic_sign_geometry import rotate_point
+from srunner.tools.geometry import points_inside_box, segments_intersect
 
 
 class Criterion(py_trees.behaviour.Behaviour):
@@ -96,6 +98,7 @@ class MaxVelocityTest(Criterion):
         Setup actor and maximum allowed velovity
         """
         super(MaxVelocityTest, self).__init__(name, actor, max_velocity_allowed, None, optional)
+        CarlaDataProvider.subscribe(self.actor, ('velocity',))
 
     def update(self):
         """
@@ -147,10 +150,11 @@ class DrivenDistanceTest(Criterion):
         Setup actor
         """
         super(DrivenDistanceTest, self).__init__(name, actor, distance_success, distance_acceptable, optional)
-        self._last_location = None
+        self._start_distance = None
+        CarlaDataProvider.subscribe(self.actor, ('history',))
 
     def initialise(self):
-        self._last_location = CarlaDataProvider.get_location(self.actor)
+        self._start_distance = None
         super(DrivenDistanceTest, self).initialise()
 
     def update(self):
@@ -162,17 +166,15 @@ class DrivenDistanceTest(Criterion):
         if self.actor is None:
             return new_status
 
-        location = CarlaDataProvider.get_location(self.actor)
+        history = CarlaDataProvider.get_history(self.actor)
 
-        if location is None:
+        if history is None:
             return new_status
 
-        if self._last_location is None:
-            self._last_location = location
-            return new_status
+        if self._start_distance is None:
+            self._start_distance = history.get_distance()
 
-        self.actual_value += location.distance(self._last_location)
-        self._last_location = location
+        self.actual_value = history.get_distance() - self._start_distance
 
         if self.actual_value > self.expected_value_success:
             self.test_status = "SUCCESS"
@@ -226,11 +228,11 @@ class AverageVelocityTest(Criterion):
                                                   avg_velocity_success,
                                                   avg_velocity_acceptable,
                                                   optional)
-        self._last_location = None
-        self._distance = 0.0
+        self._start_distance = None
+        CarlaDataProvider.subscribe(self.actor, ('history',))
 
     def initialise(self):
-        self._last_location = CarlaDataProvider.get_location(self.actor)
+        self._start_distance = None
         super(AverageVelocityTest, self).initialise()
 
     def update(self):
@@ -242,21 +244,17 @@ class AverageVelocityTest(Criterion):
         if self.actor is None:
             return new_status
 
-        location = CarlaDataProvider.get_location(self.actor)
-
-        if location is None:
-            return new_status
+        history = CarlaDataProvider.get_history(self.actor)
 
-        if self._last_location is None:
-            self._last_location = location
+        if history is None:
             return new_status
 
-        self._distance += location.distance(self._last_location)
-        self._last_location = location
+        if self._start_distance is None:
+            self._start_distance = history.get_distance()
 
         elapsed_time = GameTime.get_time()
         if elapsed_time > 0.0:
-            self.actual_value = self._distance / elapsed_time
+            self.actual_value = (history.get_distance() - self._start_distance) / elapsed_time
 
         if self.actual_value > self.expected_value_success:
             self.test_status = "SUCCESS"
@@ -318,6 +316,7 @@ class CollisionTest(Criterion):
         self.registered_collisions = []
         self.last_id = None
         self.collision_time = None
+        CarlaDataProvider.subscribe(self.actor, ('transform',))
 
     def update(self):
         """
@@ -459,6 +458,7 @@ class ActorSpeedAboveThresholdTest(Criterion):
         self._speed_threshold = speed_threshold
         self._below_threshold_max_time = below_threshold_max_time
         self._time_last_valid_state = None
+        CarlaDataProvider.subscribe(self._actor, ('transform', 'velocity'))
 
     def update(self):
         """
@@ -593,6 +593,7 @@ class ReachedRegionTest(Criterion):
         self._max_x = max_x
         self._min_y = min_y
         self._max_y = max_y
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -650,6 +651,7 @@ class OffRoadTest(Criterion):
         self._duration = duration
         self._prev_time = None
         self._time_offroad = 0
+        CarlaDataProvider.subscribe(self.actor, ('transform',))
 
     def update(self):
         """
@@ -666,11 +668,11 @@ class OffRoadTest(Criterion):
         current_location = CarlaDataProvider.get_location(self.actor)
 
         # Get the waypoint at the current location to see if the actor is offroad
-        drive_waypoint = self._map.get_waypoint(
+        drive_waypoint = CarlaDataProvider.get_waypoint(
             current_location,
             project_to_road=False
         )
-        park_waypoint = self._map.get_waypoint(
+        park_waypoint = CarlaDataProvider.get_waypoint(
             current_location,
             project_to_road=False,
             lane_type=carla.LaneType.Parking
@@ -730,6 +732,7 @@ class EndofRoadTest(Criterion):
         self._start_time = None
         self._time_end_road = 0
         self._road_id = None
+        CarlaDataProvider.subscribe(self.actor, ('transform',))
 
     def update(self):
         """
@@ -743,7 +746,7 @@ class EndofRoadTest(Criterion):
         new_status = py_trees.common.Status.RUNNING
 
         current_location = CarlaDataProvider.get_location(self.actor)
-        current_waypoint = self._map.get_waypoint(current_location)
+        current_waypoint = CarlaDataProvider.get_waypoint(current_location)
 
         # Get the current road id
         if self._road_id is None:
@@ -806,6 +809,7 @@ class OnSidewalkTest(Criterion):
         self._duration = duration
         self._prev_time = None
         self._time_outside_lanes = 0
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -826,7 +830,7 @@ class OnSidewalkTest(Criterion):
         # Some of the vehicle parameters
         current_tra = CarlaDataProvider.get_transform(self._actor)
         current_loc = current_tra.location
-        current_wp = self._map.get_waypoint(current_loc, lane_type=carla.LaneType.Any)
+        current_wp = CarlaDataProvider.get_waypoint(current_loc, lane_type=carla.LaneType.Any)
 
         # Case 1) Car center is at a sidewalk
         if current_wp.lane_type == carla.LaneType.Sidewalk:
@@ -855,10 +859,10 @@ class OnSidewalkTest(Criterion):
                 current_loc + carla.Location(-1 * x_boundary_vector + y_boundary_vector)]
 
             bbox_wp = [
-                self._map.get_waypoint(bbox[0], lane_type=carla.LaneType.Any),
-                self._map.get_waypoint(bbox[1], lane_type=carla.LaneType.Any),
-                self._map.get_waypoint(bbox[2], lane_type=carla.LaneType.Any),
-                self._map.get_waypoint(bbox[3], lane_type=carla.LaneType.Any)]
+                CarlaDataProvider.get_waypoint(bbox[0], lane_type=carla.LaneType.Any),
+                CarlaDataProvider.get_waypoint(bbox[1], lane_type=carla.LaneType.Any),
+                CarlaDataProvider.get_waypoint(bbox[2], lane_type=carla.LaneType.Any),
+                CarlaDataProvider.get_waypoint(bbox[3], lane_type=carla.LaneType.Any)]
 
             # Case 2.1) Not quite outside yet
             if bbox_wp[0].lane_type == (carla.LaneType.Driving or carla.LaneType.Parking) \
@@ -1063,10 +1067,9 @@ class OutsideRouteLanesTest(Criterion):
         self._actor = actor
         self._route = route
         self._current_index = 0
-        self._route_length = len(self._route)
-        self._waypoints, _ = zip(*self._route)
 
         self._map = CarlaDataProvider.get_map()
+        self._compiled_route = compile_route(self._route, self._map)
         self._pre_ego_waypoint = self._map.get_waypoint(self._actor.get_location())
 
         self._outside_lane_active = False
@@ -1075,6 +1078,7 @@ class OutsideRouteLanesTest(Criterion):
         self._last_lane_id = None
         self._total_distance = 0
         self._wrong_distance = 0
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -1102,30 +1106,20 @@ class OutsideRouteLanesTest(Criterion):
         if self._outside_lane_active or self._wrong_lane_active:
             self.test_status = "FAILURE"
 
-        # 2) Get the traveled distance
-        for index in range(self._current_index + 1,
-                           min(self._current_index + self.WINDOWS_SIZE + 1, self._route_length)):
-            # Get the dot product to know if it has passed this location
-            index_location = self._waypoints[index]
-            index_waypoint = self._map.get_waypoint(index_location)
-
-            wp_dir = index_waypoint.transform.get_forward_vector()  # Waypoint's forward vector
-            wp_veh = location - index_location  # vector waypoint - vehicle
-            dot_ve_wp = wp_veh.x * wp_dir.x + wp_veh.y * wp_dir.y + wp_veh.z * wp_dir.z
+        # 2) Get the traveled distance (the dot product tells if it has passed each location)
+        positions = self._compiled_route.positions
+        for index in self._compiled_route.get_passed_indices(location, self._current_index + 1,
+                                                             self._current_index + self.WINDOWS_SIZE + 1).tolist():
+            # Get the distance traveled
+            new_dist = float(np.linalg.norm(positions[index] - positions[self._current_index]))
 
-            if dot_ve_wp > 0:
-                # Get the distance traveled
-                index_location = self._waypoints[index]
-                current_index_location = self._waypoints[self._current_index]
-                new_dist = current_index_location.distance(index_location)
+            # Add it to the total distance
+            self._current_index = index
+            self._total_distance += new_dist
 
-                # Add it to the total distance
-                self._current_index = index
-                self._total_distance += new_dist
-
-                # And to the wrong one if outside route lanes
-                if self._outside_lane_active or self._wrong_lane_active:
-                    self._wrong_distance += new_dist
+            # And to the wrong one if outside route lanes
+            if self._outside_lane_active or self._wrong_lane_active:
+                self._wrong_distance += new_dist
 
         self.logger.debug("%s.update()[%s->%s]" % (self.__class__.__name__, self.status, new_status))
 
@@ -1136,8 +1130,8 @@ class OutsideRouteLanesTest(Criterion):
         Detects if the ego_vehicle is outside driving lanes
         """
 
-        current_driving_wp = self._map.get_waypoint(location, lane_type=carla.LaneType.Driving, project_to_road=True)
-        current_parking_wp = self._map.get_waypoint(location, lane_type=carla.LaneType.Parking, project_to_road=True)
+        current_driving_wp = CarlaDataProvider.get_waypoint(location, lane_type=carla.LaneType.Driving)
+        current_parking_wp = CarlaDataProvider.get_waypoint(location, lane_type=carla.LaneType.Parking)
 
         driving_distance = location.distance(current_driving_wp.transform.location)
         if current_parking_wp is not None:  # Some towns have no parking
@@ -1159,7 +1153,7 @@ class OutsideRouteLanesTest(Criterion):
         Detects if the ego_vehicle has invaded a wrong lane
         """
 
-        current_waypoint = self._map.get_waypoint(location, lane_type=carla.LaneType.Driving, project_to_road=True)
+        current_waypoint = CarlaDataProvider.get_waypoint(location, lane_type=carla.LaneType.Driving)
         current_lane_id = current_waypoint.lane_id
         current_road_id = current_waypoint.road_id
 
@@ -1260,6 +1254,7 @@ class WrongLaneTest(Criterion):
         self._actor_location = self._actor.get_location()
         self._previous_lane_waypoint = self._map.get_waypoint(self._actor.get_location())
         self._wrong_lane_start_location = None
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -1271,7 +1266,8 @@ class WrongLaneTest(Criterion):
         if self._terminate_on_failure and (self.test_status == "FAILURE"):
             new_status = py_trees.common.Status.FAILURE
 
-        lane_waypoint = self._map.get_waypoint(self._actor.get_location())
+        location = CarlaDataProvider.get_location(self._actor)
+        lane_waypoint = CarlaDataProvider.get_waypoint(location)
         current_lane_id = lane_waypoint.lane_id
         current_road_id = lane_waypoint.road_id
 
@@ -1322,14 +1318,14 @@ class WrongLaneTest(Criterion):
                     self.test_status = "FAILURE"
                     self._in_lane = False
                     self.actual_value += 1
-                    self._wrong_lane_start_location = self._actor.get_location()
+                    self._wrong_lane_start_location = location
 
         # Keep adding "meters" to the counter
-        distance_vector = self._actor.get_location() - self._actor_location
+        distance_vector = location - self._actor_location
         distance = math.sqrt(math.pow(distance_vector.x, 2) + math.pow(distance_vector.y, 2))
 
         if distance >= 0.02:  # Used to avoid micro-changes adding add to considerable sums
-            self._actor_location = CarlaDataProvider.get_location(self._actor)
+            self._actor_location = location
 
             if not self._in_lane and not lane_waypoint.is_junction:
                 self._wrong_distance += distance
@@ -1424,6 +1420,7 @@ class InRadiusRegionTest(Criterion):
         self._x = x     # pylint: disable=invalid-name
         self._y = y     # pylint: disable=invalid-name
         self._radius = radius
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -1484,27 +1481,15 @@ class InRouteTest(Criterion):
             self._offroad_min = self._offroad_min
 
         self._world = CarlaDataProvider.get_world()
-        self._waypoints, _ = zip(*self._route)
-        self._route_length = len(self._route)
-        self._current_index = 0
+        self._compiled_route = compile_route(self._route, CarlaDataProvider.get_map())
+        self._cursor = RouteCursor(self._compiled_route, self.WINDOWS_SIZE, planar=True)
         self._out_route_distance = 0
         self._in_safe_route = True
 
-        self._accum_meters = []
-        prev_wp = self._waypoints[0]
-        for i, wp in enumerate(self._waypoints):
-            d = wp.distance(prev_wp)
-            if i > 0:
-                accum = self._accum_meters[i - 1]
-            else:
-                accum = 0
-
-            self._accum_meters.append(d + accum)
-            prev_wp = wp
-
         # Blackboard variable
         blackv = py_trees.blackboard.Blackboard()
         _ = blackv.set("InRoute", True)
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -1523,17 +1508,9 @@ class InRouteTest(Criterion):
 
             off_route = True
 
-            shortest_distance = float('inf')
-            closest_index = -1
-
             # Get the closest distance
-            for index in range(self._current_index,
-                               min(self._current_index + self.WINDOWS_SIZE + 1, self._route_length)):
-                ref_waypoint = self._waypoints[index]
-                distance = math.sqrt(((location.x - ref_waypoint.x) ** 2) + ((location.y - ref_waypoint.y) ** 2))
-                if distance <= shortest_distance:
-                    closest_index = index
-                    shortest_distance = distance
+            current_index = self._cursor.index
+            closest_index, shortest_distance = self._cursor.update(location)
 
             if closest_index == -1 or shortest_distance == float('inf'):
                 return new_status
@@ -1544,19 +1521,17 @@ class InRouteTest(Criterion):
                 self._in_safe_route = bool(shortest_distance < self._offroad_min)
 
             # If actor advanced a step, record the distance
-            if self._current_index != closest_index:
+            if current_index != closest_index:
 
-                new_dist = self._accum_meters[closest_index] - self._accum_meters[self._current_index]
+                new_dist = self._compiled_route.get_distance(current_index, closest_index)
 
                 # If too far from the route, add it and check if its value
                 if not self._in_safe_route:
                     self._out_route_distance += new_dist
-                    out_route_percentage = 100 * self._out_route_distance / self._accum_meters[-1]
+                    out_route_percentage = 100 * self._out_route_distance / self._compiled_route.length
                     if out_route_percentage > self.MAX_ROUTE_PERCENTAGE:
                         off_route = True
 
-                self._current_index = closest_index
-
             if off_route:
                 # Blackboard variable
                 blackv = py_trees.blackboard.Blackboard()
@@ -1608,25 +1583,13 @@ class RouteCompletionTest(Criterion):
 
         self._wsize = self.WINDOWS_SIZE
         self._current_index = 0
-        self._route_length = len(self._route)
-        self._waypoints, _ = zip(*self._route)
-        self.target = self._waypoints[-1]
-
-        self._accum_meters = []
-        prev_wp = self._waypoints[0]
-        for i, wp in enumerate(self._waypoints):
-            d = wp.distance(prev_wp)
-            if i > 0:
-                accum = self._accum_meters[i - 1]
-            else:
-                accum = 0
-
-            self._accum_meters.append(d + accum)
-            prev_wp = wp
+        self._compiled_route = compile_route(self._route, self._map)
+        self.target = self._compiled_route.locations[-1]
 
         self._traffic_event = TrafficEvent(event_type=TrafficEventType.ROUTE_COMPLETION)
         self.list_traffic_events.append(self._traffic_event)
         self._percentage_route_completed = 0.0
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -1643,24 +1606,19 @@ class RouteCompletionTest(Criterion):
 
         elif self.test_status == "RUNNING" or self.test_status == "INIT":
 
-            for index in range(self._current_index, min(self._current_index + self._wsize + 1, self._route_length)):
-                # Get the dot product to know if it has passed this location
-                ref_waypoint = self._waypoints[index]
-                wp = self._map.get_waypoint(ref_waypoint)
-                wp_dir = wp.transform.get_forward_vector()          # Waypoint's forward vector
-                wp_veh = location - ref_waypoint                    # vector waypoint - vehicle
-                dot_ve_wp = wp_veh.x * wp_dir.x + wp_veh.y * wp_dir.y + wp_veh.z * wp_dir.z
-
-                if dot_ve_wp > 0:
-                    # good! segment completed!
-                    self._current_index = index
-                    self._percentage_route_completed = 100.0 * float(self._accum_meters[self._current_index]) \
-                        / float(self._accum_meters[-1])
-                    self._traffic_event.set_dict({
-                        'route_completed': self._percentage_route_completed})
-                    self._traffic_event.set_message(
-                        "Agent has completed > {:.2f}% of the route".format(
-                            self._percentage_route_completed))
+            # Get the dot product to know if it has passed these locations
+            passed_indices = self._compiled_route.get_passed_indices(location, self._current_index,
+                                                                     self._current_index + self._wsize + 1)
+            if len(passed_indices):
+                # good! segment completed!
+                self._current_index = int(passed_indices[-1])
+                self._percentage_route_completed = 100.0 * float(
+                    self._compiled_route.accumulated_distances[self._current_index]) / self._compiled_route.length
+                self._traffic_event.set_dict({
+                    'route_completed': self._percentage_route_completed})
+                self._traffic_event.set_message(
+                    "Agent has completed > {:.2f}% of the route".format(
+                        self._percentage_route_completed))
 
             if self._percentage_route_completed > 99.0 and location.distance(self.target) < self.DISTANCE_THRESHOLD:
                 route_completion_event = TrafficEvent(event_type=TrafficEventType.ROUTE_COMPLETED)
@@ -1707,27 +1665,20 @@ class RunningRedLightTest(Criterion):
         self._actor = actor
         self._world = actor.get_world()
         self._map = CarlaDataProvider.get_map()
-        self._list_traffic_lights = []
+        self._traffic_light_index = CarlaDataProvider.get_traffic_light_index()
         self._last_red_light_id = None
         self.actual_value = 0
         self.debug = False
-
-        all_actors = self._world.get_actors()
-        for _actor in all_actors:
-            if 'traffic_light' in _actor.type_id:
-                center, waypoints = self.get_traffic_light_waypoints(_actor)
-                self._list_traffic_lights.append((_actor, center, waypoints))
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     # pylint: disable=no-self-use
     def is_vehicle_crossing_line(self, seg1, seg2):
         """
         check if vehicle crosses a line segment
         """
-        line1 = shapely.geometry.LineString([(seg1[0].x, seg1[0].y), (seg1[1].x, seg1[1].y)])
-        line2 = shapely.geometry.LineString([(seg2[0].x, seg2[0].y), (seg2[1].x, seg2[1].y)])
-        inter = line1.intersection(line2)
-
-        return not inter.is_empty
+        segment1 = ((seg1[0].x, seg1[0].y), (seg1[1].x, seg1[1].y))
+        segment2 = ((seg2[0].x, seg2[0].y), (seg2[1].x, seg2[1].y))
+        return bool(segments_intersect(segment1, [segment2])[0])
 
     def update(self):
         """
@@ -1748,76 +1699,66 @@ class RunningRedLightTest(Criterion):
         tail_far_pt = self.rotate_point(carla.Vector3D(-veh_extent - 1, 0.0, location.z), transform.rotation.yaw)
         tail_far_pt = location + carla.Location(tail_far_pt)
 
-        for traffic_light, center, waypoints in self._list_traffic_lights:
+        if self.debug:
+            for traffic_light, center, waypoints in self._traffic_light_index.entries:
+                self._draw_traffic_light(traffic_light, center, waypoints)
 
-            if self.debug:
-                z = 2.1
-                if traffic_light.state == carla.TrafficLightState.Red:
-                    color = carla.Color(155, 0, 0)
-                elif traffic_light.state == carla.TrafficLightState.Green:
-                    color = carla.Color(0, 155, 0)
-                else:
-                    color = carla.Color(155, 155, 0)
-                self._world.debug.draw_point(center + carla.Location(z=z), size=0.2, color=color, life_time=0.01)
-                for wp in waypoints:
-                    text = "{}.{}".format(wp.road_id, wp.lane_id)
-                    self._world.debug.draw_string(
-                        wp.transform.location + carla.Location(x=1, z=z), text, color=color, life_time=0.01)
-                    self._world.debug.draw_point(
-                        wp.transform.location + carla.Location(z=z), size=0.1, color=color, life_time=0.01)
+        tail_wp = None
+        ve_dir = transform.get_forward_vector()
 
-            center_loc = carla.Location(center)
+        # Stop lines of the red lights affecting the lane of the actor
+        candidate_lights = []
+        stop_lines = []
+        for traffic_light, center, waypoints in self._traffic_light_index.query_radius(location,
+                                                                                       self.DISTANCE_LIGHT):
 
             if self._last_red_light_id and self._last_red_light_id == traffic_light.id:
                 continue
-            if center_loc.distance(location) > self.DISTANCE_LIGHT:
-                continue
             if traffic_light.state != carla.TrafficLightState.Red:
                 continue
 
             for wp in waypoints:
 
-                tail_wp = self._map.get_waypoint(tail_far_pt)
+                if tail_wp is None:
+                    tail_wp = self._map.get_waypoint(tail_far_pt)
 
                 # Calculate the dot product (Might be unscaled, as only its sign is important)
-                ve_dir = CarlaDataProvider.get_transform(self._actor).get_forward_vector()
                 wp_dir = wp.transform.get_forward_vector()
                 dot_ve_wp = ve_dir.x * wp_dir.x + ve_dir.y * wp_dir.y + ve_dir.z * wp_dir.z
 
                 # Check the lane until all the "tail" has passed
                 if tail_wp.road_id == wp.road_id and tail_wp.lane_id == wp.lane_id and dot_ve_wp > 0:
                     # This light is red and is affecting our lane
-                    yaw_wp = wp.transform.rotation.yaw
-                    lane_width = wp.lane_width
-                    location_wp = wp.transform.location
-
-                    lft_lane_wp = self.rotate_point(carla.Vector3D(0.4 * lane_width, 0.0, location_wp.z), yaw_wp + 90)
-                    lft_lane_wp = location_wp + carla.Location(lft_lane_wp)
-                    rgt_lane_wp = self.rotate_point(carla.Vector3D(0.4 * lane_width, 0.0, location_wp.z), yaw_wp - 90)
-                    rgt_lane_wp = location_wp + carla.Location(rgt_lane_wp)
-
-                    # Is the vehicle traversing the stop line?
-                    if self.is_vehicle_crossing_line((tail_close_pt, tail_far_pt), (lft_lane_wp, rgt_lane_wp)):
-
-                        self.test_status = "FAILURE"
-                        self.actual_value += 1
-                        location = traffic_light.get_transform().location
-                        red_light_event = TrafficEvent(event_type=TrafficEventType.TRAFFIC_LIGHT_INFRACTION)
-                        red_light_event.set_message(
-                            "Agent ran a red light {} at (x={}, y={}, z={})".format(
-                                traffic_light.id,
-                                round(location.x, 3),
-                                round(location.y, 3),
-                                round(location.z, 3)))
-                        red_light_event.set_dict({
-                            'id': traffic_light.id,
-                            'x': location.x,
-                            'y': location.y,
-                            'z': location.z})
-
-                        self.list_traffic_events.append(red_light_event)
-                        self._last_red_light_id = traffic_light.id
-                        break
+                    candidate_lights.append(traffic_light)
+                    stop_lines.append(wp.stop_line)
+
+        if stop_lines:
+            # Is the vehicle traversing any of the stop lines?
+            tail_segment = ((tail_close_pt.x, tail_close_pt.y), (tail_far_pt.x, tail_far_pt.y))
+            crossing = segments_intersect(tail_segment, stop_lines)
+
+            for traffic_light, crossed in zip(candidate_lights, crossing.tolist()):
+                if not crossed or self._last_red_light_id == traffic_light.id:
+                    continue
+
+                self.test_status = "FAILURE"
+                self.actual_value += 1
+                location = traffic_light.get_transform().location
+                red_light_event = TrafficEvent(event_type=TrafficEventType.TRAFFIC_LIGHT_INFRACTION)
+                red_light_event.set_message(
+                    "Agent ran a red light {} at (x={}, y={}, z={})".format(
+                        traffic_light.id,
+                        round(location.x, 3),
+                        round(location.y, 3),
+                        round(location.z, 3)))
+                red_light_event.set_dict({
+                    'id': traffic_light.id,
+                    'x': location.x,
+                    'y': location.y,
+                    'z': location.z})
+
+                self.list_traffic_events.append(red_light_event)
+                self._last_red_light_id = traffic_light.id
 
         if self._terminate_on_failure and (self.test_status == "FAILURE"):
             new_status = py_trees.common.Status.FAILURE
@@ -1826,52 +1767,30 @@ class RunningRedLightTest(Criterion):
 
         return new_status
 
+    def _draw_traffic_light(self, traffic_light, center, waypoints):
+        """
+        Draw the state and the stop line waypoints of a traffic light
+        """
+        z = 2.1
+        if traffic_light.state == carla.TrafficLightState.Red:
+            color = carla.Color(155, 0, 0)
+        elif traffic_light.state == carla.TrafficLightState.Green:
+            color = carla.Color(0, 155, 0)
+        else:
+            color = carla.Color(155, 155, 0)
+        self._world.debug.draw_point(center + carla.Location(z=z), size=0.2, color=color, life_time=0.01)
+        for wp in waypoints:
+            text = "{}.{}".format(wp.road_id, wp.lane_id)
+            self._world.debug.draw_string(
+                wp.transform.location + carla.Location(x=1, z=z), text, color=color, life_time=0.01)
+            self._world.debug.draw_point(
+                wp.transform.location + carla.Location(z=z), size=0.1, color=color, life_time=0.01)
+
     def rotate_point(self, point, angle):
         """
         rotate a given point by a given angle
         """
-        x_ = math.cos(math.radians(angle)) * point.x - math.sin(math.radians(angle)) * point.y
-        y_ = math.sin(math.radians(angle)) * point.x + math.cos(math.radians(angle)) * point.y
-        return carla.Vector3D(x_, y_, point.z)
-
-    def get_traffic_light_waypoints(self, traffic_light):
-        """
-        get area of a given traffic light
-        """
-        base_transform = traffic_light.get_transform()
-        base_rot = base_transform.rotation.yaw
-        area_loc = base_transform.transform(traffic_light.trigger_volume.location)
-
-        # Discretize the trigger box into points
-        area_ext = traffic_light.trigger_volume.extent
-        x_values = np.arange(-0.9 * area_ext.x, 0.9 * area_ext.x, 1.0)  # 0.9 to avoid crossing to adjacent lanes
-
-        area = []
-        for x in x_values:
-            point = self.rotate_point(carla.Vector3D(x, 0, area_ext.z), base_rot)
-            point_location = area_loc + carla.Location(x=point.x, y=point.y)
-            area.append(point_location)
-
-        # Get the waypoints of these points, removing duplicates
-        ini_wps = []
-        for pt in area:
-            wpx = self._map.get_waypoint(pt)
-            # As x_values are arranged in order, only the last one has to be checked
-            if not ini_wps or ini_wps[-1].road_id != wpx.road_id or ini_wps[-1].lane_id != wpx.lane_id:
-                ini_wps.append(wpx)
-
-        # Advance them until the intersection
-        wps = []
-        for wpx in ini_wps:
-            while not wpx.is_intersection:
-                next_wp = wpx.next(0.5)[0]
-                if next_wp and not next_wp.is_intersection:
-                    wpx = next_wp
-                else:
-                    break
-            wps.append(wpx)
-
-        return area_loc, wps
+        return rotate_point(point, angle)
 
 
 class RunningStopTest(Criterion):
@@ -1895,16 +1814,12 @@ class RunningStopTest(Criterion):
         self._actor = actor
         self._world = CarlaDataProvider.get_world()
         self._map = CarlaDataProvider.get_map()
-        self._list_stop_signs = []
+        self._stop_sign_index = CarlaDataProvider.get_stop_sign_index()
         self._target_stop_sign = None
         self._stop_completed = False
         self._affected_by_stop = False
         self.actual_value = 0
-
-        all_actors = self._world.get_actors()
-        for _actor in all_actors:
-            if 'traffic.stop' in _actor.type_id:
-                self._list_stop_signs.append(_actor)
+        CarlaDataProvider.subscribe(self._actor, ('transform', 'velocity'))
 
     @staticmethod
     def point_inside_boundingbox(point, bb_center, bb_extent):
@@ -1938,14 +1853,16 @@ class RunningStopTest(Criterion):
         """
         affected = False
         # first we run a fast coarse test
-        current_location = actor.get_location()
-        stop_location = stop.get_transform().location
-        if stop_location.distance(current_location) > self.PROXIMITY_THRESHOLD:
+        current_location = CarlaDataProvider.get_location(actor)
+        entry = self._stop_sign_index.get_entry(stop.id)
+        if entry is not None:
+            _, stop_t, transformed_tv = entry
+        else:
+            stop_t = stop.get_transform()
+            transformed_tv = stop_t.transform(stop.trigger_volume.location)
+        if stop_t.location.distance(current_location) > self.PROXIMITY_THRESHOLD:
             return affected
 
-        stop_t = stop.get_transform()
-        transformed_tv = stop_t.transform(stop.trigger_volume.location)
-
         # slower and accurate test based on waypoint's horizon and geometric test
         list_locations = [current_location]
         waypoint = self._map.get_waypoint(current_location)
@@ -1959,9 +1876,9 @@ class RunningStopTest(Criterion):
                     break
                 list_locations.append(waypoint.transform.location)
 
-        for actor_location in list_locations:
-            if self.point_inside_boundingbox(actor_location, transformed_tv, stop.trigger_volume.extent):
-                affected = True
+        extent = stop.trigger_volume.extent
+        points = [(actor_location.x, actor_location.y) for actor_location in list_locations]
+        affected = bool(np.any(points_inside_box(points, (transformed_tv.x, transformed_tv.y), (extent.x, extent.y))))
 
         return affected
 
@@ -1977,7 +1894,7 @@ class RunningStopTest(Criterion):
         dot_ve_wp = ve_dir.x * wp_dir.x + ve_dir.y * wp_dir.y + ve_dir.z * wp_dir.z
 
         if dot_ve_wp > 0:  # Ignore all when going in a wrong lane
-            for stop_sign in self._list_stop_signs:
+            for stop_sign, _, _ in self._stop_sign_index.query_radius(ve_tra.location, self.PROXIMITY_THRESHOLD):
                 if self.is_actor_affected_by_stop(self._actor, stop_sign):
                     # this stop sign is affecting the vehicle
                     target_stop_sign = stop_sign
@@ -1991,7 +1908,7 @@ class RunningStopTest(Criterion):
         """
         new_status = py_trees.common.Status.RUNNING
 
-        location = self._actor.get_location()
+        location = CarlaDataProvider.get_location(self._actor)
         if location is None:
             return new_status
 
@@ -2007,7 +1924,7 @@ class RunningStopTest(Criterion):
                     self._stop_completed = True
 
             if not self._affected_by_stop:
-                stop_location = self._target_stop_sign.get_location()
+                stop_location = self._stop_sign_index.get_entry(self._target_stop_sign.id)[1].location
                 stop_extent = self._target_stop_sign.trigger_volume.extent
 
                 if self.point_inside_boundingbox(location, stop_location, stop_extent):
@@ -26,13 +26,13 @@ import math
 import py_trees
 import carla
 
-from agents.navigation.global_route_planner import GlobalRoutePlanner
-from agents.navigation.global_route_planner_dao import GlobalRoutePlannerDAO
 
 from srunner.scenariomanager.scenarioatomics.atomic_behaviors import calculate_distance
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.scheduler import MAX_ACTOR_SPEED, BlackboardWakeUp, DormantNodeScheduler, WakeUpBound
 from srunner.scenariomanager.timer import GameTime
 from srunner.tools.scenario_helper import get_distance_along_route
+from srunner.tools.route_manipulation import get_global_route_planner
 
 import srunner.tools
 
@@ -57,6 +57,7 @@ class AtomicCondition(py_trees.behaviour.Behaviour):
         super(AtomicCondition, self).__init__(name)
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
         self.name = name
+        self._wake_up = None
 
     def setup(self, unused_timeout=15):
         """
@@ -77,6 +78,35 @@ class AtomicCondition(py_trees.behaviour.Behaviour):
         """
         self.logger.debug("%s.terminate()[%s->%s]" % (self.__class__.__name__, self.status, new_status))
 
+    def tick(self):
+        """
+        Tick the condition. While it is dormant, the update is skipped and the condition keeps running
+        """
+        if self._wake_up is not None and self.status == py_trees.common.Status.RUNNING:
+            if not self._wake_up.is_reached():
+                DormantNodeScheduler.record_skip()
+                yield self
+                return
+        self._wake_up = None
+        for node in super(AtomicCondition, self).tick():
+            yield node
+
+    def sleep_until(self, wake_up):
+        """
+        Let the running condition stay dormant until the (conservative) WakeUpBound is reached.
+        To be called from update, with a bound before which the condition cannot change its status
+        """
+        if DormantNodeScheduler.is_enabled():
+            self._wake_up = wake_up
+
+    def get_wake_up(self):
+        """
+        returns the WakeUpBound of the condition if it is running and dormant, None otherwise
+        """
+        if self.status != py_trees.common.Status.RUNNING:
+            return None
+        return self._wake_up
+
 
 class InTriggerDistanceToOSCPosition(AtomicCondition):
 
@@ -108,12 +138,10 @@ class InTriggerDistanceToOSCPosition(AtomicCondition):
 
         if self._along_route:
             # Get the global route planner, used to calculate the route
-            dao = GlobalRoutePlannerDAO(self._map, 0.5)
-            grp = GlobalRoutePlanner(dao)
-            grp.setup()
-            self._grp = grp
+            self._grp = get_global_route_planner(self._map, 0.5)
         else:
             self._grp = None
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def initialise(self):
         if self._distance < 0:
@@ -176,12 +204,10 @@ class InTimeToArrivalToOSCPosition(AtomicCondition):
 
         if self._along_route:
             # Get the global route planner, used to calculate the route
-            dao = GlobalRoutePlannerDAO(self._map, 0.5)
-            grp = GlobalRoutePlanner(dao)
-            grp.setup()
-            self._grp = grp
+            self._grp = get_global_route_planner(self._map, 0.5)
         else:
             self._grp = None
+        CarlaDataProvider.subscribe(self._actor, ('transform', 'velocity'))
 
     def initialise(self):
         if self._time < 0:
@@ -250,6 +276,7 @@ class StandStill(AtomicCondition):
 
         self._duration = duration
         self._start_time = 0
+        CarlaDataProvider.subscribe(self._actor, ('velocity',))
 
     def initialise(self):
         """
@@ -303,6 +330,8 @@ class RelativeVelocityToOtherActor(AtomicCondition):
         self._other_actor = other_actor
         self._relative_speed = speed
         self._comparison_operator = comparison_operator
+        CarlaDataProvider.subscribe(self._actor, ('velocity',))
+        CarlaDataProvider.subscribe(self._other_actor, ('velocity',))
 
     def update(self):
         """
@@ -350,6 +379,7 @@ class TriggerVelocity(AtomicCondition):
         self._actor = actor
         self._target_velocity = target_velocity
         self._comparison_operator = comparison_operator
+        CarlaDataProvider.subscribe(self._actor, ('velocity',))
 
     def update(self):
         """
@@ -394,6 +424,7 @@ class TriggerAcceleration(AtomicCondition):
         self._actor = actor
         self._target_acceleration = target_acceleration
         self._comparison_operator = comparison_operator
+        CarlaDataProvider.subscribe(self._actor, ('acceleration',))
 
     def update(self):
         """
@@ -405,7 +436,7 @@ class TriggerAcceleration(AtomicCondition):
         """
         new_status = py_trees.common.Status.RUNNING
 
-        acceleration = self._actor.get_acceleration()
+        acceleration = CarlaDataProvider.get_acceleration(self._actor)
         linear_accel = math.sqrt(math.pow(acceleration.x, 2) +
                                  math.pow(acceleration.y, 2) +
                                  math.pow(acceleration.z, 2))
@@ -538,6 +569,7 @@ class InTriggerRegion(AtomicCondition):
         self._max_x = max_x
         self._min_y = min_y
         self._max_y = max_y
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -587,6 +619,8 @@ class InTriggerDistanceToVehicle(AtomicCondition):
         self._actor = actor
         self._distance = distance
         self._comparison_operator = comparison_operator
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
+        CarlaDataProvider.subscribe(self._reference_actor, ('transform',))
 
     def update(self):
         """
@@ -594,14 +628,22 @@ class InTriggerDistanceToVehicle(AtomicCondition):
         """
         new_status = py_trees.common.Status.RUNNING
 
-        location = CarlaDataProvider.get_location(self._actor)
-        reference_location = CarlaDataProvider.get_location(self._reference_actor)
+        distance = CarlaDataProvider.get_pairwise_distances([self._actor], [self._reference_actor])[0, 0]
+        if math.isnan(distance):
+            # At least one of the actors is not part of the last snapshot yet
+            location = CarlaDataProvider.get_location(self._actor)
+            reference_location = CarlaDataProvider.get_location(self._reference_actor)
 
-        if location is None or reference_location is None:
-            return new_status
+            if location is None or reference_location is None:
+                return new_status
+
+            distance = calculate_distance(location, reference_location)
 
-        if self._comparison_operator(calculate_distance(location, reference_location), self._distance):
+        if self._comparison_operator(distance, self._distance):
             new_status = py_trees.common.Status.SUCCESS
+        elif self._comparison_operator in (operator.lt, operator.le):
+            # The distance cannot shrink by more than the displacement of both actors
+            self.sleep_until(WakeUpBound([self._actor, self._reference_actor], distance - self._distance))
 
         self.logger.debug("%s.update()[%s->%s]" % (self.__class__.__name__, self.status, new_status))
 
@@ -638,6 +680,7 @@ class InTriggerDistanceToLocation(AtomicCondition):
         self._actor = actor
         self._distance = distance
         self._comparison_operator = comparison_operator
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -651,9 +694,12 @@ class InTriggerDistanceToLocation(AtomicCondition):
         if location is None:
             return new_status
 
-        if self._comparison_operator(calculate_distance(
-                location, self._target_location), self._distance):
+        distance = calculate_distance(location, self._target_location)
+        if self._comparison_operator(distance, self._distance):
             new_status = py_trees.common.Status.SUCCESS
+        elif self._comparison_operator in (operator.lt, operator.le):
+            # The distance cannot shrink by more than the displacement of the actor
+            self.sleep_until(WakeUpBound([self._actor], distance - self._distance))
 
         self.logger.debug("%s.update()[%s->%s]" % (self.__class__.__name__, self.status, new_status))
 
@@ -689,6 +735,7 @@ class InTriggerDistanceToNextIntersection(AtomicCondition):
             waypoint = waypoint.next(1)[-1]
 
         self._final_location = waypoint.transform.location
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -736,6 +783,8 @@ class InTriggerDistanceToLocationAlongRoute(AtomicCondition):
         self._distance = distance
 
         self._location_distance, _ = get_distance_along_route(self._route, self._location)
+        self._progress = CarlaDataProvider.get_route_progress(self._actor, self._route)
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         new_status = py_trees.common.Status.RUNNING
@@ -747,7 +796,7 @@ class InTriggerDistanceToLocationAlongRoute(AtomicCondition):
 
         if current_location.distance(self._location) < self._distance + 20:
 
-            actor_distance, _ = get_distance_along_route(self._route, current_location)
+            actor_distance, _ = self._progress.update(current_location)
 
             # If closer than self._distance and hasn't passed the trigger point
             if (self._location_distance < actor_distance + self._distance and
@@ -785,6 +834,7 @@ class InTimeToArrivalToLocation(AtomicCondition):
         self._time = time
         self._target_location = location
         self._comparison_operator = comparison_operator
+        CarlaDataProvider.subscribe(self._actor, ('transform', 'velocity'))
 
     def update(self):
         """
@@ -807,6 +857,9 @@ class InTimeToArrivalToLocation(AtomicCondition):
 
         if self._comparison_operator(time_to_arrival, self._time):
             new_status = py_trees.common.Status.SUCCESS
+        elif self._comparison_operator in (operator.lt, operator.le) and distance > self._time * MAX_ACTOR_SPEED:
+            # Even at the maximum speed, the actor has to get this close before arriving in time
+            self.sleep_until(WakeUpBound([self._actor], distance - self._time * MAX_ACTOR_SPEED))
 
         self.logger.debug("%s.update()[%s->%s]" % (self.__class__.__name__, self.status, new_status))
 
@@ -847,12 +900,11 @@ class InTimeToArrivalToVehicle(AtomicCondition):
 
         if self._along_route:
             # Get the global route planner, used to calculate the route
-            dao = GlobalRoutePlannerDAO(self._map, 0.5)
-            grp = GlobalRoutePlanner(dao)
-            grp.setup()
-            self._grp = grp
+            self._grp = get_global_route_planner(self._map, 0.5)
         else:
             self._grp = None
+        CarlaDataProvider.subscribe(self._actor, ('transform', 'velocity'))
+        CarlaDataProvider.subscribe(self._other_actor, ('transform', 'velocity'))
 
     def update(self):
         """
@@ -951,6 +1003,7 @@ class InTimeToArrivalToVehicleSideLane(InTimeToArrivalToLocation):
         super(InTimeToArrivalToVehicleSideLane, self).__init__(
             actor, time, other_side_location, comparison_operator, name)
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
+        CarlaDataProvider.subscribe(self._other_actor, ('transform',))
 
     def update(self):
         """
@@ -1012,6 +1065,8 @@ class WaitUntilInFront(AtomicCondition):
         self._length = self._factor * (actor_extent + other_extent)
 
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
+        CarlaDataProvider.subscribe(self._other_actor, ('transform',))
 
     def update(self):
         """
@@ -1079,6 +1134,7 @@ class DriveDistance(AtomicCondition):
         self._distance = 0
         self._location = None
         self._actor = actor
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def initialise(self):
         self._location = CarlaDataProvider.get_location(self._actor)
@@ -1120,6 +1176,7 @@ class AtRightmostLane(AtomicCondition):
         self.logger.debug("%s.__init__()" % (self.__class__.__name__))
         self._actor = actor
         self._map = CarlaDataProvider.get_map()
+        CarlaDataProvider.subscribe(self._actor, ('transform',))
 
     def update(self):
         """
@@ -1247,5 +1304,7 @@ class WaitForBlackboardVariable(AtomicCondition):
             if self._debug:
                 print("Blackboard variable {} set to True".format(self._variable_name))
             new_status = py_trees.common.Status.SUCCESS
+        else:
+            self.sleep_until(BlackboardWakeUp(self._variable_name, self._variable_value))
 
         return new_status
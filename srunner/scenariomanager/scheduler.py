@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides the scheduling of dormant nodes of the scenario tree: conditions
+which cannot change their status before a conservative wake-up bound is reached
+are not evaluated until then, and subtrees only waiting for such conditions are skipped
+"""
+
+import math
+
+import py_trees
+
+from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.tools.py_trees_port import Decorator
+
+# Upper bound of the speed of any actor [m/s], used by conditions on the time to arrival
+MAX_ACTOR_SPEED = 100.0
+
+# Composites whose ticks only depend on the status of their children
+PASSIVE_COMPOSITES = (py_trees.composites.Sequence, py_trees.composites.Selector, py_trees.composites.Parallel)
+
+
+class WakeUpBound(object):
+
+    """
+    Conservative earliest moment at which a dormant condition may change its status, given as
+    the distance the actors have to be displaced in total from their current locations.
+
+    A condition on the distance between an actor and a location (or another actor) cannot become
+    true before the actors moved by the difference between the current and the trigger distance
+    (triangle inequality). Only the buffered locations of the actors are needed to check it.
+
+    Args:
+        actors (list): CARLA actors whose displacements are summed up
+        distance (float): Total displacement needed [m]
+    """
+
+    def __init__(self, actors, distance):
+        self._actors = list(actors)
+        self._distance = distance
+        self._origins = [CarlaDataProvider.get_location(actor) for actor in self._actors]
+
+    def is_reached(self):
+        """
+        Check if the bound may have been reached. Actors without location wake the condition up
+        """
+        displacement = 0.0
+        for actor, origin in zip(self._actors, self._origins):
+            location = CarlaDataProvider.get_location(actor)
+            if origin is None or location is None:
+                return True
+            displacement += math.sqrt((location.x - origin.x) ** 2 +
+                                      (location.y - origin.y) ** 2 +
+                                      (location.z - origin.z) ** 2)
+        return displacement >= self._distance
+
+
+class BlackboardWakeUp(object):
+
+    """
+    Earliest moment at which a condition waiting for a blackboard variable may change its status:
+    the variable has been set to the expected value.
+
+    Args:
+        variable_name (str): Name of the blackboard variable
+        variable_value: Value the condition waits for
+    """
+
+    def __init__(self, variable_name, variable_value):
+        self._variable_name = variable_name
+        self._variable_value = variable_value
+
+    def is_reached(self):
+        """
+        Check if the variable has the expected value
+        """
+        return py_trees.blackboard.Blackboard().get(self._variable_name) == self._variable_value
+
+
+class DormantNodeScheduler(object):
+
+    """
+    This (static) class keeps track of the dormant nodes of the scenario tree.
+
+    A dormant node is not evaluated and keeps running. The amount of skipped nodes
+    is reported per tick and in total.
+    """
+
+    _enabled = True
+    _skipped_nodes = 0
+    _total_skipped_nodes = 0
+
+    @staticmethod
+    def set_enabled(enabled):
+        """
+        Enable or disable the scheduling. Disabled, all nodes are evaluated on every tick
+        """
+        DormantNodeScheduler._enabled = enabled
+
+    @staticmethod
+    def is_enabled():
+        """
+        Check if dormant nodes are skipped
+        """
+        return DormantNodeScheduler._enabled
+
+    @staticmethod
+    def start_tick():
+        """
+        Reset the amount of skipped nodes, to be called before ticking the scenario tree
+        """
+        DormantNodeScheduler._skipped_nodes = 0
+
+    @staticmethod
+    def record_skip(nodes=1):
+        """
+        Count nodes skipped during the current tick
+        """
+        DormantNodeScheduler._skipped_nodes += nodes
+        DormantNodeScheduler._total_skipped_nodes += nodes
+
+    @staticmethod
+    def get_skipped_nodes(total=False):
+        """
+        returns the amount of nodes skipped during the last tick, or since the last reset if total is True
+        """
+        if total:
+            return DormantNodeScheduler._total_skipped_nodes
+        return DormantNodeScheduler._skipped_nodes
+
+    @staticmethod
+    def reset():
+        """
+        Reset the amounts of skipped nodes
+        """
+        DormantNodeScheduler._skipped_nodes = 0
+        DormantNodeScheduler._total_skipped_nodes = 0
+
+
+class DormancyGate(Decorator):
+
+    """
+    Decorator skipping its whole subtree while it is dormant.
+
+    After each tick, the subtree becomes dormant if it is still running, all leaves ticked are
+    dormant conditions (see AtomicCondition.sleep_until) and all other nodes ticked are plain
+    sequences, selectors or parallels. Until one of the wake-up bounds of these conditions
+    is reached, ticking the subtree would give the same result, so it is not ticked.
+
+    A subtree with other running nodes (e.g. the ScenarioTriggerer of a route) never sleeps,
+    so independent parts of a tree, such as the scenarios of a route, are gated on their own.
+    """
+
+    def __init__(self, child, name="DormancyGate"):
+        super(DormancyGate, self).__init__(child, name)
+        self._wake_ups = None
+        self._ticked_nodes = 0
+
+    def tick(self):
+        """
+        Tick the subtree, unless it is dormant
+        """
+        if (self._wake_ups is not None and self.status == py_trees.common.Status.RUNNING and
+                self.decorated.status == py_trees.common.Status.RUNNING):
+            if not any(wake_up.is_reached() for wake_up in self._wake_ups):
+                DormantNodeScheduler.record_skip(self._ticked_nodes)
+                yield self
+                return
+
+        wake_ups = [] if DormantNodeScheduler.is_enabled() else None
+        ticked_nodes = 0
+        for node in super(DormancyGate, self).tick():
+            if node is not self:
+                ticked_nodes += 1
+                if wake_ups is not None:
+                    wake_ups = self._add_wake_up(wake_ups, node)
+            yield node
+
+        self._ticked_nodes = ticked_nodes
+        self._wake_ups = wake_ups if wake_ups and self.status == py_trees.common.Status.RUNNING else None
+
+    @staticmethod
+    def _add_wake_up(wake_ups, node):
+        """
+        Add the wake-up bound of a ticked node, returns None if the node prevents the subtree from sleeping
+        """
+        if node.children:
+            return wake_ups if type(node) in PASSIVE_COMPOSITES else None  # pylint: disable=unidiomatic-typecheck
+        get_wake_up = getattr(node, 'get_wake_up', None)
+        wake_up = get_wake_up() if get_wake_up is not None else None
+        if wake_up is None:
+            return None
+        wake_ups.append(wake_up)
+        return wake_ups
+
+    def update(self):
+        """
+        The gate has the status of its subtree
+        """
+        return self.decorated.status
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a uniform grid spatial index, used by the CarlaDataProvider
+to answer neighbour queries without checking every actor of the world
+"""
+
+import numpy as np
+
+
+class GridIndex(object):
+
+    """
+    Uniform 2D grid over a set of 3D positions.
+
+    The positions are bucketed in square cells of cell_size meters (using x and y), stored
+    as a list of rows sorted by cell, so that each cell is a contiguous slice found by binary search.
+    Distances are always checked in 3D.
+
+    Args:
+        cell_size (float): Size of each cell [m]
+
+    Attributes:
+        frame (int): Frame of the indexed positions (-1 if never built)
+    """
+
+    _CELL_OFFSET = 1 << 20  # Allows negative cell coordinates when encoding them into one key
+
+    def __init__(self, cell_size=20.0):
+        """
+        Create an empty index
+        """
+        self.frame = -1
+        self._cell_size = float(cell_size)
+        self._positions = np.zeros((0, 3))
+        self._sorted_keys = np.zeros(0, dtype=np.int64)
+        self._sorted_rows = np.zeros(0, dtype=np.int64)
+
+    def _cell_keys(self, cells_x, cells_y):
+        """
+        Encode integer cell coordinates into a single int64 key
+        """
+        return (cells_x + self._CELL_OFFSET) * (2 * self._CELL_OFFSET) + (cells_y + self._CELL_OFFSET)
+
+    def build(self, frame, positions):
+        """
+        Index the given positions (shape (N, 3)). Row numbers refer to this array
+        """
+        self.frame = frame
+        self._positions = positions
+        cells = np.floor(positions[:, :2] / self._cell_size).astype(np.int64)
+        keys = self._cell_keys(cells[:, 0], cells[:, 1])
+        self._sorted_rows = np.argsort(keys, kind='mergesort')
+        self._sorted_keys = keys[self._sorted_rows]
+
+    def query_radius(self, point, radius):
+        """
+        returns the rows of all positions closer than radius to point (x, y, z)
+        """
+        point = np.asarray(point, dtype=np.float64)
+        if len(self._positions) == 0 or radius <= 0:
+            return np.zeros(0, dtype=np.int64)
+
+        min_cell = np.floor((point[:2] - radius) / self._cell_size).astype(np.int64)
+        max_cell = np.floor((point[:2] + radius) / self._cell_size).astype(np.int64)
+        span = max_cell - min_cell + 1
+
+        if span[0] * span[1] >= len(self._positions):
+            # Too many cells, checking all positions is cheaper
+            candidates = np.arange(len(self._positions))
+        else:
+            cells_x, cells_y = np.meshgrid(np.arange(min_cell[0], max_cell[0] + 1),
+                                           np.arange(min_cell[1], max_cell[1] + 1), indexing='ij')
+            keys = self._cell_keys(cells_x.ravel(), cells_y.ravel())
+            starts = np.searchsorted(self._sorted_keys, keys, side='left')
+            ends = np.searchsorted(self._sorted_keys, keys, side='right')
+            slices = [self._sorted_rows[start:end] for start, end in zip(starts, ends) if end > start]
+            if not slices:
+                return np.zeros(0, dtype=np.int64)
+            candidates = np.concatenate(slices)
+
+        diff = self._positions[candidates] - point
+        squared_distances = np.einsum('ij,ij->i', diff, diff)
+        return candidates[squared_distances < radius * radius]
+
+    def nearest(self, point, k=1, mask=None):
+        """
+        returns the rows of the k positions closest to point (x, y, z), sorted by distance.
+        If given, only rows for which the boolean mask is True are considered
+        """
+        point = np.asarray(point, dtype=np.float64)
+        amount = len(self._positions) if mask is None else int(np.count_nonzero(mask))
+        k = min(k, amount)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # Grow the search radius until enough positions are found. All positions within the radius
+        # are returned by query_radius, so the k closest ones of them are the k closest overall
+        radius = self._cell_size
+        while True:
+            rows = self.query_radius(point, radius)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= k or len(rows) == amount:
+                break
+            radius *= 2.0
+
+        diff = self._positions[rows] - point
+        squared_distances = np.einsum('ij,ij->i', diff, diff)
+        return rows[np.argsort(squared_distances, kind='mergesort')[:k]]
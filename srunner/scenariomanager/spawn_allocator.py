@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides an allocator of the spawn points of a map, which only hands out
+the spawn points not occupied by any actor nor reserved by a pending spawn
+"""
+
+import numpy as np
+
+
+class SpawnPointAllocator(object):
+
+    """
+    Allocator of spawn points. A spawn point is occupied if it is closer to an actor than the
+    radius of the actor (half the diagonal of its bounding box) plus the clearance.
+
+    Spawned actors only become part of the world snapshot after the next tick, so allocated
+    spawn points (and the locations of other spawned actors) are reserved until the frame
+    of the world snapshot changes.
+
+    Args:
+        spawn_points (list): carla.Transform of every spawn point
+        clearance (float): Radius kept free around a spawn point [m]
+
+    Attributes:
+        spawn_points (list): carla.Transform of every spawn point
+        positions (np.ndarray): Locations of the spawn points, shape (N, 3)
+    """
+
+    def __init__(self, spawn_points, clearance=2.5):
+        self.spawn_points = list(spawn_points)
+        self.positions = np.array([(point.location.x, point.location.y, point.location.z)
+                                   for point in self.spawn_points], dtype=np.float64).reshape(-1, 3)
+        self._clearance = clearance
+        self._reserved_positions = []
+        self._reserved_frame = None
+
+    def __len__(self):
+        return len(self.spawn_points)
+
+    def reserve(self, location, frame):
+        """
+        Reserve the surroundings of a location until the given frame of the world snapshot changes
+        """
+        if frame != self._reserved_frame:
+            self._reserved_positions = []
+            self._reserved_frame = frame
+        self._reserved_positions.append((location.x, location.y, location.z))
+
+    def get_free_indices(self, positions, extents, frame):
+        """
+        returns the indices of the spawn points that are neither occupied by the given actors
+        nor reserved at the given frame
+        :param positions: locations of the actors, shape (M, 3)
+        :param extents: bounding box extents of the actors, shape (M, 3)
+        :param frame: frame of the world snapshot the actors were taken from
+        """
+        occupied = np.zeros(len(self.spawn_points), dtype=bool)
+        if not len(self.spawn_points):
+            return np.flatnonzero(occupied)
+
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if len(positions):
+            radii = np.sqrt(np.sum(np.asarray(extents, dtype=np.float64).reshape(-1, 3)[:, :2] ** 2, axis=1))
+            distances = np.sqrt(np.sum((self.positions[:, np.newaxis, :] - positions[np.newaxis]) ** 2, axis=2))
+            occupied |= np.any(distances < radii + self._clearance, axis=1)
+
+        if frame == self._reserved_frame and self._reserved_positions:
+            reserved = np.array(self._reserved_positions)
+            distances = np.sqrt(np.sum((self.positions[:, np.newaxis, :] - reserved[np.newaxis]) ** 2, axis=2))
+            occupied |= np.any(distances < 2 * self._clearance, axis=1)
+
+        return np.flatnonzero(~occupied)
+
+    def allocate(self, amount, positions, extents, frame, rng):
+        """
+        Hand out and reserve up to amount free spawn points, chosen at random
+        :param amount: amount of spawn points
+        :param positions: locations of the actors, shape (M, 3)
+        :param extents: bounding box extents of the actors, shape (M, 3)
+        :param frame: frame of the world snapshot the actors were taken from
+        :param rng: numpy.random.RandomState used to choose the spawn points
+        :return: list of carla.Transform, shorter than amount if there are not enough free spawn points
+        """
+        free = self.get_free_indices(positions, extents, frame)
+        rng.shuffle(free)
+
+        chosen = []
+        for index in free.tolist():
+            if len(chosen) >= amount:
+                break
+            # Free spawn points can still be too close to each other
+            if chosen and np.min(np.sqrt(np.sum((self.positions[chosen] - self.positions[index]) ** 2,
+                                                axis=1))) < 2 * self._clearance:
+                continue
+            chosen.append(index)
+
+        for index in chosen:
+            self.reserve(self.spawn_points[index].location, frame)
+        return [self.spawn_points[index] for index in chosen]
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides the static geometry of the traffic lights and stop signs of a town,
+as used by the traffic criteria, together with a spatial index over it.
+
+The stop line waypoints of the traffic lights only depend on the map, so they are
+cached on disk per town and OpenDRIVE hash
+"""
+
+import math
+
+import numpy as np
+
+import carla
+
+from srunner.scenariomanager.map_cache import get_map_cache_path, load_cached_array, save_cached_array
+from srunner.scenariomanager.spatial_index import GridIndex
+
+# One row per stop line waypoint of a traffic light, identified by the location of the traffic light.
+# Traffic lights without waypoints are stored as a single row with lane_id 0
+_TRAFFIC_LIGHT_DTYPE = np.dtype([('light', np.float64, 3), ('center', np.float64, 3), ('road_id', np.int32),
+                                 ('lane_id', np.int32), ('lane_width', np.float64), ('location', np.float64, 3),
+                                 ('rotation', np.float64, 3)])
+
+
+def rotate_point(point, angle):
+    """
+    rotate a given point by a given angle
+    """
+    x_ = math.cos(math.radians(angle)) * point.x - math.sin(math.radians(angle)) * point.y
+    y_ = math.sin(math.radians(angle)) * point.x + math.cos(math.radians(angle)) * point.y
+    return carla.Vector3D(x_, y_, point.z)
+
+
+def get_traffic_light_waypoints(traffic_light, base_transform, carla_map):
+    """
+    get area of a given traffic light: the center of its trigger volume and
+    the waypoints of its stop line (one per affected lane)
+    """
+    base_rot = base_transform.rotation.yaw
+    area_loc = base_transform.transform(traffic_light.trigger_volume.location)
+
+    # Discretize the trigger box into points
+    area_ext = traffic_light.trigger_volume.extent
+    x_values = np.arange(-0.9 * area_ext.x, 0.9 * area_ext.x, 1.0)  # 0.9 to avoid crossing to adjacent lanes
+
+    area = []
+    for x in x_values:
+        point = rotate_point(carla.Vector3D(x, 0, area_ext.z), base_rot)
+        point_location = area_loc + carla.Location(x=point.x, y=point.y)
+        area.append(point_location)
+
+    # Get the waypoints of these points, removing duplicates
+    ini_wps = []
+    for pt in area:
+        wpx = carla_map.get_waypoint(pt)
+        # As x_values are arranged in order, only the last one has to be checked
+        if not ini_wps or ini_wps[-1].road_id != wpx.road_id or ini_wps[-1].lane_id != wpx.lane_id:
+            ini_wps.append(wpx)
+
+    # Advance them until the intersection
+    wps = []
+    for wpx in ini_wps:
+        while not wpx.is_intersection:
+            next_wp = wpx.next(0.5)[0]
+            if next_wp and not next_wp.is_intersection:
+                wpx = next_wp
+            else:
+                break
+        wps.append(wpx)
+
+    return area_loc, wps
+
+
+class StopWaypoint(object):
+
+    """
+    Static data of a stop line waypoint of a traffic light
+
+    Attributes:
+        road_id (int): Road of the waypoint
+        lane_id (int): Lane of the waypoint
+        lane_width (float): Width of the lane [m]
+        transform (carla.Transform): Transform of the waypoint
+        stop_line (tuple): 2D segment ((x, y), (x, y)) across 80% of the lane at the waypoint
+    """
+
+    __slots__ = ('road_id', 'lane_id', 'lane_width', 'transform', 'stop_line')
+
+    def __init__(self, road_id, lane_id, lane_width, transform):
+        self.road_id = road_id
+        self.lane_id = lane_id
+        self.lane_width = lane_width
+        self.transform = transform
+
+        location = transform.location
+        left = rotate_point(carla.Vector3D(0.4 * lane_width, 0.0, 0.0), transform.rotation.yaw + 90)
+        right = rotate_point(carla.Vector3D(0.4 * lane_width, 0.0, 0.0), transform.rotation.yaw - 90)
+        self.stop_line = ((location.x + left.x, location.y + left.y), (location.x + right.x, location.y + right.y))
+
+
+class TrafficSignIndex(object):
+
+    """
+    Grid spatial index over the static geometry of a set of traffic signs
+
+    Args:
+        entries (list): Geometry of each traffic sign, the first element being the carla.Actor
+        positions (list): Location (x, y, z) indexed for each entry
+
+    Attributes:
+        entries (list): Geometry of each traffic sign
+    """
+
+    def __init__(self, entries, positions):
+        """
+        Index the given entries
+        """
+        self.entries = entries
+        self._entry_map = dict((entry[0].id, entry) for entry in entries)
+        self._index = GridIndex()
+        self._index.build(0, np.array(positions, dtype=np.float64).reshape(-1, 3))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_entry(self, actor_id):
+        """
+        returns the geometry of the traffic sign with the given id, None if it is not indexed
+        """
+        return self._entry_map.get(actor_id)
+
+    def query_radius(self, location, radius):
+        """
+        returns the entries closer than radius to the given carla.Location, in their original order
+        """
+        rows = self._index.query_radius((location.x, location.y, location.z), radius)
+        return [self.entries[row] for row in sorted(rows.tolist())]
+
+
+def _light_key(location):
+    """
+    Key identifying a traffic light of the town by its location
+    """
+    return (round(location[0], 2), round(location[1], 2), round(location[2], 2))
+
+
+def build_traffic_light_index(traffic_lights, carla_map):
+    """
+    Build the index of the traffic lights, each entry being (traffic light, center of its trigger volume,
+    list of StopWaypoint), positioned at the center. The waypoints are read from the disk cache of the town,
+    computing (and storing) only the missing ones
+    :param traffic_lights: dictionary of carla.TrafficLight to their carla.Transform
+    :param carla_map: the CARLA map
+    """
+    cache_path = get_map_cache_path(carla_map, 'traffic_light_stop_lines')
+    cached = load_cached_array(cache_path, _TRAFFIC_LIGHT_DTYPE)
+
+    cached_rows = dict()
+    if cached is not None:
+        for row in cached.tolist():
+            cached_rows.setdefault(_light_key(row[0]), []).append(row)
+
+    entries = []
+    positions = []
+    new_rows = []
+    for traffic_light in sorted(traffic_lights, key=lambda light: light.id):
+        if not hasattr(traffic_light, 'trigger_volume'):
+            continue
+        transform = traffic_lights[traffic_light]
+        light = (transform.location.x, transform.location.y, transform.location.z)
+
+        rows = cached_rows.get(_light_key(light))
+        if rows is None:
+            center, waypoints = get_traffic_light_waypoints(traffic_light, transform, carla_map)
+            center = (center.x, center.y, center.z)
+            rows = []
+            for wp in waypoints:
+                wp_location = wp.transform.location
+                wp_rotation = wp.transform.rotation
+                rows.append((light, center, wp.road_id, wp.lane_id, wp.lane_width,
+                             (wp_location.x, wp_location.y, wp_location.z),
+                             (wp_rotation.pitch, wp_rotation.yaw, wp_rotation.roll)))
+            if not rows:
+                rows.append((light, center, 0, 0, 0.0, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)))
+            new_rows.extend(rows)
+
+        stop_waypoints = []
+        for _, _, road_id, lane_id, lane_width, location, rotation in rows:
+            if lane_id == 0:
+                continue
+            wp_transform = carla.Transform(carla.Location(*location),
+                                           carla.Rotation(pitch=rotation[0], yaw=rotation[1], roll=rotation[2]))
+            stop_waypoints.append(StopWaypoint(road_id, lane_id, lane_width, wp_transform))
+
+        center = rows[0][1]
+        entries.append((traffic_light, carla.Location(*center), stop_waypoints))
+        positions.append(center)
+
+    if new_rows:
+        data = np.zeros(len(new_rows), dtype=_TRAFFIC_LIGHT_DTYPE)
+        for i, row in enumerate(new_rows):
+            data[i] = row
+        if cached is not None:
+            data = np.concatenate((np.asarray(cached), data))
+        save_cached_array(cache_path, data)
+
+    return TrafficSignIndex(entries, positions)
+
+
+def build_stop_sign_index(stop_signs):
+    """
+    Build the index of the stop signs, each entry being (stop sign, its carla.Transform,
+    center of its trigger volume), positioned at the stop sign
+    :param stop_signs: list of stop sign actors
+    """
+    entries = []
+    positions = []
+    for stop_sign in stop_signs:
+        transform = stop_sign.get_transform()
+        trigger_location = transform.transform(stop_sign.trigger_volume.location)
+        entries.append((stop_sign, transform, carla.Location(trigger_location)))
+        positions.append((transform.location.x, transform.location.y, transform.location.z))
+
+    return TrafficSignIndex(entries, positions)
@@ -11,18 +11,28 @@ It is for example used in the ScenarioManager
 """
 from __future__ import print_function
 
-from threading import Timer
+import threading
+import time
 try:
     import thread
 except ImportError:
     import _thread as thread
 
+try:
+    _monotonic = time.monotonic  # pylint: disable=invalid-name
+except AttributeError:
+    _monotonic = time.time  # pylint: disable=invalid-name
+
 
 class Watchdog(object):
 
     """
     Simple watchdog timer to detect timeouts
 
+    A single monitor thread is created on the first start and reused afterwards.
+    Resetting the watchdog (update) only stores the time of the kick, which is
+    checked by the monitor thread once the previous deadline is reached.
+
     Args:
         timeout (float): Timeout value of the watchdog [seconds].
             If it is not reset before exceeding this value, a KayboardInterrupt is raised.
@@ -30,6 +40,10 @@ class Watchdog(object):
     Attributes:
         _timeout (float): Timeout value of the watchdog [seconds].
         _failed (bool):   True if watchdog exception occured, false otherwise
+        _active (bool):   True if the watchdog is started
+        _last_kick (float): Monotonic time of the last start/update [seconds]
+        _last_tick_time (float): Time between the last two kicks [seconds]
+        _max_tick_time (float): Maximum time between two kicks since the start [seconds]
     """
 
     def __init__(self, timeout=1.0):
@@ -38,22 +52,58 @@ class Watchdog(object):
         """
         self._timeout = timeout + 1.0  # Let's add one second here to avoid overlap with other CARLA timeouts
         self._failed = False
-        self._timer = None
+        self._active = False
+        self._last_kick = 0.0
+        self._last_tick_time = 0.0
+        self._max_tick_time = 0.0
+        self._condition = threading.Condition()
+        self._thread = None
 
     def start(self):
         """
         Start the watchdog
         """
-        self._timer = Timer(self._timeout, self._event)
-        self._timer.daemon = True
-        self._timer.start()
+        with self._condition:
+            self._last_kick = _monotonic()
+            self._last_tick_time = 0.0
+            self._max_tick_time = 0.0
+            self._active = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._monitor, name="Watchdog")
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
 
     def update(self):
         """
-        Reset watchdog.
+        Reset watchdog. It is (re)started if it was stopped or triggered.
+        """
+        if not self._active:
+            self.start()
+            return
+
+        now = _monotonic()
+        self._last_tick_time = now - self._last_kick
+        self._max_tick_time = max(self._max_tick_time, self._last_tick_time)
+        self._last_kick = now
+
+    def _monitor(self):
+        """
+        Body of the monitor thread. Sleeps until the deadline given by the last kick,
+        and triggers the watchdog if no new kick happened meanwhile
         """
-        self.stop()
-        self.start()
+        with self._condition:
+            while True:
+                if not self._active:
+                    self._condition.wait()
+                    continue
+
+                remaining_time = self._last_kick + self._timeout - _monotonic()
+                if remaining_time > 0:
+                    self._condition.wait(remaining_time)
+                else:
+                    self._active = False
+                    self._event()
 
     def _event(self):
         """
@@ -62,14 +112,15 @@ class Watchdog(object):
         """
         print('Watchdog exception - Timeout of {} seconds occured'.format(self._timeout))
         self._failed = True
-        self.stop()
         thread.interrupt_main()
 
     def stop(self):
         """
         Stops the watchdog.
         """
-        self._timer.cancel()
+        with self._condition:
+            self._active = False
+            self._condition.notify()
 
     def get_status(self):
         """
@@ -77,3 +128,24 @@ class Watchdog(object):
            bool:  False if watchdog exception occured, True otherwise
         """
         return not self._failed
+
+    def get_tick_time(self):
+        """
+        returns:
+           float: Time between the last two updates [seconds]
+        """
+        return self._last_tick_time
+
+    def get_max_tick_time(self):
+        """
+        returns:
+           float: Maximum time between two updates since the watchdog was started [seconds]
+        """
+        return self._max_tick_time
+
+    def get_budget(self):
+        """
+        returns:
+           float: Maximum time between two updates before the watchdog triggers [seconds]
+        """
+        return self._timeout
@@ -18,6 +18,7 @@ import carla
 
 import srunner.scenariomanager.scenarioatomics.atomic_trigger_conditions as conditions
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.scheduler import DormancyGate
 from srunner.scenariomanager.timer import TimeOut
 from srunner.scenariomanager.weather_sim import WeatherBehavior
 from srunner.scenariomanager.scenarioatomics.atomic_behaviors import UpdateAllActorControls
@@ -51,10 +52,7 @@ class BasicScenario(object):
 
         # Initializing adversarial actors
         self._initialize_actors(config)
-        if CarlaDataProvider.is_sync_mode():
-            world.tick()
-        else:
-            world.wait_for_tick()
+        CarlaDataProvider.tick_after_spawn()
 
         # Setup scenario
         if debug_mode:
@@ -249,7 +247,8 @@ class Scenario(object):
         # Create overall py_tree
         self.scenario_tree = py_trees.composites.Parallel(name, policy=py_trees.common.ParallelPolicy.SUCCESS_ON_ONE)
         if behavior is not None:
-            self.scenario_tree.add_child(self.behavior)
+            # The behavior is skipped while it only waits for dormant trigger conditions
+            self.scenario_tree.add_child(DormancyGate(self.behavior))
         self.scenario_tree.add_child(self.timeout_node)
         self.scenario_tree.add_child(WeatherBehavior())
         self.scenario_tree.add_child(UpdateAllActorControls())
@@ -11,6 +11,7 @@ This module provides Challenge routes as standalone scenarios
 
 from __future__ import print_function
 
+import functools
 import math
 import traceback
 import xml.etree.ElementTree as ET
@@ -26,7 +27,9 @@ from agents.navigation.local_planner import RoadOption
 from srunner.scenarioconfigs.scenario_configuration import ScenarioConfiguration, ActorConfigurationData
 # pylint: enable=line-too-long
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
-from srunner.scenariomanager.scenarioatomics.atomic_behaviors import Idle, ScenarioTriggerer
+from srunner.scenariomanager.compiled_route import CompiledRoute, register_compiled_route
+from srunner.scenariomanager.scenarioatomics.atomic_behaviors import Idle, LazyScenario, ScenarioTriggerer
+from srunner.scenariomanager.scheduler import DormancyGate
 from srunner.scenarios.basic_scenario import BasicScenario
 from srunner.tools.route_parser import RouteParser, TRIGGER_THRESHOLD, TRIGGER_ANGLE_THRESHOLD
 from srunner.tools.route_manipulation import interpolate_trajectory
@@ -140,35 +143,51 @@ class RouteScenario(BasicScenario):
     """
     Implementation of a RouteScenario, i.e. a scenario that consists of driving along a pre-defined route,
     along which several smaller scenarios are triggered
+
+    If lazy_distance is given, the scenarios are only built (and their actors spawned) once the ego vehicle
+    is closer than lazy_distance along the route to their trigger point, and removed once they end.
+    Otherwise, all of them are built at start
     """
 
-    def __init__(self, world, config, debug_mode=False, criteria_enable=True, timeout=300):
+    def __init__(self, world, config, debug_mode=False, criteria_enable=True, timeout=300, lazy_distance=None):
         """
         Setup all relevant parameters and create scenarios along route
         """
 
         self.config = config
         self.route = None
+        self.compiled_route = None
         self.sampled_scenarios_definitions = None
+        self._debug_mode = debug_mode
+        self._lazy_distance = lazy_distance
+        self._lazy_scenarios = []
 
         self._update_route(world, config, debug_mode)
 
         ego_vehicle = self._update_ego_vehicle()
 
-        self.list_scenarios = self._build_scenario_instances(world,
-                                                             ego_vehicle,
-                                                             self.sampled_scenarios_definitions,
-                                                             scenarios_per_tick=5,
-                                                             timeout=self.timeout,
-                                                             debug_mode=debug_mode)
-
-        super(RouteScenario, self).__init__(name=config.name,
-                                            ego_vehicles=[ego_vehicle],
-                                            config=config,
-                                            world=world,
-                                            debug_mode=False,
-                                            terminate_on_failure=False,
-                                            criteria_enable=criteria_enable)
+        if debug_mode:
+            self._draw_scenario_triggers(world, self.sampled_scenarios_definitions)
+
+        # The actors of the scenarios and the background are spawned without ticking, with a single tick
+        # at the end. Until then, the CarlaDataProvider gives them the transforms they were spawned at
+        with CarlaDataProvider.deferred_spawn():
+            self.list_scenarios = []
+            if self._lazy_distance is None:
+                self.list_scenarios = self._build_scenario_instances(world,
+                                                                     ego_vehicle,
+                                                                     self.sampled_scenarios_definitions,
+                                                                     scenarios_per_tick=5,
+                                                                     timeout=self.timeout,
+                                                                     debug_mode=debug_mode)
+
+            super(RouteScenario, self).__init__(name=config.name,
+                                                ego_vehicles=[ego_vehicle],
+                                                config=config,
+                                                world=world,
+                                                debug_mode=False,
+                                                terminate_on_failure=False,
+                                                criteria_enable=criteria_enable)
 
     def _update_route(self, world, config, debug_mode):
         """
@@ -188,7 +207,10 @@ class RouteScenario(BasicScenario):
         potential_scenarios_definitions, _ = RouteParser.scan_route_for_scenarios(config.town, route, world_annotations)
 
         self.route = route
-        CarlaDataProvider.set_ego_vehicle_route(convert_transform_to_location(self.route))
+        self.compiled_route = CompiledRoute(self.route, CarlaDataProvider.get_map())
+        ego_vehicle_route = convert_transform_to_location(self.route)
+        register_compiled_route(ego_vehicle_route, self.compiled_route)
+        CarlaDataProvider.set_ego_vehicle_route(ego_vehicle_route)
 
         if config.agent is not None:
             config.agent.set_global_plan(gps_route, self.route)
@@ -207,8 +229,8 @@ class RouteScenario(BasicScenario):
         """
         Set/Update the start position of the ego_vehicle
         """
-        # move ego to correct position
-        elevate_transform = self.route[0][0]
+        # move ego to correct position (without modifying the route, which is already compiled)
+        elevate_transform = carla.Transform(carla.Location(self.route[0][0].location), self.route[0][0].rotation)
         elevate_transform.location.z += 0.5
 
         ego_vehicle = CarlaDataProvider.request_new_actor('vehicle.lincoln.mkz2017',
@@ -300,6 +322,19 @@ class RouteScenario(BasicScenario):
 
         return sampled_scenarios
 
+    @staticmethod
+    def _draw_scenario_triggers(world, scenario_definitions):
+        """
+        Draw the trigger points of the scenarios
+        """
+        for scenario in scenario_definitions:
+            loc = carla.Location(scenario['trigger_position']['x'],
+                                 scenario['trigger_position']['y'],
+                                 scenario['trigger_position']['z']) + carla.Location(z=2.0)
+            world.debug.draw_point(loc, size=0.3, color=carla.Color(255, 0, 0), life_time=100000)
+            world.debug.draw_string(loc, str(scenario['name']), draw_shadow=False,
+                                    color=carla.Color(0, 0, 255), life_time=100000, persistent_lines=True)
+
     def _build_scenario_instances(self, world, ego_vehicle, scenario_definitions,
                                   scenarios_per_tick=5, timeout=300, debug_mode=False):
         """
@@ -307,58 +342,57 @@ class RouteScenario(BasicScenario):
         """
         scenario_instance_vec = []
 
-        if debug_mode:
-            for scenario in scenario_definitions:
-                loc = carla.Location(scenario['trigger_position']['x'],
-                                     scenario['trigger_position']['y'],
-                                     scenario['trigger_position']['z']) + carla.Location(z=2.0)
-                world.debug.draw_point(loc, size=0.3, color=carla.Color(255, 0, 0), life_time=100000)
-                world.debug.draw_string(loc, str(scenario['name']), draw_shadow=False,
-                                        color=carla.Color(0, 0, 255), life_time=100000, persistent_lines=True)
-
         for scenario_number, definition in enumerate(scenario_definitions):
-            # Get the class possibilities for this scenario number
-            scenario_class = NUMBER_CLASS_TRANSLATION[definition['name']]
-
-            # Create the other actors that are going to appear
-            if definition['other_actors'] is not None:
-                list_of_actor_conf_instances = self._get_actors_instances(definition['other_actors'])
-            else:
-                list_of_actor_conf_instances = []
-            # Create an actor configuration for the ego-vehicle trigger position
-
-            egoactor_trigger_position = convert_json_to_transform(definition['trigger_position'])
-            scenario_configuration = ScenarioConfiguration()
-            scenario_configuration.other_actors = list_of_actor_conf_instances
-            scenario_configuration.trigger_points = [egoactor_trigger_position]
-            scenario_configuration.subtype = definition['scenario_type']
-            scenario_configuration.ego_vehicles = [ActorConfigurationData('vehicle.lincoln.mkz2017',
-                                                                          ego_vehicle.get_transform(),
-                                                                          'hero')]
-            route_var_name = "ScenarioRouteNumber{}".format(scenario_number)
-            scenario_configuration.route_var_name = route_var_name
-
-            try:
-                scenario_instance = scenario_class(world, [ego_vehicle], scenario_configuration,
-                                                   criteria_enable=False, timeout=timeout)
-                # Do a tick every once in a while to avoid spawning everything at the same time
-                if scenario_number % scenarios_per_tick == 0:
-                    if CarlaDataProvider.is_sync_mode():
-                        world.tick()
-                    else:
-                        world.wait_for_tick()
-
-                scenario_number += 1
-            except Exception as e:      # pylint: disable=broad-except
-                if debug_mode:
-                    traceback.print_exc()
-                print("Skipping scenario '{}' due to setup error: {}".format(definition['name'], e))
+            scenario_instance = self._build_scenario_instance(world, ego_vehicle, scenario_number, definition,
+                                                              timeout, debug_mode)
+            if scenario_instance is None:
                 continue
 
+            # Do a tick every once in a while to avoid spawning everything at the same time.
+            # Inside a deferred spawn, the ticks are merged into the one at its end
+            if scenario_number % scenarios_per_tick == 0:
+                CarlaDataProvider.tick_after_spawn()
+
             scenario_instance_vec.append(scenario_instance)
 
         return scenario_instance_vec
 
+    def _build_scenario_instance(self, world, ego_vehicle, scenario_number, definition, timeout, debug_mode):
+        """
+        Build the scenario class of a scenario definition, None if it cannot be set up
+        """
+        # Get the class possibilities for this scenario number
+        scenario_class = NUMBER_CLASS_TRANSLATION[definition['name']]
+
+        # Create the other actors that are going to appear
+        if definition['other_actors'] is not None:
+            list_of_actor_conf_instances = self._get_actors_instances(definition['other_actors'])
+        else:
+            list_of_actor_conf_instances = []
+        # Create an actor configuration for the ego-vehicle trigger position
+
+        egoactor_trigger_position = convert_json_to_transform(definition['trigger_position'])
+        scenario_configuration = ScenarioConfiguration()
+        scenario_configuration.other_actors = list_of_actor_conf_instances
+        scenario_configuration.trigger_points = [egoactor_trigger_position]
+        scenario_configuration.subtype = definition['scenario_type']
+        scenario_configuration.ego_vehicles = [ActorConfigurationData('vehicle.lincoln.mkz2017',
+                                                                      ego_vehicle.get_transform(),
+                                                                      'hero')]
+        route_var_name = "ScenarioRouteNumber{}".format(scenario_number)
+        scenario_configuration.route_var_name = route_var_name
+
+        try:
+            scenario_instance = scenario_class(world, [ego_vehicle], scenario_configuration,
+                                               criteria_enable=False, timeout=timeout)
+        except Exception as e:      # pylint: disable=broad-except
+            if debug_mode:
+                traceback.print_exc()
+            print("Skipping scenario '{}' due to setup error: {}".format(definition['name'], e))
+            return None
+
+        return scenario_instance
+
     def _get_actors_instances(self, list_of_antagonist_actors):
         """
         Get the full list of actor instances.
@@ -444,8 +478,9 @@ class RouteScenario(BasicScenario):
         for i, scenario in enumerate(self.list_scenarios):
             if scenario.scenario.behavior is not None:
                 route_var_name = scenario.config.route_var_name
+                # Each scenario is skipped on its own while it waits for dormant trigger conditions
                 if route_var_name is not None:
-                    scenario_behaviors.append(scenario.scenario.behavior)
+                    scenario_behaviors.append(DormancyGate(scenario.scenario.behavior))
                     blackboard_list.append([scenario.config.route_var_name,
                                             scenario.config.trigger_points[0].location])
                 else:
@@ -453,12 +488,28 @@ class RouteScenario(BasicScenario):
                     oneshot_idiom = oneshot_behavior(name,
                                                      behaviour=scenario.scenario.behavior,
                                                      name=name)
-                    scenario_behaviors.append(oneshot_idiom)
+                    scenario_behaviors.append(DormancyGate(oneshot_idiom))
+
+        if self._lazy_distance is not None:
+            for i, definition in enumerate(self.sampled_scenarios_definitions):
+                route_var_name = "ScenarioRouteNumber{}".format(i)
+                trigger_location = convert_json_to_transform(definition['trigger_position']).location
+                blackboard_list.append([route_var_name, trigger_location])
+                py_trees.blackboard.Blackboard().set(route_var_name, False)
+
+                lazy_scenario = LazyScenario(self.ego_vehicles[0],
+                                             self.compiled_route,
+                                             trigger_location,
+                                             self._lazy_distance,
+                                             functools.partial(self._build_lazy_scenario, i, definition),
+                                             name="{} - {}".format(i, definition['name']))
+                self._lazy_scenarios.append(lazy_scenario)
+                scenario_behaviors.append(lazy_scenario)
 
         # Add behavior that manages the scenarios trigger conditions
         scenario_triggerer = ScenarioTriggerer(
             self.ego_vehicles[0],
-            self.route,
+            self.compiled_route,
             blackboard_list,
             scenario_trigger_distance,
             repeat_scenarios=False
@@ -471,13 +522,28 @@ class RouteScenario(BasicScenario):
 
         return behavior
 
+    def _build_lazy_scenario(self, scenario_number, definition):
+        """
+        Build a scenario of the route once the ego vehicle approaches it, keeping its trigger
+        blackboard variable if the ScenarioTriggerer already set it
+        """
+        route_var_name = "ScenarioRouteNumber{}".format(scenario_number)
+        blackboard = py_trees.blackboard.Blackboard()
+        triggered = blackboard.get(route_var_name)
+
+        scenario = self._build_scenario_instance(CarlaDataProvider.get_world(), self.ego_vehicles[0],
+                                                 scenario_number, definition, self.timeout, self._debug_mode)
+        if triggered:
+            blackboard.set(route_var_name, triggered)
+        return scenario
+
     def _create_test_criteria(self):
         """
         """
 
         criteria = []
 
-        route = convert_transform_to_location(self.route)
+        route = self.compiled_route
 
         collision_criterion = CollisionTest(self.ego_vehicles[0], terminate_on_failure=False)
 
@@ -509,6 +575,14 @@ class RouteScenario(BasicScenario):
 
         return criteria
 
+    def remove_all_actors(self):
+        """
+        Remove all actors, including those of the scenarios built while driving
+        """
+        for lazy_scenario in self._lazy_scenarios:
+            lazy_scenario.remove_scenario()
+        super(RouteScenario, self).remove_all_actors()
+
     def __del__(self):
         """
         Remove all actors upon deletion
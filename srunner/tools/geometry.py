@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides vectorized 2D geometry tests, checking one element
+against many others at once with NumPy
+"""
+
+import numpy as np
+
+
+def _orientation(origins, ends, points):
+    """
+    Cross product of (ends - origins) and (points - origins). Its sign tells on which
+    side of the line origins-ends each point is (0 if they are collinear)
+    """
+    return ((ends[..., 0] - origins[..., 0]) * (points[..., 1] - origins[..., 1]) -
+            (ends[..., 1] - origins[..., 1]) * (points[..., 0] - origins[..., 0]))
+
+
+def _on_segment(origins, ends, points):
+    """
+    Check if collinear points lie within the bounding box of the segments origins-ends
+    """
+    return ((np.minimum(origins[..., 0], ends[..., 0]) <= points[..., 0]) &
+            (points[..., 0] <= np.maximum(origins[..., 0], ends[..., 0])) &
+            (np.minimum(origins[..., 1], ends[..., 1]) <= points[..., 1]) &
+            (points[..., 1] <= np.maximum(origins[..., 1], ends[..., 1])))
+
+
+def segments_intersect(segment, segments):
+    """
+    Check if a 2D segment intersects (or touches) each one of a set of 2D segments
+    :param segment: array-like ((x1, y1), (x2, y2))
+    :param segments: array-like of shape (N, 2, 2)
+    :return: boolean array of shape (N,)
+    """
+    segment = np.asarray(segment, dtype=np.float64)
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    a_1, a_2 = segment[0], segment[1]
+    b_1, b_2 = segments[:, 0], segments[:, 1]
+
+    d_1 = _orientation(b_1, b_2, a_1)
+    d_2 = _orientation(b_1, b_2, a_2)
+    d_3 = _orientation(a_1, a_2, b_1)
+    d_4 = _orientation(a_1, a_2, b_2)
+
+    crossing = (((d_1 > 0) & (d_2 < 0)) | ((d_1 < 0) & (d_2 > 0))) & \
+               (((d_3 > 0) & (d_4 < 0)) | ((d_3 < 0) & (d_4 > 0)))
+
+    # Touching or collinear segments
+    crossing |= (d_1 == 0) & _on_segment(b_1, b_2, a_1)
+    crossing |= (d_2 == 0) & _on_segment(b_1, b_2, a_2)
+    crossing |= (d_3 == 0) & _on_segment(a_1, a_2, b_1)
+    crossing |= (d_4 == 0) & _on_segment(a_1, a_2, b_2)
+
+    return crossing
+
+
+def points_inside_box(points, center, extent):
+    """
+    Check if 2D points are strictly inside an axis-aligned box
+    :param points: array-like of shape (N, 2) (further coordinates are ignored)
+    :param center: array-like (x, y)
+    :param extent: array-like (x, y), half size of the box
+    :return: boolean array of shape (N,)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if not points.size:
+        return np.zeros(0, dtype=bool)
+    offsets = np.abs(points[:, :2] - np.asarray(center, dtype=np.float64)[:2])
+    extent = np.asarray(extent, dtype=np.float64)[:2]
+    return (offsets[:, 0] < extent[0]) & (offsets[:, 1] < extent[1])
+
+
+def oriented_boxes_overlap(box, boxes):
+    """
+    Separating axis test between a 2D oriented box and each one of a set of 2D oriented boxes.
+    Boxes that only touch are not considered overlapping
+    :param box: array-like (center x, center y, half length, half width, yaw [deg])
+    :param boxes: array-like of shape (N, 5), with the same layout
+    :return: boolean array of shape (N,)
+    """
+    box = np.asarray(box, dtype=np.float64)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+
+    yaw = np.radians(box[4])
+    axes = np.array([[np.cos(yaw), np.sin(yaw)], [-np.sin(yaw), np.cos(yaw)]])
+    yaws = np.radians(boxes[:, 4])
+    other_axes = np.stack((np.stack((np.cos(yaws), np.sin(yaws)), axis=1),
+                           np.stack((-np.sin(yaws), np.cos(yaws)), axis=1)), axis=1)  # (N, 2, 2)
+
+    offsets = boxes[:, :2] - box[:2]
+    overlap = np.ones(len(boxes), dtype=bool)
+
+    # Candidate separating axes: the two axes of the box and the two axes of each other box
+    candidate_axes = [np.broadcast_to(axes[0], offsets.shape), np.broadcast_to(axes[1], offsets.shape),
+                      other_axes[:, 0], other_axes[:, 1]]
+    for axis in candidate_axes:
+        radius = (box[2] * np.abs(np.einsum('j,ij->i', axes[0], axis)) +
+                  box[3] * np.abs(np.einsum('j,ij->i', axes[1], axis)))
+        other_radius = (boxes[:, 2] * np.abs(np.einsum('ij,ij->i', other_axes[:, 0], axis)) +
+                        boxes[:, 3] * np.abs(np.einsum('ij,ij->i', other_axes[:, 1], axis)))
+        overlap &= np.abs(np.einsum('ij,ij->i', offsets, axis)) < radius + other_radius
+
+    return overlap
@@ -119,16 +119,18 @@ class OpenScenarioParser(object):
 
         # Given by id
         if name.startswith("id="):
-            tl_id = name[3:]
-            for carla_tl in CarlaDataProvider.get_world().get_actors().filter('traffic.traffic_light'):
-                if carla_tl.id == tl_id:
-                    traffic_light = carla_tl
-                    break
+            try:
+                tl_id = int(name[3:])
+            except ValueError:
+                raise AttributeError("Unknown  traffic light {}: invalid id '{}'".format(name, name[3:]))
+            carla_tl = CarlaDataProvider.get_world_actor_by_id(tl_id)
+            if carla_tl is not None and carla_tl.type_id == 'traffic.traffic_light':
+                traffic_light = carla_tl
         # Given by position
         elif name.startswith("pos="):
             tl_pos = name[4:]
             pos = tl_pos.split(",")
-            for carla_tl in CarlaDataProvider.get_world().get_actors().filter('traffic.traffic_light'):
+            for carla_tl in CarlaDataProvider.get_world_actors('traffic.traffic_light'):
                 carla_tl_location = carla_tl.get_transform().location
                 distance = carla_tl_location.distance(carla.Location(float(pos[0]),
                                                                      float(pos[1]),
@@ -485,11 +487,10 @@ class OpenScenarioParser(object):
                         obj_actor = actor
                         actor_transform = actor.transform
             else:
-                for actor in CarlaDataProvider.get_world().get_actors():
-                    if 'role_name' in actor.attributes and actor.attributes['role_name'] == obj:
-                        obj_actor = actor
-                        actor_transform = obj_actor.get_transform()
-                        break
+                for actor in CarlaDataProvider.get_world_actors_by_role_name(obj):
+                    obj_actor = actor
+                    actor_transform = obj_actor.get_transform()
+                    break
 
             if obj_actor is None or actor_transform is None:
                 raise AttributeError("Object '{}' provided as position reference is not known".format(obj))
@@ -10,14 +10,118 @@ Module to manipulate the routes, by making then more or less dense (Up to a cert
 It also contains functions to convert the CARLA world location do GPS coordinates.
 """
 
+import hashlib
 import math
+import os
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import numpy as np
+
+import carla
 
 from agents.navigation.global_route_planner import GlobalRoutePlanner
 from agents.navigation.global_route_planner_dao import GlobalRoutePlannerDAO
 
 from agents.navigation.local_planner import RoadOption
 
+from srunner.scenariomanager.map_cache import clear_map_hash, get_map_hash, load_cached_array, save_cached_array
+
+# Global route planners, shared by the whole process, keyed by (map name, OpenDRIVE hash, hop resolution)
+GLOBAL_ROUTE_PLANNER_CACHE_SIZE = 4
+_global_route_planners = OrderedDict()
+
+
+def get_global_route_planner(carla_map, hop_resolution):
+    """
+    Get a set up GlobalRoutePlanner for the given map and hop resolution.
+    Planners are cached for the whole process, evicting the least recently used one
+    once more than GLOBAL_ROUTE_PLANNER_CACHE_SIZE are stored
+    :param carla_map: the CARLA map
+    :param hop_resolution: the resolution of the planner
+    :return: the GlobalRoutePlanner
+    """
+    key = (carla_map.name, get_map_hash(carla_map), float(hop_resolution))
+
+    grp = _global_route_planners.pop(key, None)
+    if grp is None:
+        dao = GlobalRoutePlannerDAO(carla_map, hop_resolution)
+        grp = GlobalRoutePlanner(dao)
+        grp.setup()
+        while len(_global_route_planners) >= GLOBAL_ROUTE_PLANNER_CACHE_SIZE:
+            _global_route_planners.popitem(last=False)
+    _global_route_planners[key] = grp
+
+    return grp
+
+
+def clear_global_route_planners():
+    """
+    Remove all cached global route planners
+    """
+    _global_route_planners.clear()
+    clear_map_hash()
+
+
+# Directory of the on-disk cache of interpolated routes. An empty value disables the cache
+ROUTE_CACHE_DIR = os.getenv('SCENARIO_RUNNER_ROUTE_CACHE',
+                            os.path.join(os.path.expanduser('~'), '.cache', 'scenario_runner', 'routes'))
+
+_ROUTE_DTYPE = np.dtype([('location', np.float64, 3), ('rotation', np.float64, 3), ('option', np.int8)])
+
+
+def _get_route_cache_path(carla_map, waypoints_trajectory, hop_resolution):
+    """
+    Get the cache file of a route, identified by town, OpenDRIVE hash, keypoints and hop resolution
+    :return: path of the file, None if the cache is disabled
+    """
+    if not ROUTE_CACHE_DIR:
+        return None
+
+    town = os.path.basename(carla_map.name)
+    key = [town, get_map_hash(carla_map), repr(float(hop_resolution))]
+    for location in waypoints_trajectory:
+        key.append("{:.3f},{:.3f},{:.3f}".format(location.x, location.y, location.z))
+    digest = hashlib.md5(';'.join(key).encode('utf-8')).hexdigest()
+
+    return os.path.join(ROUTE_CACHE_DIR, "{}_{}.npy".format(town, digest))
+
+
+def _load_cached_route(path):
+    """
+    Load a route from the cache, using memory mapping
+    :return: list of (carla.Transform, RoadOption), None if it is not cached
+    """
+    data = load_cached_array(path, _ROUTE_DTYPE)
+    if data is None:
+        return None
+
+    route = []
+    for location, rotation, option in zip(data['location'].tolist(), data['rotation'].tolist(),
+                                          data['option'].tolist()):
+        transform = carla.Transform(carla.Location(*location),
+                                    carla.Rotation(pitch=rotation[0], yaw=rotation[1], roll=rotation[2]))
+        route.append((transform, RoadOption(option)))
+
+    return route
+
+
+def _save_cached_route(path, route):
+    """
+    Store a route in the cache. The file is written to a temporary location and then renamed,
+    so that parallel runs never read a partially written route
+    """
+    if path is None:
+        return
+
+    data = np.zeros(len(route), dtype=_ROUTE_DTYPE)
+    for i, (transform, option) in enumerate(route):
+        data[i] = ((transform.location.x, transform.location.y, transform.location.z),
+                   (transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll),
+                   option.value)
+
+    save_cached_array(path, data)
+
 
 def _location_to_gps(lat_ref, lon_ref, location):
     """
@@ -137,20 +241,28 @@ def interpolate_trajectory(world, waypoints_trajectory, hop_resolution=1.0):
     :param waypoints_trajectory: the current coarse trajectory
     :param hop_resolution: is the resolution, how dense is the provided trajectory going to be made
     :return: the full interpolated route both in GPS coordinates and also in its original form.
+
+    The dense route is stored at the route cache (ROUTE_CACHE_DIR), so that further calls with the same
+    town, OpenDRIVE file, keypoints and hop resolution skip the planning.
     """
 
-    dao = GlobalRoutePlannerDAO(world.get_map(), hop_resolution)
-    grp = GlobalRoutePlanner(dao)
-    grp.setup()
-    # Obtain route plan
-    route = []
-    for i in range(len(waypoints_trajectory) - 1):   # Goes until the one before the last.
+    carla_map = world.get_map()
+    cache_path = _get_route_cache_path(carla_map, waypoints_trajectory, hop_resolution)
+    route = _load_cached_route(cache_path)
+
+    if route is None:
+        grp = get_global_route_planner(carla_map, hop_resolution)
+        # Obtain route plan
+        route = []
+        for i in range(len(waypoints_trajectory) - 1):   # Goes until the one before the last.
+
+            waypoint = waypoints_trajectory[i]
+            waypoint_next = waypoints_trajectory[i + 1]
+            interpolated_trace = grp.trace_route(waypoint, waypoint_next)
+            for wp_tuple in interpolated_trace:
+                route.append((wp_tuple[0].transform, wp_tuple[1]))
 
-        waypoint = waypoints_trajectory[i]
-        waypoint_next = waypoints_trajectory[i + 1]
-        interpolated_trace = grp.trace_route(waypoint, waypoint_next)
-        for wp_tuple in interpolated_trace:
-            route.append((wp_tuple[0].transform, wp_tuple[1]))
+        _save_cached_route(cache_path, route)
 
     # Increase the route position to avoid fails
 
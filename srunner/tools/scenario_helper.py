@@ -20,102 +20,91 @@ from agents.tools.misc import vector
 from agents.navigation.local_planner import RoadOption
 
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.compiled_route import compile_route
+from srunner.tools.geometry import oriented_boxes_overlap
+
+
+def _get_neighbor_lane_locations(starting_wp):
+    """
+    Get the locations and waypoints of the lanes next to the given waypoint with the same direction,
+    going outwards to the left and to the right
+    """
+    sides = []
+    for get_next_lane in (lambda wp: wp.get_left_lane(), lambda wp: wp.get_right_lane()):
+        lanes = []
+        wp = get_next_lane(starting_wp)
+        while wp is not None and np.sign(starting_wp.lane_id) == np.sign(wp.lane_id):
+            location = wp.transform.location
+            lanes.append((location.x, location.y, wp))
+            wp = get_next_lane(wp)
+        sides.append(lanes)
+    return sides
 
 
 def get_distance_along_route(route, target_location):
     """
-    Calculate the distance of the given location along the route
+    Calculate the distance of the given location along the route.
+    The route can be given as a list of (location, RoadOption) or as a CompiledRoute,
+    which avoids compiling it again
 
     Note: If the location is not along the route, the route length will be returned
     """
 
     wmap = CarlaDataProvider.get_map()
-    covered_distance = 0
-    prev_position = None
-    found = False
+    route = compile_route(route, wmap)
+    distances = route.planar_accumulated_distances
+    if len(route) < 2:
+        return 0, False
 
     # Don't use the input location, use the corresponding wp as location
-    target_location_from_wp = wmap.get_waypoint(target_location).transform.location
-
-    for position, _ in route:
+    target_wp = wmap.get_waypoint(target_location)
+    target = target_wp.transform.location
 
-        location = target_location_from_wp
+    # Squared distances of every route interval and of the location to the start of every interval
+    prev_positions = route.positions[:-1, :2]
+    interval_lengths_squared = np.sum(np.diff(route.positions[:, :2], axis=0) ** 2, axis=1)
+    distances_squared = (target.x - prev_positions[:, 0]) ** 2 + (target.y - prev_positions[:, 1]) ** 2
 
-        # Don't perform any calculations for the first route point
-        if not prev_position:
-            prev_position = position
-            continue
+    # Only the intervals close enough to the location have to be checked, in order
+    candidates = np.flatnonzero(distances_squared < np.maximum(400, interval_lengths_squared))
+    neighbor_lanes = None
 
-        # Calculate distance between previous and current route point
-        interval_length_squared = ((prev_position.x - position.x) ** 2) + ((prev_position.y - position.y) ** 2)
-        distance_squared = ((location.x - prev_position.x) ** 2) + ((location.y - prev_position.y) ** 2)
+    for interval in candidates.tolist():
+        prev_x, prev_y = prev_positions[interval]
+        interval_length_squared = interval_lengths_squared[interval]
+        distance_squared = distances_squared[interval]
+        wp = target_wp
 
         # Close to the current position? Stop calculation
         if distance_squared < 0.01:
-            break
+            return float(distances[interval]), False
 
         if distance_squared < 400 and not distance_squared < interval_length_squared:
             # Check if a neighbor lane is closer to the route
             # Do this only in a close distance to correct route interval, otherwise the computation load is too high
-            starting_wp = wmap.get_waypoint(location)
-            wp = starting_wp.get_left_lane()
-            while wp is not None:
-                new_location = wp.transform.location
-                new_distance_squared = ((new_location.x - prev_position.x) ** 2) + (
-                    (new_location.y - prev_position.y) ** 2)
-
-                if np.sign(starting_wp.lane_id) != np.sign(wp.lane_id):
-                    break
-
-                if new_distance_squared < distance_squared:
-                    distance_squared = new_distance_squared
-                    location = new_location
-                else:
-                    break
-
-                wp = wp.get_left_lane()
-
-            wp = starting_wp.get_right_lane()
-            while wp is not None:
-                new_location = wp.transform.location
-                new_distance_squared = ((new_location.x - prev_position.x) ** 2) + (
-                    (new_location.y - prev_position.y) ** 2)
-
-                if np.sign(starting_wp.lane_id) != np.sign(wp.lane_id):
-                    break
-
-                if new_distance_squared < distance_squared:
+            if neighbor_lanes is None:
+                neighbor_lanes = _get_neighbor_lane_locations(target_wp)
+            for lanes in neighbor_lanes:
+                for x, y, lane_wp in lanes:
+                    new_distance_squared = (x - prev_x) ** 2 + (y - prev_y) ** 2
+                    if not new_distance_squared < distance_squared:
+                        break
                     distance_squared = new_distance_squared
-                    location = new_location
-                else:
-                    break
-
-                wp = wp.get_right_lane()
+                    wp = lane_wp
 
         if distance_squared < interval_length_squared:
             # The location could be inside the current route interval, if route/lane ids match
             # Note: This assumes a sufficiently small route interval
             # An alternative is to compare orientations, however, this also does not work for
             # long route intervals
+            prev_wp = route.get_waypoint(interval)
+            curr_wp = route.get_waypoint(interval + 1)
+            if (wp.road_id in (prev_wp.road_id, curr_wp.road_id) and
+                    np.sign(wp.lane_id) in (np.sign(prev_wp.lane_id), np.sign(curr_wp.lane_id))):
+                # The location is within the current route interval
+                return float(distances[interval]) + math.sqrt(distance_squared), True
 
-            curr_wp = wmap.get_waypoint(position)
-            prev_wp = wmap.get_waypoint(prev_position)
-            wp = wmap.get_waypoint(location)
-
-            if prev_wp and curr_wp and wp:
-                if wp.road_id == prev_wp.road_id or wp.road_id == curr_wp.road_id:
-                    # Roads match, now compare the sign of the lane ids
-                    if (np.sign(wp.lane_id) == np.sign(prev_wp.lane_id) or
-                            np.sign(wp.lane_id) == np.sign(curr_wp.lane_id)):
-                        # The location is within the current route interval
-                        covered_distance += math.sqrt(distance_squared)
-                        found = True
-                        break
-
-        covered_distance += math.sqrt(interval_length_squared)
-        prev_position = position
-
-    return covered_distance, found
+    return float(distances[-1]), False
 
 
 def get_crossing_point(actor):
@@ -469,8 +458,6 @@ def detect_lane_obstacle(actor, extension_factor=3, margin=1.02):
     """
     This function identifies if an obstacle is present in front of the reference actor
     """
-    world = CarlaDataProvider.get_world()
-    world_actors = world.get_actors().filter('vehicle.*')
     actor_bbox = actor.bounding_box
     actor_transform = actor.get_transform()
     actor_location = actor_transform.location
@@ -481,24 +468,20 @@ def detect_lane_obstacle(actor, extension_factor=3, margin=1.02):
     actor_location = actor_location + carla.Location(actor_vector[0], actor_vector[1])
     actor_yaw = actor_transform.rotation.yaw
 
-    is_hazard = False
-    for adversary in world_actors:
-        if adversary.id != actor.id and \
-                actor_transform.location.distance(adversary.get_location()) < 50:
-            adversary_bbox = adversary.bounding_box
-            adversary_transform = adversary.get_transform()
-            adversary_loc = adversary_transform.location
-            adversary_yaw = adversary_transform.rotation.yaw
-            overlap_adversary = RotatedRectangle(
-                adversary_loc.x, adversary_loc.y,
-                2 * margin * adversary_bbox.extent.x, 2 * margin * adversary_bbox.extent.y, adversary_yaw)
-            overlap_actor = RotatedRectangle(
-                actor_location.x, actor_location.y,
-                2 * margin * actor_bbox.extent.x * extension_factor, 2 * margin * actor_bbox.extent.y, actor_yaw)
-            overlap_area = overlap_adversary.intersection(overlap_actor).area
-            if overlap_area > 0:
-                is_hazard = True
-                break
+    # Poses and bounding boxes of the nearby vehicles, taken from the buffered state of all actors
+    buffer = CarlaDataProvider.get_state_buffer()
+    rows = CarlaDataProvider.query_radius_rows(actor_transform.location, 50, 'vehicle.*')
+    rows = rows[buffer.ids[rows] != actor.id]
+    if not len(rows):
+        return False
+
+    adversary_boxes = np.column_stack((buffer.positions[rows, 0], buffer.positions[rows, 1],
+                                       margin * buffer.extents[rows, 0], margin * buffer.extents[rows, 1],
+                                       buffer.yaws[rows]))
+    actor_box = (actor_location.x, actor_location.y,
+                 margin * actor_bbox.extent.x * extension_factor, margin * actor_bbox.extent.y, actor_yaw)
+
+    is_hazard = bool(np.any(oriented_boxes_overlap(actor_box, adversary_boxes)))
 
     return is_hazard
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Micro-benchmark of the per-tick cost of the CarlaDataProvider
+
+It emulates a scenario in which every registered actor is queried once per tick
+(as done by criteria and trigger conditions) and reports how the cost of one tick
+grows with the amount of registered actors. The legacy lookup, which scanned all
+registered actors for each query, is measured as a reference.
+
+No CARLA server is needed, the actors are replaced by local stand-ins. If the CARLA
+Python API is not installed either, the few carla types used are replaced as well.
+
+Usage:
+    python srunner/utilities/benchmark_data_provider.py [--actors 10 50 100 200 400] [--ticks 200]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+import types
+
+
+def create_carla_stand_in():
+    """
+    Create a local stand-in of the carla module, with the types needed by the benchmark
+    and at import time of the CarlaDataProvider
+    """
+    module = types.ModuleType('carla')
+
+    class Vector3D(object):
+
+        """
+        Local stand-in of carla.Vector3D and carla.Location
+        """
+
+        def __init__(self, x=0.0, y=0.0, z=0.0):
+            self.x = x  # pylint: disable=invalid-name
+            self.y = y  # pylint: disable=invalid-name
+            self.z = z  # pylint: disable=invalid-name
+
+    class Transform(object):
+
+        """
+        Local stand-in of carla.Transform
+        """
+
+        def __init__(self, location=None, rotation=None):
+            self.location = location if location is not None else Vector3D()
+            self.rotation = rotation
+
+    class BoundingBox(object):
+
+        """
+        Local stand-in of carla.BoundingBox
+        """
+
+        def __init__(self, location, extent):
+            self.location = location
+            self.extent = extent
+
+    class LaneType(object):
+
+        """
+        Local stand-in of carla.LaneType
+        """
+
+        Driving = 2
+
+    module.Vector3D = Vector3D
+    module.Location = Vector3D
+    module.Transform = Transform
+    module.BoundingBox = BoundingBox
+    module.LaneType = LaneType
+    module.command = types.ModuleType('carla.command')
+    module.command.DestroyActor = None
+    return module
+
+
+try:
+    import carla
+except ImportError:
+    carla = create_carla_stand_in()
+    sys.modules['carla'] = carla
+
+sys.path.insert(0, os.getenv('SCENARIO_RUNNER_ROOT', "./"))
+
+from srunner.scenariomanager.carla_data_provider import CarlaDataProvider  # pylint: disable=wrong-import-position
+
+
+class BenchmarkActor(object):
+
+    """
+    Local stand-in of a carla.Actor, answering all queries without a server
+    """
+
+    def __init__(self, actor_id):
+        self.id = actor_id  # pylint: disable=invalid-name
+        self.type_id = 'vehicle.benchmark'
+        self.attributes = {'role_name': 'background'}
+        self.is_alive = True
+        self.bounding_box = carla.BoundingBox(carla.Location(), carla.Vector3D(2.0, 1.0, 0.75))
+        self._transform = carla.Transform(carla.Location(x=float(actor_id), y=0.0, z=0.0))
+
+    def get_velocity(self):
+        """Constant velocity"""
+        return carla.Vector3D(3.0, 4.0, 0.0)
+
+    def get_location(self):
+        """Constant location"""
+        return self._transform.location
+
+    def get_transform(self):
+        """Constant transform"""
+        return self._transform
+
+
+class BenchmarkWorld(object):
+
+    """
+    Local stand-in of a carla.World, only used to silence the missing world warning
+    """
+
+
+def legacy_lookup(actor, actor_map):
+    """
+    Lookup of the previous CarlaDataProvider implementation: linear scan over all keys
+    """
+    for key in actor_map:
+        if key.id == actor.id:
+            return actor_map[key]
+    return None
+
+
+def run_tick(actors):
+    """
+    One tick: update the buffers and query velocity, location and transform of all actors
+    """
+    CarlaDataProvider.on_carla_tick()
+    for actor in actors:
+        CarlaDataProvider.get_velocity(actor)
+        CarlaDataProvider.get_location(actor)
+        CarlaDataProvider.get_transform(actor)
+
+
+def run_legacy_tick(actors, actor_map):
+    """
+    One tick of the legacy implementation: fetch velocity, location and transform of all actors,
+    then query them using the legacy lookups
+    """
+    for actor in actors:
+        actor_map[actor] = (actor.get_velocity(), actor.get_location(), actor.get_transform())
+    for actor in actors:
+        legacy_lookup(actor, actor_map)
+        legacy_lookup(actor, actor_map)
+        legacy_lookup(actor, actor_map)
+
+
+def main():
+    """
+    Run the benchmark for every requested amount of actors and print the results
+    """
+    parser = argparse.ArgumentParser(description="CarlaDataProvider tick cost benchmark")
+    parser.add_argument('--actors', type=int, nargs='+', default=[10, 50, 100, 200, 400],
+                        help='Amounts of registered actors to be benchmarked')
+    parser.add_argument('--ticks', type=int, default=200, help='Amount of ticks per measurement')
+    args = parser.parse_args()
+
+    results = []
+    for amount in args.actors:
+        CarlaDataProvider.cleanup()
+        CarlaDataProvider._world = BenchmarkWorld()  # pylint: disable=protected-access
+
+        actors = [BenchmarkActor(i) for i in range(amount)]
+        CarlaDataProvider.register_actors(actors)
+        actor_map = {actor: None for actor in actors}
+
+        indexed = timeit.timeit(lambda: run_tick(actors), number=args.ticks) / args.ticks
+        legacy = timeit.timeit(lambda: run_legacy_tick(actors, actor_map), number=args.ticks) / args.ticks
+
+        results.append([amount, round(1000 * indexed, 3), round(1000 * legacy, 3), round(legacy / indexed, 1)])
+
+    CarlaDataProvider.cleanup()
+
+    row_format = "{:>8} {:>18} {:>22} {:>8}"
+    print(row_format.format("Actors", "Indexed [ms/tick]", "Linear scan [ms/tick]", "Speedup"))
+    for row in results:
+        print(row_format.format(*row))
+
+
+if __name__ == '__main__':
+    main()
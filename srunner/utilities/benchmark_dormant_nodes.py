@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Micro-benchmark of the dormant node scheduling of the scenario tree
+
+It drives a set of actors towards the trigger conditions of a scenario tree, some of them being
+teleported on the way, and ticks the tree once with and once without the scheduler. It verifies
+that every condition succeeds at exactly the same ticks in both runs, and reports the tick cost
+of the tree and the amount of skipped nodes. Two trees are measured:
+
+- scenarios: a gated sequence of InTriggerDistanceToLocation, InTriggerDistanceToVehicle and
+  InTimeToArrivalToLocation per actor
+- route: an ego vehicle driving along a route, laid out as the tree of a RouteScenario. The
+  ScenarioTriggerer, a gated sequence per scenario of the route (WaitForBlackboardVariable,
+  InTriggerDistanceToVehicle, InTriggerDistanceToLocation and the reset of the variable) and Idle
+
+No CARLA server is needed, the actors are replaced by local stand-ins. If the CARLA Python API
+(carla and agents modules) is not installed either, it is replaced by a stand-in as well.
+
+Usage:
+    python srunner/utilities/benchmark_dormant_nodes.py [--scenarios 10 50 200] [--ticks 2000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import os
+import sys
+import timeit
+import types
+
+import py_trees
+
+# Modules of the CARLA Python API imported by the trigger conditions
+AGENTS_MODULES = ['agents', 'agents.navigation', 'agents.navigation.basic_agent', 'agents.navigation.local_planner',
+                  'agents.navigation.global_route_planner', 'agents.navigation.global_route_planner_dao',
+                  'agents.tools', 'agents.tools.misc']
+
+
+class StandInModule(types.ModuleType):
+
+    """
+    Local stand-in of a module of the CARLA Python API. Every attribute not defined explicitly
+    is a nested stand-in, enough for the module level code of the scenario atomics
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        attribute = StandInModule('{}.{}'.format(self.__name__, name))
+        setattr(self, name, attribute)
+        return attribute
+
+
+def create_carla_stand_in():
+    """
+    Create a local stand-in of the carla module, with the types used by the benchmark
+    """
+    module = StandInModule('carla')
+
+    class Vector3D(object):
+
+        """
+        Local stand-in of carla.Vector3D and carla.Location
+        """
+
+        def __init__(self, x=0.0, y=0.0, z=0.0):
+            if isinstance(x, Vector3D):
+                x, y, z = x.x, x.y, x.z
+            self.x = x  # pylint: disable=invalid-name
+            self.y = y  # pylint: disable=invalid-name
+            self.z = z  # pylint: disable=invalid-name
+
+        def distance(self, other):
+            """Euclidean distance to the other location"""
+            return ((self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2) ** 0.5
+
+    class Rotation(object):
+
+        """
+        Local stand-in of carla.Rotation
+        """
+
+        def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+            self.pitch = pitch
+            self.yaw = yaw
+            self.roll = roll
+
+    class Transform(object):
+
+        """
+        Local stand-in of carla.Transform
+        """
+
+        def __init__(self, location=None, rotation=None):
+            self.location = location if location is not None else Vector3D()
+            self.rotation = rotation if rotation is not None else Rotation()
+
+    module.Vector3D = Vector3D
+    module.Location = Vector3D
+    module.Rotation = Rotation
+    module.Transform = Transform
+    return module
+
+
+def install_stand_ins():
+    """
+    Replace the carla and agents modules by local stand-ins if they cannot be imported
+    """
+    try:
+        import carla  # pylint: disable=unused-import,redefined-outer-name
+    except ImportError:
+        sys.modules['carla'] = create_carla_stand_in()
+
+    try:
+        if isinstance(sys.modules['carla'], StandInModule):
+            raise ImportError("The agents modules need the CARLA Python API")
+        for name in AGENTS_MODULES:
+            importlib.import_module(name)
+    except ImportError:
+        for name in AGENTS_MODULES:
+            sys.modules[name] = StandInModule(name)
+
+
+install_stand_ins()
+sys.path.insert(0, os.getenv('SCENARIO_RUNNER_ROOT', "./"))
+
+# pylint: disable=wrong-import-position
+import carla
+
+from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.scenarioatomics.atomic_behaviors import Idle, ScenarioTriggerer
+from srunner.scenariomanager.scenarioatomics.atomic_trigger_conditions import (InTriggerDistanceToLocation,
+                                                                               InTriggerDistanceToVehicle,
+                                                                               InTimeToArrivalToLocation,
+                                                                               WaitForBlackboardVariable)
+from srunner.scenariomanager.scheduler import DormancyGate, DormantNodeScheduler
+# pylint: enable=wrong-import-position
+
+DELTA_SECONDS = 0.05
+EGO_SPEED = 10.0
+TELEPORT_TICK = 500
+TELEPORT_DISTANCE = 400.0
+
+
+class BenchmarkActor(object):
+
+    """
+    Local stand-in of a carla.Actor driving along the x axis with a constant speed
+    """
+
+    def __init__(self, actor_id, x, y, speed):
+        self.id = actor_id  # pylint: disable=invalid-name
+        self.type_id = 'vehicle.benchmark'
+        self.attributes = {'role_name': 'background'}
+        self.is_alive = True
+        self.speed = speed
+        self._transform = carla.Transform(carla.Location(x=x, y=y, z=0.0))
+
+    def move(self, distance):
+        """Move the actor along the x axis"""
+        self._transform = carla.Transform(carla.Location(x=self._transform.location.x + distance,
+                                                         y=self._transform.location.y, z=0.0))
+
+    def get_velocity(self):
+        """Constant velocity"""
+        return carla.Vector3D(self.speed, 0.0, 0.0)
+
+    def get_location(self):
+        """Current location"""
+        return self._transform.location
+
+    def get_transform(self):
+        """Current transform"""
+        return self._transform
+
+    def get_acceleration(self):
+        """No acceleration"""
+        return carla.Vector3D(0.0, 0.0, 0.0)
+
+    def get_angular_velocity(self):
+        """No angular velocity"""
+        return carla.Vector3D(0.0, 0.0, 0.0)
+
+
+class BenchmarkSnapshot(object):
+
+    """
+    Local stand-in of a carla.WorldSnapshot, the actors are their own actor snapshots
+    """
+
+    def __init__(self, frame, actors):
+        self.frame = frame
+        self._actors = {actor.id: actor for actor in actors}
+
+    def __iter__(self):
+        return iter(self._actors.values())
+
+    def find(self, actor_id):
+        """Snapshot of the given actor id"""
+        return self._actors.get(actor_id)
+
+
+class BenchmarkWorld(object):
+
+    """
+    Local stand-in of a carla.World, providing the snapshots of the benchmark actors
+    """
+
+    def __init__(self):
+        self.actors = []
+        self.frame = 0
+
+    def get_snapshot(self):
+        """Snapshot of the current frame"""
+        return BenchmarkSnapshot(self.frame, self.actors)
+
+    def get_actors(self, actor_ids=None):
+        """The benchmark actors with the given ids"""
+        return [actor for actor in self.actors if actor_ids is None or actor.id in actor_ids]
+
+    def get_map(self):  # pylint: disable=no-self-use
+        """There is no map, routes are compiled without it"""
+        return None
+
+
+def create_tree(amount, _):
+    """
+    Create the actors and a scenario tree with one gated sequence of trigger conditions per actor.
+    returns the actors, the actors to be teleported, the conditions and the tree
+    """
+    actors = []
+    conditions = []
+    tree = py_trees.composites.Parallel(policy=py_trees.common.ParallelPolicy.SUCCESS_ON_ALL)
+    for i in range(amount):
+        y = 4.0 * i
+        actor = BenchmarkActor(2 * i, -600.0 - 37.0 * (i % 13), y, 5.0 + (i % 7) * 4.0)
+        reference = BenchmarkActor(2 * i + 1, 150.0, y, 0.0)
+        actors.extend([actor, reference])
+        CarlaDataProvider.register_actors([actor, reference])
+
+        sequence_conditions = [
+            InTriggerDistanceToLocation(actor, carla.Location(x=0.0, y=y, z=0.0), 10.0),
+            InTriggerDistanceToVehicle(reference, actor, 5.0),
+            InTimeToArrivalToLocation(actor, 2.0, carla.Location(x=400.0, y=y, z=0.0))]
+        sequence = py_trees.composites.Sequence()
+        sequence.add_children(sequence_conditions)
+        tree.add_child(DormancyGate(sequence))
+        conditions.extend(sequence_conditions)
+    return actors, actors[::10], conditions, tree
+
+
+def create_route_tree(amount, ticks):
+    """
+    Create an ego vehicle, a route with one scenario (and its adversary) per trigger point and
+    a tree laid out as the one of a RouteScenario.
+    returns the actors, the actors to be teleported, the conditions and the tree
+    """
+    length = EGO_SPEED * DELTA_SECONDS * ticks
+    route = [(carla.Location(x=float(x), y=0.0, z=0.0), None) for x in range(int(length) + 1)]
+    ego = BenchmarkActor(0, 0.0, 0.0, EGO_SPEED)
+    actors = [ego]
+    conditions = []
+    blackboard_list = []
+
+    subbehavior = py_trees.composites.Parallel(policy=py_trees.common.ParallelPolicy.SUCCESS_ON_ALL)
+    scenario_behaviors = []
+    for i in range(amount):
+        x = length * (i + 0.5) / amount
+        adversary = BenchmarkActor(i + 1, x + 40.0, 3.5, 0.0)
+        actors.append(adversary)
+        route_var_name = "BenchmarkRouteNumber{}".format(i)
+        blackboard_list.append([route_var_name, carla.Location(x=x, y=0.0, z=0.0)])
+
+        scenario_conditions = [
+            WaitForBlackboardVariable(route_var_name, True, var_init_value=False),
+            InTriggerDistanceToVehicle(adversary, ego, 10.0),
+            InTriggerDistanceToLocation(ego, carla.Location(x=x + 60.0, y=0.0, z=0.0), 5.0)]
+        sequence = py_trees.composites.Sequence()
+        sequence.add_children(scenario_conditions)
+        sequence.add_child(py_trees.blackboard.SetBlackboardVariable(variable_name=route_var_name,
+                                                                     variable_value=False))
+        scenario_behaviors.append(DormancyGate(sequence))
+        conditions.extend(scenario_conditions)
+    CarlaDataProvider.register_actors(actors)
+
+    subbehavior.add_child(ScenarioTriggerer(ego, route, blackboard_list, 1.5))
+    subbehavior.add_children(scenario_behaviors)
+    subbehavior.add_child(Idle())
+    return actors, actors[1::10], conditions, DormancyGate(subbehavior)
+
+
+def run(create, amount, ticks, scheduled):
+    """
+    Drive the actors and tick the tree built by create, returning the ticks at which each condition
+    succeeded, the time spent ticking the tree and the amount of skipped nodes
+    """
+    CarlaDataProvider.cleanup()
+    world = BenchmarkWorld()
+    CarlaDataProvider._world = world  # pylint: disable=protected-access
+    DormantNodeScheduler.set_enabled(scheduled)
+    DormantNodeScheduler.reset()
+
+    actors, teleported, conditions, tree = create(amount, ticks)
+    world.actors = actors
+    successes = [[] for _ in conditions]
+    tree_time = 0.0
+    for tick in range(ticks):
+        for actor in actors:
+            actor.move(actor.speed * DELTA_SECONDS)
+        if tick == TELEPORT_TICK:
+            for actor in teleported:
+                actor.move(TELEPORT_DISTANCE)
+        world.frame = tick
+        CarlaDataProvider.on_carla_tick(world.get_snapshot())
+        CarlaDataProvider.get_state_buffer()
+
+        DormantNodeScheduler.start_tick()
+        start = timeit.default_timer()
+        tree.tick_once()
+        tree_time += timeit.default_timer() - start
+
+        for i, condition in enumerate(conditions):
+            if condition.status == py_trees.common.Status.SUCCESS:
+                successes[i].append(tick)
+
+    skipped = DormantNodeScheduler.get_skipped_nodes(total=True)
+    DormantNodeScheduler.set_enabled(True)
+    CarlaDataProvider.cleanup()
+    return successes, tree_time, skipped
+
+
+def main():
+    """
+    Run the benchmark for every tree and requested amount of scenarios and print the results
+    """
+    parser = argparse.ArgumentParser(description="Dormant node scheduling benchmark")
+    parser.add_argument('--scenarios', type=int, nargs='+', default=[10, 50, 200],
+                        help='Amounts of gated scenarios to be benchmarked')
+    parser.add_argument('--ticks', type=int, default=2000, help='Amount of ticks per measurement')
+    args = parser.parse_args()
+
+    row_format = "{:>10} {:>10} {:>14} {:>18} {:>8} {:>16} {:>11}"
+    print(row_format.format("Tree", "Scenarios", "Plain [ms/tick]", "Scheduled [ms/tick]", "Speedup",
+                            "Skipped [/tick]", "Mismatches"))
+    for tree_name, create in (("scenarios", create_tree), ("route", create_route_tree)):
+        for amount in args.scenarios:
+            plain_successes, plain_time, _ = run(create, amount, args.ticks, False)
+            successes, scheduled_time, skipped = run(create, amount, args.ticks, True)
+
+            mismatches = sum(1 for plain, scheduled in zip(plain_successes, successes) if plain != scheduled)
+            print(row_format.format(tree_name, amount, round(1000 * plain_time / args.ticks, 3),
+                                    round(1000 * scheduled_time / args.ticks, 3),
+                                    round(plain_time / scheduled_time, 1),
+                                    round(float(skipped) / args.ticks, 1), mismatches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Check that the scenarios of a route behave the same when they are built lazily
+
+It runs a route twice with ScenarioRunner in synchronous mode, once building all its scenarios at start
+and once with --lazyScenarioDistance, and compares the results of all criteria (without the actor ids,
+which differ between both runs) and the game time of the runs. The wall time of each run, route
+loading included, is reported as well.
+
+A CARLA server is needed. The script exits with 1 if the results differ.
+
+Usage:
+    python srunner/utilities/benchmark_lazy_scenarios.py
+        --route srunner/data/routes_devtest.xml srunner/data/all_towns_traffic_scenarios1_3_4.json 0
+        --agent srunner/autoagents/npc_agent.py [--lazyScenarioDistance 50] [--host 127.0.0.1] [--port 2000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+SCENARIO_RUNNER_ROOT = os.getenv('SCENARIO_RUNNER_ROOT', "./")
+
+
+def run_route(args, output_dir, lazy_distance):
+    """
+    Run the route with ScenarioRunner, returning its JSON results and the wall time of the run
+    """
+    command = [sys.executable, os.path.join(SCENARIO_RUNNER_ROOT, 'scenario_runner.py'),
+               '--route'] + args.route + [
+                   '--agent', args.agent, '--host', args.host, '--port', args.port,
+                   '--trafficManagerPort', args.trafficManagerPort, '--trafficManagerSeed', '0',
+                   '--sync', '--json', '--outputDir', output_dir]
+    if lazy_distance is not None:
+        command += ['--lazyScenarioDistance', str(lazy_distance)]
+
+    start = timeit.default_timer()
+    subprocess.call(command)
+    wall_time = timeit.default_timer() - start
+
+    results = []
+    for json_file in sorted(glob.glob(os.path.join(output_dir, "*.json"))):
+        with open(json_file) as fp:
+            results.append(json.load(fp))
+    return results, wall_time
+
+
+def get_outcomes(results):
+    """
+    returns the (scenario, criterion, actual value, success) of all criteria of the results
+    """
+    outcomes = []
+    for result in results:
+        for criterion in result['criteria']:
+            outcomes.append((result['scenario'], criterion['name'], str(criterion['actual']), criterion['success']))
+    return outcomes
+
+
+def main():
+    """
+    Run the route with and without lazy scenarios and compare the results
+    """
+    parser = argparse.ArgumentParser(description="Lazy scenarios check")
+    parser.add_argument('--route', nargs='+', type=str, required=True,
+                        help='Route to be checked (input: (route_file,scenario_file,[route id]))')
+    parser.add_argument('--agent', required=True, help='Agent driving the ego vehicle')
+    parser.add_argument('--lazyScenarioDistance', type=float, default=50.0, metavar='METERS',
+                        help='Distance used by the lazy run')
+    parser.add_argument('--host', default='127.0.0.1', help='IP of the host server (default: localhost)')
+    parser.add_argument('--port', default='2000', help='TCP port to listen to (default: 2000)')
+    parser.add_argument('--trafficManagerPort', default='8000',
+                        help='Port to use for the TrafficManager (default: 8000)')
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix='lazy_scenarios_')
+    try:
+        runs = []
+        for name, lazy_distance in (("Plain", None), ("Lazy", args.lazyScenarioDistance)):
+            run_dir = os.path.join(output_dir, name)
+            os.makedirs(run_dir)
+            results, wall_time = run_route(args, run_dir, lazy_distance)
+            runs.append((name, results, wall_time))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    row_format = "{:>6} {:>14} {:>10} {:>9}"
+    print(row_format.format("Run", "Wall time [s]", "Criteria", "Success"))
+    for name, results, wall_time in runs:
+        print(row_format.format(name, round(wall_time, 1), len(get_outcomes(results)),
+                                str(bool(results) and all(result['success'] for result in results))))
+
+    plain_outcomes = get_outcomes(runs[0][1])
+    lazy_outcomes = get_outcomes(runs[1][1])
+    mismatches = [(plain, lazy) for plain, lazy in zip(plain_outcomes, lazy_outcomes) if plain != lazy]
+    if not plain_outcomes or len(plain_outcomes) != len(lazy_outcomes):
+        print("The runs gave {} and {} criteria results".format(len(plain_outcomes), len(lazy_outcomes)))
+        sys.exit(1)
+    for plain, lazy in mismatches:
+        print("Mismatch: {} (plain) != {} (lazy)".format(plain, lazy))
+    if mismatches:
+        sys.exit(1)
+    print("Both runs gave the same results")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 Intel Corporation
+#
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Micro-benchmark of the stop line crossing test of the RunningRedLightTest
+
+It checks the tail segment of a vehicle against the stop lines of a set of traffic lights,
+once with the previous implementation (two shapely LineStrings intersected per stop line)
+and once with the batched NumPy kernel, verifying that both give the same answers.
+
+No CARLA server is needed.
+
+Usage:
+    python srunner/utilities/benchmark_stop_lines.py [--lights 100 300 600] [--repetitions 200]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+import shapely.geometry
+from tabulate import tabulate
+
+sys.path.insert(0, os.getenv('SCENARIO_RUNNER_ROOT', "./"))
+
+from srunner.tools.geometry import segments_intersect  # pylint: disable=wrong-import-position
+
+STOP_LINES_PER_LIGHT = 2
+
+
+def random_segments(rng, amount, area=200.0, length=4.0):
+    """
+    Create random 2D segments of the given length inside a square area
+    """
+    origins = rng.uniform(-area / 2.0, area / 2.0, size=(amount, 2))
+    angles = rng.uniform(0.0, 2.0 * np.pi, size=amount)
+    ends = origins + length * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    return np.stack((origins, ends), axis=1)
+
+
+def shapely_crossings(segment, stop_lines):
+    """
+    Previous implementation: one pair of LineStrings per stop line
+    """
+    results = []
+    for stop_line in stop_lines:
+        line1 = shapely.geometry.LineString([tuple(segment[0]), tuple(segment[1])])
+        line2 = shapely.geometry.LineString([tuple(stop_line[0]), tuple(stop_line[1])])
+        results.append(not line1.intersection(line2).is_empty)
+    return results
+
+
+def main():
+    """
+    Run the benchmark for every requested amount of traffic lights and print the results
+    """
+    parser = argparse.ArgumentParser(description="Stop line crossing test benchmark")
+    parser.add_argument('--lights', type=int, nargs='+', default=[100, 300, 600],
+                        help='Amounts of traffic lights to be benchmarked')
+    parser.add_argument('--repetitions', type=int, default=200, help='Amount of tests per measurement')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(2000)
+
+    results = []
+    for amount in args.lights:
+        stop_lines = random_segments(rng, amount * STOP_LINES_PER_LIGHT)
+        segments = random_segments(rng, args.repetitions, length=6.0)
+        stop_line_tuples = stop_lines.tolist()
+
+        mismatches = 0
+        for segment in segments:
+            expected = shapely_crossings(segment, stop_line_tuples)
+            mismatches += int(np.count_nonzero(segments_intersect(segment, stop_lines) != np.array(expected)))
+
+        legacy = timeit.timeit(lambda: [shapely_crossings(segment, stop_line_tuples) for segment in segments],
+                               number=1) / args.repetitions
+        batched = timeit.timeit(lambda: [segments_intersect(segment, stop_line_tuples) for segment in segments],
+                                number=1) / args.repetitions
+
+        results.append([amount, len(stop_lines), round(1000 * legacy, 3), round(1000 * batched, 3),
+                        round(legacy / batched, 1), mismatches])
+
+    print(tabulate(results, headers=["Lights", "Stop lines", "Shapely [ms/test]", "NumPy [ms/test]",
+                                     "Speedup", "Mismatches"]))
+
+
+if __name__ == '__main__':
+    main()